@@ -0,0 +1,106 @@
+# answer_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """Lower-case the query and collapse whitespace and trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip(" ?!.")
+
+
+def document_set_hash(document_ids):
+    """Order-independent hash of a bot's document set (None means all documents)."""
+    if document_ids is None:
+        return "all"
+    joined = "\n".join(sorted(set(document_ids)))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()[:32]
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of generated answers with a TTL.
+    
+    Entries are keyed by (normalized English query, document set hash, target
+    language, model settings). Entries are also indexed by document set so that
+    a change to a bot's documents drops every answer built from the old set.
+    """
+    def __init__(self, max_entries=None, ttl_seconds=None):
+        self.max_entries = max_entries or int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1000))
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 3600))
+        self._entries = OrderedDict()
+        self._by_document_set = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(query, document_ids, language, model_settings):
+        settings = json.dumps(model_settings or {}, sort_keys=True)
+        return (normalize_query(query), document_set_hash(document_ids), language, settings)
+
+    def get(self, key):
+        """Return the cached answer dict or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at >= self.ttl_seconds:
+                self._remove(key)
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return dict(value)
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (dict(value), time.monotonic())
+            self._by_document_set.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def invalidate_document_set(self, document_ids):
+        """Drop every answer generated from exactly this document set."""
+        set_hash = document_set_hash(document_ids)
+        with self._lock:
+            keys = list(self._by_document_set.get(set_hash, ()))
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidations"] += len(keys)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached answers for document set {set_hash}")
+
+    def on_bot_documents_changed(self, bot_id, old_document_ids, new_document_ids):
+        """BotModel document listener: answers for the bot's previous document set are stale."""
+        self.invalidate_document_set(old_document_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_document_set.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_document_set.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_document_set[key[1]]
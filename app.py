@@ -1,14 +1,31 @@
 # app.py
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 import os
+import json
+import time
+import uuid
+import shutil
+import zipfile
 import logging
 from werkzeug.utils import secure_filename
-from document_processor import process_document
-from chatbot_core import generate_rag_response
-from translation_core import SimpleTranslator  # Import the SimpleTranslator
+from werkzeug.exceptions import RequestEntityTooLarge
+from document_processor import (
+    process_uploaded_document, upload_stream, upload_document, delete_blob, extract_uploaded_document,
+    build_search_passages, index_passage_batch, ensure_search_index_exists, get_indexing_stats,
+    sync_bot_documents
+)
+from chatbot_core import (
+    generate_rag_response, generate_rag_response_stream, chat_session_id, answer_cache, conversation_store,
+    translator
+)
+from azure_clients import clients
 from flask_cors import CORS  # Import CORS
 from bot_model import BotModel  # Import the BotModel we just created
+from ingestion_jobs import IngestionJobQueue, JobStore, QueueFullError
+from bulk_ingestion import BulkIngestionPipeline
+from document_registry import DocumentRegistry, hash_file
+from streaming_form import StreamingMultipartForm, MalformedFormError
 
 # Configure logging
 logging.basicConfig(
@@ -24,25 +41,57 @@ logger.info("Flask application initialized with CORS enabled")
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max
 app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'docx', 'txt'}
+app.config['BULK_MAX_FILES'] = int(os.environ.get('BULK_MAX_FILES', 1000))
+app.config['BULK_MAX_ZIP_BYTES'] = int(os.environ.get('BULK_MAX_ZIP_BYTES', 500 * 1024 * 1024))
+# Request body limit of /upload/bulk, which replaces MAX_CONTENT_LENGTH for that route only
+app.config['BULK_MAX_CONTENT_LENGTH'] = int(os.environ.get('BULK_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+# How long an upload job waits for the same content still being ingested by another upload
+app.config['UPLOAD_CLAIM_WAIT_SECONDS'] = float(os.environ.get('UPLOAD_CLAIM_WAIT_SECONDS', 600))
+app.config['UPLOAD_CLAIM_POLL_SECONDS'] = float(os.environ.get('UPLOAD_CLAIM_POLL_SECONDS', 2))
 
 # Create uploads directory
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 logger.debug(f"Upload directory created/verified: {app.config['UPLOAD_FOLDER']}")
 
-# Initialize the translator and bot manager
-try:
-    translator = SimpleTranslator()
-    logger.info("Translator initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize translator: {str(e)}", exc_info=True)
-    translator = None
-
-try:
-    bot_manager = BotModel()
+# Service clients are created on first use, so importing the app (e.g. to
+# preload it before forking workers) never touches the network
+def _create_bot_manager():
+    manager = BotModel()
+    manager.add_document_listener(answer_cache.on_bot_documents_changed)
+    manager.add_document_listener(sync_bot_documents)
     logger.info("Bot manager initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize bot manager: {str(e)}", exc_info=True)
-    bot_manager = None
+    return manager
+
+def _create_document_registry():
+    registry = DocumentRegistry()
+    logger.info("Document registry initialized successfully")
+    return registry
+
+clients.register("bot_manager", _create_bot_manager)
+clients.register("document_registry", _create_document_registry)
+
+# Each is falsy while its service cannot be reached
+bot_manager = clients.proxy("bot_manager")
+document_registry = clients.proxy("document_registry")
+
+# Job status shared by the worker processes, so /jobs/<id> works on any of them
+job_store = JobStore()
+ingestion_queue = IngestionJobQueue(process_uploaded_document, job_store=job_store)
+
+def _attach_documents(bot_id, document_ids):
+    return bot_manager.add_documents_to_bot(bot_id, document_ids) if bot_manager else None
+
+bulk_pipeline = BulkIngestionPipeline(
+    upload_func=upload_document,
+    extract_func=extract_uploaded_document,
+    build_passages_func=build_search_passages,
+    index_batch_func=index_passage_batch,
+    ensure_index_func=ensure_search_index_exists,
+    attach_func=_attach_documents,
+    registry=document_registry,
+    hash_func=hash_file,
+    job_store=job_store
+)
 
 @app.route('/')
 def index():
@@ -50,22 +99,110 @@ def index():
     logger.debug("Rendering index page")
     return render_template('index.html')
 
+def _associate_with_bot(bot_id, document_id):
+    """Attach a document to a bot, returning {'bot': ...} or None."""
+    if not bot_id:
+        return None
+    try:
+        bot_result = bot_manager.add_document_to_bot(bot_id, document_id)
+        if bot_result:
+            logger.info(f"Document {document_id} associated with bot {bot_id}")
+            return {'bot': bot_result}
+        logger.warning(f"Could not associate document with bot {bot_id} - bot not found")
+    except Exception as e:
+        logger.error(f"Error associating document with bot: {str(e)}")
+        # Continue even if bot association fails
+    return None
+
+def _deduplicated_response(existing, bot_id):
+    """Response body for an upload whose content is already ingested."""
+    response = {
+        'success': True,
+        'deduplicated': True,
+        'document_id': existing['document_id'],
+        'status': existing['status']
+    }
+    association = _associate_with_bot(bot_id, existing['document_id'])
+    if association:
+        response['bot'] = association['bot']
+    return response
+
+def _replay_idempotent(key):
+    """Stored response of an earlier request with the same idempotency key, or None."""
+    if key and document_registry:
+        stored = document_registry.get_idempotent_response(key)
+        if stored:
+            logger.info(f"Replaying response for idempotency key {key}")
+            return jsonify(stored['body']), stored['status_code']
+    return None
+
+def _idempotent(key, response, status_code):
+    """Record the response for an idempotency key, preferring one stored concurrently."""
+    if key and document_registry:
+        try:
+            stored = document_registry.save_idempotent_response(key, {'body': response, 'status_code': status_code})
+            if stored:
+                return jsonify(stored['body']), stored['status_code']
+        except Exception as e:
+            logger.warning(f"Could not store idempotency key: {str(e)}")
+    return jsonify(response), status_code
+
 @app.route('/upload', methods=['POST'])
 def upload():
     """
     Handle document uploads and processing.
+    
+    Content that was already ingested (same SHA-256) is not analyzed or indexed
+    again: its existing document ID is attached to the bot and returned. Content
+    another upload is still ingesting gets a job that attaches it once that
+    ingestion succeeds, or ingests this copy if it fails. Clients that know the
+    hash up front can send it as X-Content-SHA256 with a bot_id field before the
+    file to skip the upload of content that bot already has. Retries carrying
+    the same Idempotency-Key get the original response.
     """
     try:
-        if 'file' not in request.files:
+        idempotency_key = request.headers.get('Idempotency-Key')
+        replay = _replay_idempotent(idempotency_key)
+        if replay:
+            return replay
+        
+        # Parse the body as it arrives instead of through request.files, which
+        # would spool the whole file to memory or disk before this view runs
+        form = StreamingMultipartForm(request.stream, request.content_type,
+                                      max_form_memory_size=app.config.get('MAX_FORM_MEMORY_SIZE'))
+        has_file = form.open_file('file')
+        if not idempotency_key and form.fields.get('idempotency_key'):
+            idempotency_key = form.fields['idempotency_key']
+            replay = _replay_idempotent(idempotency_key)
+            if replay:
+                return replay
+        
+        # The declared hash is not verified, so it only short-circuits uploads of
+        # content the bot already has; anything else is hashed on the server below
+        declared_hash = request.headers.get('X-Content-SHA256', '').lower()
+        known_bot_id = form.fields.get('bot_id')
+        if declared_hash and known_bot_id and document_registry:
+            existing = document_registry.get_by_hash(declared_hash)
+            bot = bot_manager.get_bot(known_bot_id) if existing else None
+            if bot and existing['document_id'] in bot.get('document_ids', []):
+                logger.info(f"Skipping upload of content {declared_hash[:12]} already attached to bot {known_bot_id}")
+                form.finish()
+                return _idempotent(idempotency_key, {
+                    'success': True,
+                    'deduplicated': True,
+                    'document_id': existing['document_id'],
+                    'status': existing['status'],
+                    'bot': bot
+                }, 200)
+        
+        if not has_file:
             return jsonify({'success': False, 'error': 'No file provided'}), 400
         
-        file = request.files['file']
-        
-        if file.filename == '':
+        if form.filename == '':
             return jsonify({'success': False, 'error': 'No file selected'}), 400
         
         # Extract the filename and extension
-        filename = secure_filename(file.filename)
+        filename = secure_filename(form.filename)
         file_extension = os.path.splitext(filename)[1].lower()[1:]
         
         if file_extension not in app.config['ALLOWED_EXTENSIONS']:
@@ -74,44 +211,240 @@ def upload():
                 'error': f'Unsupported file type. Allowed types: {", ".join(app.config["ALLOWED_EXTENSIONS"])}'
             }), 400
         
-        # Save the file
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        logger.info(f"File {filename} saved to {filepath}")
-        
-        # Process the document
-        process_result = process_document(filepath)
+        if ingestion_queue.is_full():
+            return jsonify({'success': False, 'error': 'Ingestion queue is full, please retry later'}), 503
         
-        if not process_result.get('success'):
-            # Log error and attempt to cleanup
-            logger.error(f"Document processing failed: {process_result.get('error')}")
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            return jsonify(process_result), 500
+        # Stream the request body straight into Blob Storage
+        upload_started = time.monotonic()
+        upload_result = upload_stream(form, f"{uuid.uuid4()}-{filename}")
+        upload_duration = time.monotonic() - upload_started
+        if not upload_result.get('success'):
+            return jsonify({
+                'success': False,
+                'error': f"Document upload failed: {upload_result.get('error')}",
+                'stage': 'upload'
+            }), 500
+        
+        # Fields sent after the file, such as bot_id from the web client
+        form.finish()
+        bot_id = form.fields.get('bot_id')
+        if not idempotency_key and form.fields.get('idempotency_key'):
+            idempotency_key = form.fields['idempotency_key']
+            replay = _replay_idempotent(idempotency_key)
+            if replay:
+                delete_blob(upload_result['blob_name'])
+                return replay
+        logger.info(f"File {filename} streamed to blob {upload_result['blob_name']} in {upload_duration:.2f}s")
+        
+        # Reuse the existing document if this content was already ingested
+        content_hash = upload_result['content_hash']
+        document_id = str(uuid.uuid4())
+        claim_metadata = {'file_name': filename, 'blob_name': upload_result['blob_name'], 'size': upload_result['size']}
+        existing = None
+        if document_registry:
+            try:
+                existing = document_registry.claim(content_hash, document_id, claim_metadata)
+            except Exception as e:
+                logger.warning(f"Document registry unavailable, ingesting without deduplication: {str(e)}")
+                content_hash = None
+        if existing and existing['status'] != 'processing':
+            delete_blob(upload_result['blob_name'])
+            return _idempotent(idempotency_key, _deduplicated_response(existing, bot_id), 200)
+        
+        # Content another upload is still ingesting is only attached once that
+        # ingestion succeeds; if it fails, this job takes over the claim and
+        # ingests its own copy under the same document ID
+        claim_owned = {'value': existing is None}
+        if existing:
+            document_id = existing['document_id']
+        
+        def ingest_after_claim(source, on_stage=None):
+            try:
+                settled = document_registry.wait_for_claim(
+                    content_hash, document_id, claim_metadata,
+                    app.config['UPLOAD_CLAIM_WAIT_SECONDS'], app.config['UPLOAD_CLAIM_POLL_SECONDS'])
+            except TimeoutError as e:
+                delete_blob(source['blob_name'])
+                return {'success': False, 'error': str(e), 'stage': 'upload'}
+            if settled is not None:
+                delete_blob(source['blob_name'])
+                return {'success': True, 'deduplicated': True, 'document_id': settled['document_id']}
+            claim_owned['value'] = True
+            return process_uploaded_document(source, on_stage=on_stage)
+        
+        def associate_with_bot(process_result):
+            # Check if this document should be associated with a bot
+            return _associate_with_bot(bot_id, process_result.get('document_id'))
+        
+        def settle_claim(process_result):
+            if not (document_registry and content_hash and claim_owned['value']):
+                return
+            # Only fully indexed content may be deduplicated into by later uploads
+            if process_result and process_result.get('success') and not process_result.get('failed_keys'):
+                document_registry.mark_ready(content_hash, {'chunk_count': process_result.get('chunk_count', 0)})
+            else:
+                # Let a later upload of the same content retry ingestion
+                document_registry.release(content_hash)
+        
+        # Queue the document for extraction and indexing
+        try:
+            job = ingestion_queue.submit(
+                dict(upload_result, document_id=document_id, bot_ids=[bot_id] if bot_id else []),
+                on_success=associate_with_bot,
+                cleanup=settle_claim,
+                metadata={'file_name': filename, 'bot_id': bot_id, 'blob_name': upload_result['blob_name']},
+                completed_stages={'upload': upload_duration},
+                process_func=ingest_after_claim if existing else None
+            )
+        except QueueFullError as e:
+            logger.warning(f"Ingestion queue filled up after upload of blob {upload_result['blob_name']}")
+            if document_registry and content_hash and claim_owned['value']:
+                document_registry.release(content_hash)
+            return jsonify({'success': False, 'error': str(e)}), 503
+        
+        return _idempotent(idempotency_key, {
+            'success': True,
+            'deduplicated': existing is not None,
+            'document_id': document_id,
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/jobs/{job['id']}"
+        }, 202)
+        
+    except MalformedFormError as e:
+        return jsonify({'success': False, 'error': f'Invalid form data: {str(e)}'}), 400
+    except RequestEntityTooLarge:
+        return jsonify({
+            'success': False,
+            'error': f"Request is too large, maximum is {app.config['MAX_CONTENT_LENGTH']} bytes"
+        }), 413
+    except Exception as e:
+        logger.error(f"Error in upload endpoint: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _extract_zip(zip_path, target_dir):
+    """Extract supported documents from a zip archive into target_dir and return their paths."""
+    paths = []
+    total_size = 0
+    with zipfile.ZipFile(zip_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            name = secure_filename(os.path.basename(member.filename))
+            extension = os.path.splitext(name)[1].lower()[1:]
+            if not name or extension not in app.config['ALLOWED_EXTENSIONS']:
+                logger.debug(f"Skipping unsupported zip member: {member.filename}")
+                continue
+            total_size += member.file_size
+            if total_size > app.config['BULK_MAX_ZIP_BYTES']:
+                raise ValueError("Zip archive is too large when extracted")
+            if len(paths) >= app.config['BULK_MAX_FILES']:
+                raise ValueError(f"Too many files, maximum is {app.config['BULK_MAX_FILES']}")
+            path = os.path.join(target_dir, f"{len(paths)}-{name}")
+            with archive.open(member) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target)
+            paths.append(path)
+    return paths
+
+@app.route('/upload/bulk', methods=['POST'])
+def upload_bulk():
+    """
+    Ingest many documents for a bot at once.
+    
+    Accepts several 'files' parts, each either a supported document or a zip
+    archive of documents. Returns a batch id whose progress is reported by /jobs/<id>.
+    """
+    # Set before the form is parsed; werkzeug spools the parts to temporary files
+    request.max_content_length = app.config['BULK_MAX_CONTENT_LENGTH']
+    batch_dir = None
+    try:
+        files = [file for file in request.files.getlist('files') if file and file.filename]
+        if not files:
+            return jsonify({'success': False, 'error': 'No files provided'}), 400
+        
+        batch_dir = os.path.join(app.config['UPLOAD_FOLDER'], f"bulk-{uuid.uuid4()}")
+        os.makedirs(batch_dir)
+        
+        file_paths = []
+        for file in files:
+            filename = secure_filename(file.filename)
+            file_extension = os.path.splitext(filename)[1].lower()[1:]
+            path = os.path.join(batch_dir, f"{len(file_paths)}-{filename}")
+            
+            if file_extension == 'zip':
+                file.save(path)
+                file_paths.extend(_extract_zip(path, batch_dir))
+                os.remove(path)
+            elif file_extension in app.config['ALLOWED_EXTENSIONS']:
+                file.save(path)
+                file_paths.append(path)
+            else:
+                logger.warning(f"Skipping unsupported file in bulk upload: {filename}")
+            
+            if len(file_paths) > app.config['BULK_MAX_FILES']:
+                raise ValueError(f"Too many files, maximum is {app.config['BULK_MAX_FILES']}")
         
-        document_id = process_result.get('document_id')
+        if not file_paths:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            return jsonify({
+                'success': False,
+                'error': f'No supported files. Allowed types: {", ".join(app.config["ALLOWED_EXTENSIONS"])}'
+            }), 400
         
-        # Check if this document should be associated with a bot
-        bot_id = request.form.get('bot_id')
-        if bot_id:
+        def cleanup(path):
+            if os.path.exists(path):
+                os.remove(path)
+            # Remove the batch directory once its last file is gone
             try:
-                bot_result = bot_manager.add_document_to_bot(bot_id, document_id)
-                if bot_result:
-                    process_result['bot'] = bot_result
-                    logger.info(f"Document {document_id} associated with bot {bot_id}")
-                else:
-                    logger.warning(f"Could not associate document with bot {bot_id} - bot not found")
-            except Exception as e:
-                logger.error(f"Error associating document with bot: {str(e)}")
-                # Continue even if bot association fails
+                os.rmdir(batch_dir)
+            except OSError:
+                pass
         
-        # Return the processing result
-        return jsonify(process_result)
+        batch = bulk_pipeline.submit(file_paths, bot_id=request.form.get('bot_id'), cleanup=cleanup)
+        logger.info(f"Bulk upload of {len(file_paths)} files queued as batch {batch['id']}")
         
+        return jsonify({
+            'success': True,
+            'job_id': batch['id'],
+            'file_count': len(file_paths),
+            'status': batch['status'],
+            'status_url': f"/jobs/{batch['id']}"
+        }), 202
+        
+    except (ValueError, zipfile.BadZipFile) as e:
+        if batch_dir:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RequestEntityTooLarge:
+        if batch_dir:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        return jsonify({
+            'success': False,
+            'error': f"Request is too large, maximum is {app.config['BULK_MAX_CONTENT_LENGTH']} bytes"
+        }), 413
     except Exception as e:
-        logger.error(f"Error in upload endpoint: {str(e)}", exc_info=True)
+        if batch_dir:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+        logger.error(f"Error in bulk upload endpoint: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the status of an ingestion job or bulk ingestion batch"""
+    job = ingestion_queue.get_job(job_id) or bulk_pipeline.get_batch(job_id)
+    if job is None:
+        # Started by another worker process
+        job = job_store.get(job_id)
+    if job:
+        return jsonify({"success": True, "job": job})
+    else:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+
+@app.route('/indexing/stats', methods=['GET'])
+def indexing_stats():
+    """Search upload throughput per index"""
+    return jsonify({"success": True, "indexes": get_indexing_stats()})
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Process a chat message and generate a response."""
@@ -122,8 +455,11 @@ def chat():
         query = data.get('query')
         bot_id = data.get('bot_id', None)
         language = data.get('language', 'en')  # Get the selected language, default to English
+        # A conversation starts with start_session; follow-up questions send back its session_id
+        session_id = chat_session_id(data)
+        reuse_context = data.get('reuse_context')
         
-        logger.debug(f"Chat query: '{query}', bot_id: {bot_id}, language: {language}")
+        logger.debug(f"Chat query: '{query}', bot_id: {bot_id}, language: {language}, session_id: {session_id}")
         
         if not query:
             return jsonify({'success': False, 'error': 'Query is required'}), 400
@@ -137,7 +473,9 @@ def chat():
                 logger.debug(f"Using document_ids for bot {bot_id}: {document_ids}")
         
         # Generate response based on the provided query
-        result = generate_rag_response(query, document_ids=document_ids, language=language)
+        result = generate_rag_response(query, document_ids=document_ids, language=language,
+                                     bot_id=bot_id if document_ids is not None else None,
+                                     session_id=session_id, reuse_context=reuse_context)
         
         answer = result.get("answer", "")
         sources = result.get("sources", [])
@@ -148,12 +486,68 @@ def chat():
             'success': True, 
             'answer': answer,
             'sources': sources,
-            'bot_id': bot_id
+            'bot_id': bot_id,
+            'session_id': session_id,
+            'cached': result.get('cached', False),
+            'context_reused': result.get('context_reused', False)
         })
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _format_sse(event):
+    """Serialize a chat stream event as a Server-Sent Events frame."""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Process a chat message and stream the response as Server-Sent Events."""
+    logger.info("Streaming chat request received")
+    
+    try:
+        data = request.json
+        query = data.get('query')
+        bot_id = data.get('bot_id', None)
+        language = data.get('language', 'en')
+        session_id = chat_session_id(data)
+        reuse_context = data.get('reuse_context')
+        
+        logger.debug(f"Streaming chat query: '{query}', bot_id: {bot_id}, language: {language}, session_id: {session_id}")
+        
+        if not query:
+            return jsonify({'success': False, 'error': 'Query is required'}), 400
+        
+        document_ids = None
+        if bot_id:
+            bot = bot_manager.get_bot(bot_id)
+            if bot:
+                document_ids = bot.get('document_ids', [])
+                logger.debug(f"Using document_ids for bot {bot_id}: {document_ids}")
+        
+        def generate():
+            for event in generate_rag_response_stream(query, document_ids=document_ids, language=language,
+                                                      bot_id=bot_id if document_ids is not None else None,
+                                                      session_id=session_id, reuse_context=reuse_context):
+                if event['type'] == 'done':
+                    event['bot_id'] = bot_id
+                    event['session_id'] = session_id
+                yield _format_sse(event)
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        logger.error(f"Error in streaming chat endpoint: {str(e)}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/chat/sessions/<session_id>', methods=['DELETE'])
+def delete_chat_session(session_id):
+    """Forget the history of a chat session"""
+    conversation_store.delete(session_id)
+    return jsonify({'success': True, 'session_id': session_id})
+
 @app.route('/translate', methods=['POST'])
 def translate():
     """Handle translation requests."""
@@ -178,6 +572,19 @@ def translate():
             logger.error(error_msg)
             return jsonify({'success': False, 'error': error_msg}), 503
         
+        # Translate an array of texts in as few requests as possible
+        if isinstance(text, list):
+            if not all(isinstance(item, str) for item in text):
+                return jsonify({'success': False, 'error': 'Text must be a string or a list of strings'}), 400
+            translated_texts = translator.translate_batch(text, target_language, source_language)
+            logger.info(f"Batch translation of {len(text)} texts completed")
+            return jsonify({
+                'success': True,
+                'translated_texts': translated_texts,
+                'source_language': source_language or 'auto',
+                'target_language': target_language
+            })
+        
         # Call the translator service
         result = translator.translate_text(text, source_language, target_language)
         
@@ -221,14 +628,10 @@ def translate_error_messages():
             'emptyResponse': "I don't have an answer for that."
         }
         
-        # Translate each message
-        translated_messages = {}
-        for key, message in messages.items():
-            result = translator.translate_text(message, 'en', language)
-            if result.get('success'):
-                translated_messages[key] = result.get('translated_text', message)
-            else:
-                translated_messages[key] = message
+        # Translate all messages in a single batch
+        keys = list(messages.keys())
+        translations = translator.translate_batch([messages[key] for key in keys], language, 'en')
+        translated_messages = dict(zip(keys, translations))
         
         return jsonify({
             'success': True,
@@ -243,10 +646,38 @@ def translate_error_messages():
 
 @app.route('/api/bots', methods=['GET'])
 def get_bots():
-    """Get all bots"""
+    """
+    Get bots.
+    
+    Without query parameters every bot is returned. 'limit' and 'continuation_token'
+    page through the list, 'fields' is a comma-separated projection and 'summary=true'
+    returns only id, name and description.
+    """
     try:
-        bots = bot_manager.get_all_bots()
-        return jsonify({"success": True, "bots": bots})
+        limit = request.args.get('limit', type=int)
+        continuation_token = request.args.get('continuation_token')
+        fields = request.args.get('fields')
+        summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+        
+        if limit is None and not continuation_token and not fields and not summary:
+            bots = bot_manager.get_all_bots()
+            return jsonify({"success": True, "bots": bots})
+        
+        if summary:
+            fields = BotModel.SUMMARY_FIELDS
+        elif fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+        
+        try:
+            page = bot_manager.list_bots(limit=limit, continuation_token=continuation_token, fields=fields)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        
+        return jsonify({
+            "success": True,
+            "bots": page["bots"],
+            "continuation_token": page["continuation_token"]
+        })
     except Exception as e:
         logger.error(f"Error getting bots: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -332,6 +763,25 @@ def add_document_to_bot(bot_id):
         logger.error(f"Error adding document to bot {bot_id}: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/bots/<bot_id>/documents:batch', methods=['POST'])
+def add_documents_to_bot(bot_id):
+    """Add several documents to a bot in one update"""
+    try:
+        data = request.json
+        document_ids = data.get('document_ids')
+        
+        if not document_ids or not isinstance(document_ids, list):
+            return jsonify({"success": False, "error": "A list of document IDs is required"}), 400
+        
+        bot = bot_manager.add_documents_to_bot(bot_id, document_ids)
+        if bot:
+            return jsonify({"success": True, "bot": bot})
+        else:
+            return jsonify({"success": False, "error": "Bot not found"}), 404
+    except Exception as e:
+        logger.error(f"Error adding documents to bot {bot_id}: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/bots/<bot_id>/documents/<document_id>', methods=['DELETE'])
 def remove_document_from_bot(bot_id, document_id):
     """Remove a document from a bot"""
@@ -0,0 +1,132 @@
+"""
+ASGI entry point: async chat routes in front of the Flask app.
+
+POST /chat and /chat/stream are served by the asyncio pipeline
+(generate_rag_response_async), whose translator, search and model calls use
+async clients, so a chat waiting on Azure holds no thread and one process can
+serve hundreds of concurrent chats. Every other request is passed to the Flask
+app unchanged. app.py keeps serving all routes, including the synchronous chat,
+under a WSGI server.
+
+Ingestion jobs run in the worker that accepted them; their status is written
+to the SQLite job store (INGESTION_JOBS_PATH), so /jobs/<id> can be polled on
+any worker of the same host. Several hosts need INGESTION_JOBS_PATH on a
+shared volume.
+
+Usage:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 [--workers 4]
+"""
+
+import json
+import asyncio
+import logging
+import contextlib
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app import app as flask_app, bot_manager
+from azure_clients import clients
+from chatbot_core import generate_rag_response_async, generate_rag_response_stream_async, chat_session_id
+from document_processor import close_search_backends_async
+
+logger = logging.getLogger(__name__)
+
+ASYNC_PATHS = {"/chat", "/chat/stream"}
+
+async def _parse_chat_request(request):
+    """Read a chat request body and resolve the bot's documents, as the Flask /chat route does."""
+    data = await request.json()
+    query = data.get('query')
+    bot_id = data.get('bot_id', None)
+    chat_args = {
+        "language": data.get('language', 'en'),
+        "session_id": chat_session_id(data),
+        "reuse_context": data.get('reuse_context')
+    }
+
+    document_ids = None
+    if bot_id:
+        # Table Storage has no async client here; the lookup runs in a worker thread
+        bot = await asyncio.to_thread(bot_manager.get_bot, bot_id)
+        if bot:
+            document_ids = bot.get('document_ids', [])
+            logger.debug(f"Using document_ids for bot {bot_id}: {document_ids}")
+    chat_args.update(document_ids=document_ids, bot_id=bot_id if document_ids is not None else None)
+    return query, bot_id, chat_args
+
+async def chat(request):
+    """Process a chat message and generate a response."""
+    try:
+        query, bot_id, chat_args = await _parse_chat_request(request)
+        if not query:
+            return JSONResponse({'success': False, 'error': 'Query is required'}, status_code=400)
+
+        result = await generate_rag_response_async(query, **chat_args)
+        return JSONResponse({
+            'success': True,
+            'answer': result.get("answer", ""),
+            'sources': result.get("sources", []),
+            'bot_id': bot_id,
+            'session_id': chat_args["session_id"],
+            'cached': result.get('cached', False),
+            'context_reused': result.get('context_reused', False)
+        })
+    except Exception as e:
+        logger.error(f"Error in async chat endpoint: {str(e)}", exc_info=True)
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def chat_stream(request):
+    """Process a chat message and stream the response as Server-Sent Events."""
+    try:
+        query, bot_id, chat_args = await _parse_chat_request(request)
+        if not query:
+            return JSONResponse({'success': False, 'error': 'Query is required'}, status_code=400)
+
+        async def generate():
+            async for event in generate_rag_response_stream_async(query, **chat_args):
+                if event['type'] == 'done':
+                    event['bot_id'] = bot_id
+                    event['session_id'] = chat_args["session_id"]
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        return StreamingResponse(
+            generate(),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        logger.error(f"Error in async streaming chat endpoint: {str(e)}", exc_info=True)
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    # Async clients belong to this event loop; close them before it stops
+    if clients.is_initialized("chat_completions_async"):
+        await clients.get("chat_completions_async").close()
+    if clients.is_initialized("translator"):
+        await clients.get("translator").close_async()
+    await close_search_backends_async()
+
+chat_app = Starlette(
+    routes=[
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"])
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan
+)
+
+wsgi_app = WSGIMiddleware(flask_app)
+
+async def application(scope, receive, send):
+    """Route the async chat paths (and lifespan events) to chat_app, everything else to Flask."""
+    if scope["type"] == "lifespan" or (scope["type"] == "http" and scope["path"] in ASYNC_PATHS):
+        await chat_app(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
@@ -0,0 +1,103 @@
+# azure_clients.py
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of lazily created service clients.
+
+    Modules register a factory per client name at import time, which is free;
+    the client is built on first use, cached, and shared by every thread. A
+    factory that fails is retried on the next use instead of failing the import,
+    so a worker boots even while a service is unreachable. Tests can swap a client
+    with override() and drop cached clients with reset().
+    """
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Register the zero-argument factory that builds client `name`."""
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """Return client `name`, building it on first use."""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"No client registered as '{name}'")
+            lock = self._locks[name]
+        # One lock per client, so a slow service does not hold up the others
+        with lock:
+            client = self._clients.get(name)
+            if client is None:
+                logger.debug(f"Creating client '{name}'")
+                client = self._factories[name]()
+                self._clients[name] = client
+        return client
+
+    def is_initialized(self, name):
+        return name in self._clients
+
+    def override(self, name, client):
+        """Use `client` for `name` instead of building one (e.g. a fake in tests)."""
+        with self._lock:
+            self._locks.setdefault(name, threading.Lock())
+            self._clients[name] = client
+
+    def reset(self, name=None):
+        """Drop one cached client, or all of them, closing those that can be closed."""
+        with self._lock:
+            names = [name] if name else list(self._clients)
+            dropped = [self._clients.pop(key) for key in names if key in self._clients]
+        for client in dropped:
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.warning(f"Error closing client: {str(e)}")
+
+    def proxy(self, name):
+        """Return a stand-in that builds client `name` on first attribute access."""
+        return LazyClient(self, name)
+
+
+class LazyClient:
+    """
+    Module-level stand-in for a registered client.
+
+    Attribute access is forwarded to the real client, created on first use.
+    Truth testing reports whether the client can be created, so existing
+    `if not client:` guards keep working.
+    """
+    def __init__(self, registry, name):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attribute):
+        return getattr(self._registry.get(self._name), attribute)
+
+    def __bool__(self):
+        try:
+            self._registry.get(self._name)
+            return True
+        except Exception as e:
+            logger.error(f"Client '{self._name}' is unavailable: {str(e)}", exc_info=True)
+            return False
+
+    def __repr__(self):
+        return f"<LazyClient '{self._name}'>"
+
+
+clients = ClientRegistry()
@@ -0,0 +1,90 @@
+"""
+Check that importing the app is fast and makes no network calls.
+
+Each run imports the module in a fresh interpreter with socket connections and
+DNS lookups disabled, so any client created at import time fails the check.
+Exits non-zero if a run touches the network or the median exceeds the budget.
+
+Usage:
+    python benchmark_import.py [--module app] [--budget 3.0] [--repeat 3]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+def child(module):
+    """Import `module` with networking blocked and report the time and any connection attempts."""
+    import socket
+
+    attempts = []
+
+    def blocked(*args, **kwargs):
+        attempts.append(repr(args[:2]))
+        raise OSError("Network access during import")
+
+    socket.socket.connect = blocked
+    socket.socket.connect_ex = blocked
+    socket.create_connection = blocked
+    socket.getaddrinfo = blocked
+
+    started = time.perf_counter()
+    error = None
+    try:
+        __import__(module)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"seconds": elapsed, "network_attempts": attempts, "error": error}))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the app without network access")
+    parser.add_argument("--module", default="app", help="Module to import")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_BUDGET_SECONDS", 3.0)),
+                        help="Maximum median import time in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters to measure")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.module)
+        return
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    failures = []
+    for run in range(args.repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--module", args.module],
+            cwd=here, capture_output=True, text=True
+        )
+        lines = output.stdout.strip().splitlines()
+        if output.returncode != 0 or not lines:
+            failures.append(f"run {run + 1}: interpreter exited with {output.returncode}: {output.stderr[-500:]}")
+            continue
+        result = json.loads(lines[-1])
+        timings.append(result["seconds"])
+        print(f"run {run + 1}: import {args.module} took {result['seconds'] * 1000:.0f} ms")
+        if result["network_attempts"]:
+            failures.append(f"run {run + 1}: network access during import: {result['network_attempts']}")
+        if result["error"]:
+            failures.append(f"run {run + 1}: import failed: {result['error']}")
+
+    if timings:
+        median = statistics.median(timings)
+        print(f"median: {median * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms)")
+        if median > args.budget:
+            failures.append(f"median import time {median:.2f}s exceeds budget {args.budget:.2f}s")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL {failure}")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark query latency of the local BM25 backend on a synthetic corpus.
+
+Passages are drawn from a Zipf-distributed vocabulary, so the most frequent
+terms appear in most passages and the rarest in a handful, as in real
+documents. Reports median and p95 latency for rare, common and mixed queries,
+with and without a bot filter.
+
+Usage:
+    python benchmark_local_search.py [--passages 20000] [--words 120] [--repeat 200]
+"""
+
+import time
+import random
+import logging
+import argparse
+import tempfile
+import statistics
+
+from local_search import LocalBM25Backend
+
+def build_corpus(passages, words_per_passage, vocabulary_size, bots, seed):
+    """Return passage documents and the vocabulary ordered from most to least frequent."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(vocabulary_size)]
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary_size)]
+    documents = []
+    for i in range(passages):
+        words = rng.choices(vocabulary, weights=weights, k=words_per_passage)
+        documents.append({
+            "id": f"passage-{i}",
+            "parent_id": f"document-{i // 20}",
+            "bot_ids": [f"bot-{i % bots}"],
+            "content": " ".join(words)
+        })
+    return documents, vocabulary
+
+def measure(backend, queries, repeat, **search_args):
+    """Median and p95 latency in milliseconds over repeat runs of every query."""
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            backend.search(query, top=5, **search_args)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure local BM25 query latency")
+    parser.add_argument("--passages", type=int, default=20000, help="Passages in the corpus")
+    parser.add_argument("--words", type=int, default=120, help="Words per passage")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="Distinct terms")
+    parser.add_argument("--bots", type=int, default=50, help="Bots the passages are spread over")
+    parser.add_argument("--repeat", type=int, default=200, help="Runs per query")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    documents, vocabulary = build_corpus(args.passages, args.words, args.vocabulary, args.bots, args.seed)
+    with tempfile.TemporaryDirectory() as path:
+        backend = LocalBM25Backend(path=path, index_name="benchmark", merge_threshold=len(documents) + 1)
+        started = time.perf_counter()
+        backend.upload_documents(documents)
+        backend.merge()
+        print(f"Indexed and merged {len(documents)} passages in {time.perf_counter() - started:.1f} s")
+
+        query_sets = {
+            "rare": [vocabulary[-1 - i * 97] for i in range(10)],
+            "common": [vocabulary[i] for i in range(10)],
+            "mixed": [f"{vocabulary[i]} {vocabulary[i * 50 + 200]} {vocabulary[-1 - i * 97]}" for i in range(10)],
+        }
+        print(f"{'queries':<8} {'filter':<7} {'median ms':>10} {'p95 ms':>8}")
+        print("-" * 36)
+        for name, queries in query_sets.items():
+            for label, search_args in (("none", {}), ("bot", {"bot_id": "bot-1"})):
+                median, p95 = measure(backend, queries, args.repeat, **search_args)
+                print(f"{name:<8} {label:<7} {median:>10.3f} {p95:>8.3f}")
+
+if __name__ == "__main__":
+    main()
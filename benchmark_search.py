@@ -0,0 +1,71 @@
+"""
+Benchmark search response size and client-side parse time for full and lean search modes.
+
+Usage:
+    python benchmark_search.py "query one" "query two" [--top 5] [--repeat 3]
+"""
+
+import sys
+import time
+import logging
+import argparse
+import statistics
+
+from document_processor import search_documents
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def run_query(query, top, lean):
+    """Run one search and return (response bytes, round trip seconds, parse seconds, result count)."""
+    measured = {}
+    
+    def capture_response(pipeline_response):
+        # Called once the HTTP response arrives, before results are deserialized
+        measured["bytes"] = len(pipeline_response.http_response.body() or b"")
+        measured["received_at"] = time.perf_counter()
+    
+    started_at = time.perf_counter()
+    result = search_documents(query, top=top, lean=lean, raw_response_hook=capture_response)
+    finished_at = time.perf_counter()
+    
+    if not result.get("success"):
+        raise RuntimeError(result.get("error"))
+    
+    received_at = measured.get("received_at", finished_at)
+    return measured.get("bytes", 0), received_at - started_at, finished_at - received_at, result.get("count", 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full and lean search response payloads")
+    parser.add_argument("queries", nargs="+", help="Queries to run")
+    parser.add_argument("--top", type=int, default=5, help="Results per query")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query and mode")
+    args = parser.parse_args()
+    
+    print(f"{'mode':<6} {'query':<30} {'results':>7} {'bytes':>9} {'request ms':>11} {'parse ms':>9}")
+    print("-" * 76)
+    totals = {}
+    for query in args.queries:
+        for mode, lean in (("full", False), ("lean", True)):
+            runs = []
+            for _ in range(args.repeat):
+                try:
+                    runs.append(run_query(query, args.top, lean))
+                except Exception as e:
+                    logger.error(f"Query '{query}' failed in {mode} mode: {str(e)}")
+                    sys.exit(1)
+            size = statistics.median(run[0] for run in runs)
+            request_ms = statistics.median(run[1] for run in runs) * 1000
+            parse_ms = statistics.median(run[2] for run in runs) * 1000
+            totals.setdefault(mode, []).append(size)
+            print(f"{mode:<6} {query[:30]:<30} {runs[0][3]:>7} {size:>9.0f} {request_ms:>11.1f} {parse_ms:>9.2f}")
+    
+    if totals.get("full") and totals.get("lean"):
+        full_bytes = sum(totals["full"])
+        lean_bytes = sum(totals["lean"])
+        print("-" * 76)
+        print(f"Lean responses are {lean_bytes / full_bytes:.1%} of full responses by size" if full_bytes else "")
+
+if __name__ == "__main__":
+    main()
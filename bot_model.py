@@ -1,11 +1,17 @@
 import uuid
+import copy
+import base64
+import time
+import random
+import threading
 from datetime import datetime
 from typing import List, Dict, Optional
 import json
 import os
 import logging
-from azure.data.tables import TableServiceClient, TableClient
-from azure.core.exceptions import ResourceExistsError
+from azure.data.tables import TableServiceClient, TableClient, UpdateMode
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
 
 # Configure logging
 logging.basicConfig(
@@ -18,8 +24,29 @@ class BotModel:
     """
     Handles CRUD operations for bots in Azure Table Storage.
     """
-    def __init__(self):
-        """Initialize the bot model with Azure Table Storage connection."""
+    # Attempts for an ETag-conditional document list update before giving up
+    MAX_CONFLICT_RETRIES = 5
+
+    # API field name -> Table Storage property
+    FIELD_PROPERTIES = {
+        "id": "RowKey",
+        "name": "name",
+        "description": "description",
+        "created_at": "created_at",
+        "document_ids": "document_ids",
+        "settings": "settings"
+    }
+    SUMMARY_FIELDS = ["id", "name", "description"]
+    MAX_PAGE_SIZE = 1000
+
+    def __init__(self, cache_ttl_seconds: float = None):
+        """
+        Initialize the bot model with Azure Table Storage connection.
+        
+        Args:
+            cache_ttl_seconds: How long a cached bot is served without revalidation
+                (BOT_CACHE_TTL_SECONDS, default 30; 0 disables the cache)
+        """
         self.connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
         self.table_name = "botscollection"
         
@@ -27,6 +54,18 @@ class BotModel:
             logger.error("No storage connection string found in environment variables")
             raise ValueError("Storage connection string not found")
         
+        if cache_ttl_seconds is None:
+            cache_ttl_seconds = float(os.environ.get("BOT_CACHE_TTL_SECONDS", 30))
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"hits": 0, "revalidated": 0, "misses": 0}
+        self._document_listeners = []
+        
+        # One long-lived client, reused by every operation
+        self._service_client = TableServiceClient.from_connection_string(self.connection_string)
+        self._table_client = None
+        
         # Ensure table exists
         self._create_table_if_not_exists()
         logger.info(f"Bot model initialized with table: {self.table_name}")
@@ -34,22 +73,67 @@ class BotModel:
     def _create_table_if_not_exists(self):
         """Create the bots table if it doesn't exist."""
         try:
-            service_client = TableServiceClient.from_connection_string(self.connection_string)
-            service_client.create_table_if_not_exists(self.table_name)
+            self._service_client.create_table_if_not_exists(self.table_name)
             logger.info(f"Table {self.table_name} created or verified")
         except Exception as e:
             logger.error(f"Error creating table: {str(e)}")
             raise
 
     def _get_table_client(self):
-        """Get a table client for the bots table."""
+        """Get the shared table client for the bots table."""
         try:
-            service_client = TableServiceClient.from_connection_string(self.connection_string)
-            return service_client.get_table_client(self.table_name)
+            if self._table_client is None:
+                self._table_client = self._service_client.get_table_client(self.table_name)
+            return self._table_client
         except Exception as e:
             logger.error(f"Error getting table client: {str(e)}")
             raise
 
+    @staticmethod
+    def _entity_to_bot(entity) -> Dict:
+        """Convert a Table Storage entity to the bot dict returned by the API."""
+        return {
+            "id": entity["RowKey"],
+            "name": entity["name"],
+            "description": entity.get("description", ""),
+            "created_at": entity["created_at"],
+            "document_ids": json.loads(entity.get("document_ids", "[]")),
+            "settings": json.loads(entity.get("settings", "{}"))
+        }
+
+    @staticmethod
+    def _entity_etag(entity) -> Optional[str]:
+        metadata = getattr(entity, "metadata", None) or {}
+        return metadata.get("etag")
+
+    def _cache_put(self, bot_id: str, bot: Dict, etag: Optional[str]):
+        if self.cache_ttl_seconds <= 0:
+            return
+        with self._cache_lock:
+            self._cache[bot_id] = (bot, etag, time.monotonic())
+
+    def add_document_listener(self, listener):
+        """
+        Register a callable(bot_id, old_document_ids, new_document_ids) that is
+        called after a bot's document list has been changed.
+        """
+        self._document_listeners.append(listener)
+
+    def _notify_document_listeners(self, bot_id: str, old_document_ids: List[str], new_document_ids: List[str]):
+        for listener in self._document_listeners:
+            try:
+                listener(bot_id, old_document_ids, new_document_ids)
+            except Exception as e:
+                logger.error(f"Document listener failed for bot {bot_id}: {str(e)}")
+
+    def invalidate_cache(self, bot_id: str = None):
+        """Drop one bot (or every bot) from the read-through cache."""
+        with self._cache_lock:
+            if bot_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(bot_id, None)
+
     def create_bot(self, name: str, description: str = "", settings: Dict = None) -> Dict:
         """
         Create a new bot.
@@ -129,10 +213,113 @@ class BotModel:
             logger.error(f"Error retrieving bots: {str(e)}")
             raise
 
+    def list_bots(self, limit: int = None, continuation_token: str = None,
+                  fields: List[str] = None) -> Dict:
+        """
+        Get one page of bots, optionally projected to a subset of fields.
+        
+        The projection is pushed down to Table Storage as a select, so unrequested
+        properties (such as large document lists) are never transferred or decoded.
+        
+        Args:
+            limit: Maximum number of bots in the page (capped at MAX_PAGE_SIZE)
+            continuation_token: Opaque token returned by a previous call
+            fields: API fields to return (see FIELD_PROPERTIES); all fields if None
+            
+        Returns:
+            Dict with the page of bots and the continuation token for the next page (None on the last page)
+            
+        Raises:
+            ValueError: For unknown fields or a malformed continuation token
+        """
+        if fields:
+            unknown = [field for field in fields if field not in self.FIELD_PROPERTIES]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            fields = list(dict.fromkeys(["id"] + list(fields)))
+        else:
+            fields = list(self.FIELD_PROPERTIES)
+        select = [self.FIELD_PROPERTIES[field] for field in fields]
+        
+        limit = min(max(1, int(limit or self.MAX_PAGE_SIZE)), self.MAX_PAGE_SIZE)
+        token = self._decode_continuation_token(continuation_token)
+        
+        try:
+            table_client = self._get_table_client()
+            pages = table_client.query_entities(
+                "PartitionKey eq 'bot'",
+                select=select,
+                results_per_page=limit
+            ).by_page(continuation_token=token)
+            
+            bots = []
+            try:
+                for entity in next(pages):
+                    bots.append(self._project_entity(entity, fields))
+            except StopIteration:
+                pass
+            
+            next_token = self._encode_continuation_token(pages.continuation_token)
+            logger.info(f"Retrieved page of {len(bots)} bots (more: {next_token is not None})")
+            return {"bots": bots, "continuation_token": next_token}
+        except Exception as e:
+            logger.error(f"Error listing bots: {str(e)}")
+            raise
+
+    def get_document_memberships(self) -> Dict[str, List[str]]:
+        """
+        Map every document ID to the IDs of the bots it is attached to.
+        
+        Used to fill the bot_ids field of passages when a search index is rebuilt.
+        """
+        memberships = {}
+        token = None
+        while True:
+            page = self.list_bots(continuation_token=token, fields=["document_ids"])
+            for bot in page["bots"]:
+                for document_id in bot["document_ids"]:
+                    memberships.setdefault(document_id, []).append(bot["id"])
+            token = page["continuation_token"]
+            if not token:
+                return memberships
+
+    def _project_entity(self, entity, fields: List[str]) -> Dict:
+        """Build a bot dict containing only the requested fields."""
+        bot = {}
+        for field in fields:
+            value = entity.get(self.FIELD_PROPERTIES[field])
+            if field == "document_ids":
+                value = json.loads(value or "[]")
+            elif field == "settings":
+                value = json.loads(value or "{}")
+            elif field == "description" and value is None:
+                value = ""
+            bot[field] = value
+        return bot
+
+    @staticmethod
+    def _encode_continuation_token(token) -> Optional[str]:
+        if not token:
+            return None
+        return base64.urlsafe_b64encode(json.dumps(token).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_continuation_token(token: str):
+        if not token:
+            return None
+        try:
+            return json.loads(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        except (ValueError, UnicodeError) as e:
+            raise ValueError(f"Invalid continuation token: {str(e)}")
+
     def get_bot(self, bot_id: str) -> Optional[Dict]:
         """
         Get a specific bot by ID.
         
+        Bots are served from an in-process cache for cache_ttl_seconds. After that
+        the cached copy is revalidated by ETag with a key-only read, and the full
+        entity is only fetched again when it has changed.
+        
         Args:
             bot_id: The ID of the bot to retrieve
             
@@ -140,23 +327,36 @@ class BotModel:
             Bot information or None if not found
         """
         try:
+            with self._cache_lock:
+                cached = self._cache.get(bot_id)
+            
+            if cached is not None:
+                bot, etag, fetched_at = cached
+                if time.monotonic() - fetched_at < self.cache_ttl_seconds:
+                    self.cache_stats["hits"] += 1
+                    return copy.deepcopy(bot)
+            
             table_client = self._get_table_client()
             
             try:
+                if cached is not None and cached[1]:
+                    # Revalidate: fetch only the key and compare ETags
+                    probe = table_client.get_entity("bot", bot_id, select=["RowKey"])
+                    if self._entity_etag(probe) == cached[1]:
+                        self._cache_put(bot_id, cached[0], cached[1])
+                        self.cache_stats["revalidated"] += 1
+                        return copy.deepcopy(cached[0])
+                
                 entity = table_client.get_entity("bot", bot_id)
                 
-                bot = {
-                    "id": entity["RowKey"],
-                    "name": entity["name"],
-                    "description": entity.get("description", ""),
-                    "created_at": entity["created_at"],
-                    "document_ids": json.loads(entity.get("document_ids", "[]")),
-                    "settings": json.loads(entity.get("settings", "{}"))
-                }
+                bot = self._entity_to_bot(entity)
+                self._cache_put(bot_id, bot, self._entity_etag(entity))
+                self.cache_stats["misses"] += 1
                 
                 logger.info(f"Retrieved bot: {bot_id}")
-                return bot
+                return copy.deepcopy(bot)
             except Exception as e:
+                self.invalidate_cache(bot_id)
                 logger.warning(f"Bot not found: {bot_id}, {str(e)}")
                 return None
                 
@@ -182,31 +382,25 @@ class BotModel:
             table_client = self._get_table_client()
             
             try:
-                # Get the current entity
-                entity = table_client.get_entity("bot", bot_id)
-                
-                # Update fields if provided
+                # Merge only the changed properties, so the write cannot undo a
+                # concurrent change to document_ids made through _update_document_ids
+                changes = {"PartitionKey": "bot", "RowKey": bot_id}
                 if name is not None:
-                    entity["name"] = name
+                    changes["name"] = name
                 
                 if description is not None:
-                    entity["description"] = description
+                    changes["description"] = description
                 
                 if settings is not None:
-                    entity["settings"] = json.dumps(settings)
+                    changes["settings"] = json.dumps(settings)
                 
-                # Update the entity in the table
-                table_client.update_entity(entity)
+                if len(changes) > 2:
+                    # A MERGE without an ETag still requires the entity to exist
+                    table_client.update_entity(changes, mode=UpdateMode.MERGE)
+                    self.invalidate_cache(bot_id)
                 
                 # Return the updated bot information
-                updated_bot = {
-                    "id": entity["RowKey"],
-                    "name": entity["name"],
-                    "description": entity.get("description", ""),
-                    "created_at": entity["created_at"],
-                    "document_ids": json.loads(entity.get("document_ids", "[]")),
-                    "settings": json.loads(entity.get("settings", "{}"))
-                }
+                updated_bot = self._entity_to_bot(table_client.get_entity("bot", bot_id))
                 
                 logger.info(f"Updated bot: {bot_id}")
                 return updated_bot
@@ -230,11 +424,15 @@ class BotModel:
         """
         try:
             table_client = self._get_table_client()
+            bot = self.get_bot(bot_id)
             
             try:
                 # Delete the entity
                 table_client.delete_entity("bot", bot_id)
+                self.invalidate_cache(bot_id)
                 logger.info(f"Deleted bot: {bot_id}")
+                if bot and bot["document_ids"]:
+                    self._notify_document_listeners(bot_id, bot["document_ids"], [])
                 return True
             except Exception as e:
                 logger.warning(f"Bot not found for deletion: {bot_id}, {str(e)}")
@@ -244,6 +442,61 @@ class BotModel:
             logger.error(f"Error deleting bot: {str(e)}")
             raise
 
+    def _update_document_ids(self, bot_id: str, change) -> Optional[Dict]:
+        """
+        Apply a change to a bot's document list with an ETag-conditional update.
+        
+        The entity is read, change(document_ids) returns the new list (or None when
+        nothing changes), and the write is made with If-Match on the read ETag. If
+        another writer got there first the read-merge-write is retried.
+        
+        Args:
+            bot_id: The ID of the bot
+            change: Callable taking the current document ID list
+            
+        Returns:
+            Updated bot information or None if bot not found
+            
+        Raises:
+            ResourceModifiedError: If the update kept conflicting after MAX_CONFLICT_RETRIES attempts
+        """
+        table_client = self._get_table_client()
+        
+        for attempt in range(self.MAX_CONFLICT_RETRIES):
+            try:
+                entity = table_client.get_entity("bot", bot_id)
+            except ResourceNotFoundError:
+                self.invalidate_cache(bot_id)
+                return None
+            
+            document_ids = json.loads(entity.get("document_ids", "[]"))
+            new_document_ids = change(list(document_ids))
+            
+            if new_document_ids is None or new_document_ids == document_ids:
+                return self._entity_to_bot(entity)
+            
+            entity["document_ids"] = json.dumps(new_document_ids)
+            try:
+                table_client.update_entity(
+                    entity,
+                    mode=UpdateMode.MERGE,
+                    etag=self._entity_etag(entity),
+                    match_condition=MatchConditions.IfNotModified
+                )
+            except ResourceModifiedError:
+                logger.info(f"Concurrent update of bot {bot_id}, retrying (attempt {attempt + 1})")
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+                continue
+            except ResourceNotFoundError:
+                self.invalidate_cache(bot_id)
+                return None
+            
+            self.invalidate_cache(bot_id)
+            self._notify_document_listeners(bot_id, document_ids, new_document_ids)
+            return self._entity_to_bot(entity)
+        
+        raise ResourceModifiedError(f"Bot {bot_id} was modified concurrently {self.MAX_CONFLICT_RETRIES} times")
+
     def add_document_to_bot(self, bot_id: str, document_id: str) -> Optional[Dict]:
         """
         Add a document to a bot.
@@ -255,45 +508,35 @@ class BotModel:
         Returns:
             Updated bot information or None if bot not found
         """
-        try:
-            table_client = self._get_table_client()
+        return self.add_documents_to_bot(bot_id, [document_id])
+
+    def add_documents_to_bot(self, bot_id: str, document_ids: List[str]) -> Optional[Dict]:
+        """
+        Add several documents to a bot in one read-merge-write.
+        
+        Args:
+            bot_id: The ID of the bot
+            document_ids: The IDs of the documents to add
             
-            try:
-                # Get the current entity
-                entity = table_client.get_entity("bot", bot_id)
-                
-                # Get the current document IDs and add the new one
-                document_ids = json.loads(entity.get("document_ids", "[]"))
-                
-                # Only add if not already present
-                if document_id not in document_ids:
-                    document_ids.append(document_id)
-                    entity["document_ids"] = json.dumps(document_ids)
-                    
-                    # Update the entity in the table
-                    table_client.update_entity(entity)
-                    
-                    logger.info(f"Added document {document_id} to bot {bot_id}")
-                else:
-                    logger.info(f"Document {document_id} already exists in bot {bot_id}")
-                
-                # Return the updated bot information
-                updated_bot = {
-                    "id": entity["RowKey"],
-                    "name": entity["name"],
-                    "description": entity.get("description", ""),
-                    "created_at": entity["created_at"],
-                    "document_ids": document_ids,
-                    "settings": json.loads(entity.get("settings", "{}"))
-                }
-                
-                return updated_bot
-            except Exception as e:
-                logger.warning(f"Bot not found when adding document: {bot_id}, {str(e)}")
+        Returns:
+            Updated bot information or None if bot not found
+        """
+        def merge(current_ids):
+            # Only add IDs that are not already present, preserving order
+            added = [doc_id for doc_id in dict.fromkeys(document_ids) if doc_id not in current_ids]
+            if not added:
+                logger.info(f"Documents {document_ids} already exist in bot {bot_id}")
                 return None
-                
+            logger.info(f"Adding {len(added)} documents to bot {bot_id}: {added}")
+            return current_ids + added
+        
+        try:
+            bot = self._update_document_ids(bot_id, merge)
+            if bot is None:
+                logger.warning(f"Bot not found when adding documents: {bot_id}")
+            return bot
         except Exception as e:
-            logger.error(f"Error adding document to bot: {str(e)}")
+            logger.error(f"Error adding documents to bot: {str(e)}")
             raise
 
     def remove_document_from_bot(self, bot_id: str, document_id: str) -> Optional[Dict]:
@@ -307,42 +550,18 @@ class BotModel:
         Returns:
             Updated bot information or None if bot not found
         """
-        try:
-            table_client = self._get_table_client()
-            
-            try:
-                # Get the current entity
-                entity = table_client.get_entity("bot", bot_id)
-                
-                # Get the current document IDs and remove the specified one
-                document_ids = json.loads(entity.get("document_ids", "[]"))
-                
-                if document_id in document_ids:
-                    document_ids.remove(document_id)
-                    entity["document_ids"] = json.dumps(document_ids)
-                    
-                    # Update the entity in the table
-                    table_client.update_entity(entity)
-                    
-                    logger.info(f"Removed document {document_id} from bot {bot_id}")
-                else:
-                    logger.info(f"Document {document_id} not found in bot {bot_id}")
-                
-                # Return the updated bot information
-                updated_bot = {
-                    "id": entity["RowKey"],
-                    "name": entity["name"],
-                    "description": entity.get("description", ""),
-                    "created_at": entity["created_at"],
-                    "document_ids": document_ids,
-                    "settings": json.loads(entity.get("settings", "{}"))
-                }
-                
-                return updated_bot
-            except Exception as e:
-                logger.warning(f"Bot not found when removing document: {bot_id}, {str(e)}")
+        def remove(current_ids):
+            if document_id not in current_ids:
+                logger.info(f"Document {document_id} not found in bot {bot_id}")
                 return None
-                
+            logger.info(f"Removing document {document_id} from bot {bot_id}")
+            return [doc_id for doc_id in current_ids if doc_id != document_id]
+        
+        try:
+            bot = self._update_document_ids(bot_id, remove)
+            if bot is None:
+                logger.warning(f"Bot not found when removing document: {bot_id}")
+            return bot
         except Exception as e:
             logger.error(f"Error removing document from bot: {str(e)}")
             raise
@@ -0,0 +1,409 @@
+# bulk_ingestion.py
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytz
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class BulkIngestionPipeline:
+    """
+    Pipelined ingestion of many documents.
+    
+    Each stage has its own worker pool: while file k is being analyzed by Form
+    Recognizer, file k+1 is already uploading. Extracted documents are queued
+    for a single indexer thread that sends passages of several documents per
+    indexing request, flushing by document count, passage count or age.
+    When a batch finishes, its documents are attached to the bot in one update.
+    
+    With a document registry, each file is hashed before upload; files whose
+    content was already ingested skip upload, extraction and indexing and reuse
+    the existing document ID. Content another ingestion has claimed but not yet
+    finished is waited for, and taken over if that ingestion fails.
+    
+    With a job store, the batch status is written there as files finish, so
+    other worker processes can report it.
+    """
+    def __init__(self, upload_func, extract_func, build_passages_func, index_batch_func,
+                 ensure_index_func=None, attach_func=None, registry=None, hash_func=None,
+                 upload_concurrency=None,
+                 extract_concurrency=None, index_batch_documents=None, index_batch_passages=None,
+                 index_flush_seconds=None, claim_wait_seconds=None, claim_poll_seconds=2,
+                 max_finished_batches=100, job_store=None):
+        """
+        Args:
+            upload_func: upload_document(file_path) -> upload result dict
+            extract_func: extract_uploaded_document(upload_result) -> extraction dict
+            build_passages_func: build_search_passages(doc_id, upload_result, extract_result) -> passages
+            index_batch_func: index_passage_batch({doc_id: passages}) -> {doc_id: outcome}
+            ensure_index_func: Optional ensure_search_index_exists() called once per batch
+            attach_func: Optional callable(bot_id, document_ids) run when a batch completes
+            registry: Optional DocumentRegistry used to skip already-ingested content
+            hash_func: hash_file(file_path) -> content hash, required with a registry
+            upload_concurrency: Parallel blob uploads (BULK_UPLOAD_CONCURRENCY, default 4)
+            extract_concurrency: Parallel extractions (BULK_EXTRACT_CONCURRENCY, default 4)
+            index_batch_documents: Documents per indexing request (BULK_INDEX_BATCH_DOCUMENTS, default 10)
+            index_batch_passages: Passages per indexing request (BULK_INDEX_BATCH_PASSAGES, default 500)
+            index_flush_seconds: Longest a document waits for its batch (BULK_INDEX_FLUSH_SECONDS, default 2)
+            claim_wait_seconds: Longest a file waits for content still being ingested elsewhere
+                (BULK_CLAIM_WAIT_SECONDS, default 600)
+            claim_poll_seconds: Interval between registry checks while waiting
+            max_finished_batches: How many finished batches to keep for status lookups
+            job_store: Optional JobStore the batch status is written to
+        """
+        self.upload_func = upload_func
+        self.extract_func = extract_func
+        self.build_passages_func = build_passages_func
+        self.index_batch_func = index_batch_func
+        self.ensure_index_func = ensure_index_func
+        self.attach_func = attach_func
+        self.registry = registry
+        self.hash_func = hash_func
+        self.job_store = job_store
+        
+        self.upload_concurrency = upload_concurrency or int(os.environ.get("BULK_UPLOAD_CONCURRENCY", 4))
+        self.extract_concurrency = extract_concurrency or int(os.environ.get("BULK_EXTRACT_CONCURRENCY", 4))
+        self.index_batch_documents = index_batch_documents or int(os.environ.get("BULK_INDEX_BATCH_DOCUMENTS", 10))
+        self.index_batch_passages = index_batch_passages or int(os.environ.get("BULK_INDEX_BATCH_PASSAGES", 500))
+        self.index_flush_seconds = index_flush_seconds or float(os.environ.get("BULK_INDEX_FLUSH_SECONDS", 2))
+        self.claim_wait_seconds = claim_wait_seconds or float(os.environ.get("BULK_CLAIM_WAIT_SECONDS", 600))
+        self.claim_poll_seconds = claim_poll_seconds
+        self.max_finished_batches = max_finished_batches
+        
+        self._upload_pool = ThreadPoolExecutor(max_workers=self.upload_concurrency, thread_name_prefix="bulk-upload")
+        self._extract_pool = ThreadPoolExecutor(max_workers=self.extract_concurrency, thread_name_prefix="bulk-extract")
+        self._index_queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = {}
+        self._finished_order = []
+        
+        # Started with the first batch, so the pipeline can be built before a fork
+        self._indexer = None
+        logger.info(f"Bulk ingestion pipeline configured: {self.upload_concurrency} upload, "
+                    f"{self.extract_concurrency} extract workers, index batches of {self.index_batch_documents} documents")
+
+    def _start_indexer(self):
+        with self._lock:
+            if self._indexer is None:
+                self._indexer = threading.Thread(target=self._index_loop, name="bulk-index", daemon=True)
+                self._indexer.start()
+
+    def submit(self, file_paths, bot_id=None, cleanup=None):
+        """
+        Start ingesting a set of files.
+        
+        Args:
+            file_paths: Paths of the saved files
+            bot_id: Optional bot to attach the documents to when the batch completes
+            cleanup: Optional callable(file_path) run when a file leaves the pipeline
+            
+        Returns:
+            The batch status dict
+        """
+        self._start_indexer()
+        batch_id = str(uuid.uuid4())
+        batch = {
+            "id": batch_id,
+            "type": "bulk",
+            "status": "running",
+            "bot_id": bot_id,
+            "created_at": datetime.now(pytz.UTC).isoformat(),
+            "finished_at": None,
+            "_started": time.monotonic(),
+            "duration": None,
+            "files": {},
+            "counts": {"total": len(file_paths), "completed": 0, "failed": 0},
+            "bot": None,
+            "_cleanup": cleanup
+        }
+        for file_path in file_paths:
+            batch["files"][file_path] = {
+                "file_name": os.path.basename(file_path),
+                "stage": "queued",
+                "status": "pending",
+                "document_id": None,
+                "content_hash": None,
+                "deduplicated": False,
+                "error": None,
+                "timings": {}
+            }
+        with self._lock:
+            self._batches[batch_id] = batch
+        
+        if self.ensure_index_func:
+            result = self.ensure_index_func()
+            if result and not result.get("success"):
+                for file_path in file_paths:
+                    self._fail(batch_id, file_path, "index", f"Search index unavailable: {result.get('error')}")
+                return self._publish(batch_id)
+        
+        for file_path in file_paths:
+            self._upload_pool.submit(self._upload, batch_id, file_path)
+        
+        logger.info(f"Bulk ingestion batch {batch_id} started with {len(file_paths)} files")
+        return self._publish(batch_id)
+
+    def get_batch(self, batch_id):
+        """Return a snapshot of a batch's status, or None if unknown."""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            snapshot = {key: value for key, value in batch.items() if not key.startswith("_")}
+            snapshot["files"] = [dict(entry, timings=dict(entry["timings"])) for entry in batch["files"].values()]
+            snapshot["counts"] = dict(batch["counts"])
+            return snapshot
+
+    def _publish(self, batch_id):
+        """Write the batch's current status to the job store and return it."""
+        batch = self.get_batch(batch_id)
+        if self.job_store is not None:
+            self.job_store.save(batch)
+        return batch
+
+    def shutdown(self, wait=True):
+        self._upload_pool.shutdown(wait=wait)
+        self._extract_pool.shutdown(wait=wait)
+        if self._indexer is None:
+            return
+        self._index_queue.put(None)
+        if wait:
+            self._indexer.join()
+
+    # -- stages --------------------------------------------------------------
+
+    def _set_stage(self, batch_id, file_path, stage):
+        with self._lock:
+            entry = self._batches[batch_id]["files"][file_path]
+            entry["stage"] = stage
+            entry["status"] = "running"
+
+    def _record_timing(self, batch_id, file_path, stage, started):
+        with self._lock:
+            self._batches[batch_id]["files"][file_path]["timings"][stage] = round(time.monotonic() - started, 3)
+
+    def _claim(self, batch_id, file_path):
+        """
+        Claim the file's content in the registry.
+        
+        Returns:
+            The document ID to use and whether it belongs to already-ingested content
+            
+        Raises:
+            TimeoutError: If the content is still being ingested elsewhere
+        """
+        doc_id = str(uuid.uuid4())
+        if not self.registry:
+            return doc_id, False
+        try:
+            content_hash = self.hash_func(file_path)
+            metadata = {"file_name": os.path.basename(file_path)}
+            existing = self.registry.claim(content_hash, doc_id, metadata)
+            if existing is not None and existing["status"] == "processing":
+                existing = self.registry.wait_for_claim(content_hash, doc_id, metadata,
+                                                        self.claim_wait_seconds, self.claim_poll_seconds)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            logger.warning(f"Document registry unavailable, ingesting {file_path} without deduplication: {str(e)}")
+            return doc_id, False
+        
+        with self._lock:
+            entry = self._batches[batch_id]["files"][file_path]
+            entry["content_hash"] = content_hash
+            entry["deduplicated"] = existing is not None
+        return (existing["document_id"], True) if existing else (doc_id, False)
+
+    def _upload(self, batch_id, file_path):
+        started = time.monotonic()
+        self._set_stage(batch_id, file_path, "upload")
+        try:
+            doc_id, duplicate = self._claim(batch_id, file_path)
+        except TimeoutError as e:
+            self._record_timing(batch_id, file_path, "upload", started)
+            self._fail(batch_id, file_path, "upload", str(e))
+            return
+        with self._lock:
+            self._batches[batch_id]["files"][file_path]["document_id"] = doc_id
+        if duplicate:
+            self._record_timing(batch_id, file_path, "upload", started)
+            self._complete(batch_id, file_path, {})
+            return
+        
+        try:
+            upload_result = self.upload_func(file_path)
+        except Exception as e:
+            upload_result = {"success": False, "error": str(e)}
+        self._record_timing(batch_id, file_path, "upload", started)
+        
+        if not upload_result.get("success"):
+            self._fail(batch_id, file_path, "upload", upload_result.get("error"))
+            return
+        with self._lock:
+            bot_id = self._batches[batch_id]["bot_id"]
+        upload_result = dict(upload_result, document_id=doc_id, bot_ids=[bot_id] if bot_id else [])
+        self._extract_pool.submit(self._extract, batch_id, file_path, upload_result)
+
+    def _extract(self, batch_id, file_path, upload_result):
+        started = time.monotonic()
+        self._set_stage(batch_id, file_path, "extract")
+        try:
+            extract_result = self.extract_func(upload_result)
+        except Exception as e:
+            extract_result = {"success": False, "error": str(e)}
+        self._record_timing(batch_id, file_path, "extract", started)
+        
+        if not extract_result.get("success"):
+            self._fail(batch_id, file_path, "extract", extract_result.get("error"))
+            return
+        
+        doc_id = upload_result["document_id"]
+        try:
+            passages = self.build_passages_func(doc_id, upload_result, extract_result)
+        except Exception as e:
+            self._fail(batch_id, file_path, "index", str(e))
+            return
+        
+        self._set_stage(batch_id, file_path, "index")
+        self._index_queue.put((batch_id, file_path, doc_id, passages, time.monotonic()))
+
+    def _index_loop(self):
+        pending = []
+        pending_passages = 0
+        oldest = None
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0.0, self.index_flush_seconds - (time.monotonic() - oldest))
+            try:
+                item = self._index_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            
+            if item is None:
+                if pending:
+                    self._flush_index(pending)
+                return
+            
+            if item:
+                if not pending:
+                    oldest = time.monotonic()
+                pending.append(item)
+                pending_passages += len(item[3])
+            
+            if pending and (item is False
+                            or len(pending) >= self.index_batch_documents
+                            or pending_passages >= self.index_batch_passages
+                            or time.monotonic() - oldest >= self.index_flush_seconds):
+                self._flush_index(pending)
+                pending = []
+                pending_passages = 0
+
+    def _flush_index(self, items):
+        passages_by_document = {doc_id: passages for _, _, doc_id, passages, _ in items}
+        try:
+            outcome = self.index_batch_func(passages_by_document)
+        except Exception as e:
+            logger.error(f"Bulk index request failed: {str(e)}", exc_info=True)
+            for batch_id, file_path, _, _, _ in items:
+                self._fail(batch_id, file_path, "index", str(e))
+            return
+        
+        for batch_id, file_path, doc_id, _, queued_at in items:
+            self._record_timing(batch_id, file_path, "index", queued_at)
+            result = outcome.get(doc_id, {})
+            if result.get("failed_keys"):
+                self._fail(batch_id, file_path, "index", f"Failed passages: {result['failed_keys']}")
+            else:
+                self._complete(batch_id, file_path, result)
+
+    # -- bookkeeping ---------------------------------------------------------
+
+    def _complete(self, batch_id, file_path, result):
+        with self._lock:
+            entry = self._batches[batch_id]["files"][file_path]
+            entry["status"] = "completed"
+            entry["chunk_count"] = result.get("chunk_count", 0)
+            self._batches[batch_id]["counts"]["completed"] += 1
+            claimed_hash = entry["content_hash"] if not entry["deduplicated"] else None
+        if claimed_hash:
+            try:
+                self.registry.mark_ready(claimed_hash, {"chunk_count": result.get("chunk_count", 0)})
+            except Exception as e:
+                logger.warning(f"Could not mark content {claimed_hash[:12]} ready: {str(e)}")
+        self._file_done(batch_id, file_path)
+
+    def _fail(self, batch_id, file_path, stage, error):
+        logger.error(f"Bulk batch {batch_id}: {os.path.basename(file_path)} failed at {stage}: {error}")
+        with self._lock:
+            entry = self._batches[batch_id]["files"][file_path]
+            entry["stage"] = stage
+            entry["status"] = "failed"
+            entry["error"] = error
+            self._batches[batch_id]["counts"]["failed"] += 1
+            claimed_hash = entry["content_hash"] if not entry["deduplicated"] else None
+        if claimed_hash:
+            # Let a later upload of the same content retry ingestion
+            try:
+                self.registry.release(claimed_hash)
+            except Exception as e:
+                logger.warning(f"Could not release content claim {claimed_hash[:12]}: {str(e)}")
+        self._file_done(batch_id, file_path)
+
+    def _file_done(self, batch_id, file_path):
+        with self._lock:
+            batch = self._batches[batch_id]
+            cleanup = batch["_cleanup"]
+            counts = batch["counts"]
+            finished = counts["completed"] + counts["failed"] == counts["total"]
+        
+        if cleanup:
+            try:
+                cleanup(file_path)
+            except Exception as e:
+                logger.warning(f"Cleanup of {file_path} failed: {str(e)}")
+        
+        if finished:
+            self._finish_batch(batch_id)
+        else:
+            self._publish(batch_id)
+
+    def _finish_batch(self, batch_id):
+        with self._lock:
+            batch = self._batches[batch_id]
+            # Duplicate files in one batch share a document ID
+            document_ids = list(dict.fromkeys(
+                entry["document_id"] for entry in batch["files"].values() if entry["status"] == "completed"
+            ))
+            bot_id = batch["bot_id"]
+        
+        bot = None
+        if bot_id and document_ids and self.attach_func:
+            try:
+                bot = self.attach_func(bot_id, document_ids)
+            except Exception as e:
+                logger.error(f"Error attaching documents to bot {bot_id}: {str(e)}")
+        
+        with self._lock:
+            batch["bot"] = bot
+            batch["status"] = "completed" if batch["counts"]["failed"] == 0 else "completed_with_errors"
+            batch["finished_at"] = datetime.now(pytz.UTC).isoformat()
+            batch["duration"] = round(time.monotonic() - batch["_started"], 3)
+        self._publish(batch_id)
+        with self._lock:
+            self._finished_order.append(batch_id)
+            while len(self._finished_order) > self.max_finished_batches:
+                self._batches.pop(self._finished_order.pop(0), None)
+        logger.info(f"Bulk ingestion batch {batch_id} finished: {batch['counts']}")
@@ -1,12 +1,19 @@
 import os
+import time
+import asyncio
+import uuid
 import logging
 import traceback
-from azure.ai.inference import ChatCompletionsClient
 from azure.ai.inference.models import SystemMessage, UserMessage, AssistantMessage
-from azure.core.credentials import AzureKeyCredential
-from document_processor import search_documents
+from document_processor import search_documents, search_documents_async
 from dotenv import load_dotenv
-from translation_core import SimpleTranslator  # Import translator
+from azure_clients import clients
+from translation_core import SimpleTranslator
+from answer_cache import AnswerCache, document_set_hash, normalize_query
+from conversation_store import ConversationStore, count_tokens
+from context_packer import (
+    pack_context, CONTEXT_MAX_TOKENS, CONTEXT_MIN_SCORE_RATIO, CONTEXT_SCORE_GAP_RATIO, CONTEXT_DUPLICATE_THRESHOLD
+)
 
 # Load environment variables
 load_dotenv()
@@ -18,9 +25,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize translator
-translator = SimpleTranslator()
-logger.info("Translator initialized successfully")
+# One translator per process, shared with the app and created on first use
+clients.register("translator", SimpleTranslator)
+translator = clients.proxy("translator")
+
+# Cache of generated answers for repeated questions
+answer_cache = AnswerCache()
+
+# Passages retrieved per question; pack_context decides how many reach the prompt
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 8))
+
+# Multi-turn chat sessions; the history sent to the model is trimmed to a token budget
+conversation_store = ConversationStore()
+HISTORY_MAX_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", 1000))
+PASSAGE_REUSE_SECONDS = int(os.getenv("CONVERSATION_PASSAGE_REUSE_SECONDS", 1800))
+FOLLOW_UP_MAX_WORDS = int(os.getenv("FOLLOW_UP_MAX_WORDS", 12))
+FOLLOW_UP_PREFIXES = ("and ", "also ", "what about", "how about", "tell me more", "more ", "explain", "elaborate",
+                      "can you explain", "what else", "so ")
+FOLLOW_UP_REFERENCES = {"it", "its", "that", "this", "these", "those", "they", "them", "their", "above", "same"}
 
 # Get credentials from environment variables
 OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -35,19 +57,36 @@ if not OPENAI_ENDPOINT or not OPENAI_KEY:
     OPENAI_KEY = "DDIhf3uFxLmFwtZwsDGOwDhq4HW6AcxoanaLkEFfqXeoZ59MA00RJQQJ99BCACHYHv6XJ3w3AAAAACOGS2dy"
     MODEL_NAME = "gpt-4"
 
-logger.info(f"Initializing Azure OpenAI client with endpoint: {OPENAI_ENDPOINT}")
 logger.debug(f"Using model: {MODEL_NAME}")
 
-# Initialize Azure OpenAI client
-try:
-    client = ChatCompletionsClient(
-        endpoint=OPENAI_ENDPOINT,
-        credential=AzureKeyCredential(OPENAI_KEY)
-    )
-    logger.debug("OpenAI client initialized successfully")
-except Exception as e:
-    logger.critical(f"Failed to initialize OpenAI client: {str(e)}", exc_info=True)
-    raise
+def _create_chat_client():
+    from azure.ai.inference import ChatCompletionsClient
+    from azure.core.credentials import AzureKeyCredential
+    
+    logger.info(f"Initializing Azure OpenAI client with endpoint: {OPENAI_ENDPOINT}")
+    try:
+        chat_client = ChatCompletionsClient(
+            endpoint=OPENAI_ENDPOINT,
+            credential=AzureKeyCredential(OPENAI_KEY)
+        )
+        logger.debug("OpenAI client initialized successfully")
+        return chat_client
+    except Exception as e:
+        logger.critical(f"Failed to initialize OpenAI client: {str(e)}", exc_info=True)
+        raise
+
+def _create_async_chat_client():
+    from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+    from azure.core.credentials import AzureKeyCredential
+    
+    logger.info(f"Initializing async Azure OpenAI client with endpoint: {OPENAI_ENDPOINT}")
+    return AsyncChatCompletionsClient(endpoint=OPENAI_ENDPOINT, credential=AzureKeyCredential(OPENAI_KEY))
+
+# Azure OpenAI clients, created on first use; the async one is created inside
+# the event loop of the ASGI server (see asgi.py)
+clients.register("chat_completions", _create_chat_client)
+clients.register("chat_completions_async", _create_async_chat_client)
+client = clients.proxy("chat_completions")
 
 # Define system prompt
 SYSTEM_PROMPT = """
@@ -64,23 +103,204 @@ Do not make up facts or information not present in the context.
 
 logger.debug(f"System prompt defined: {len(SYSTEM_PROMPT)} characters")
 
+def get_model_settings(max_search_results):
+    """Settings that change the generated answer; part of the answer cache key."""
+    return {"model": MODEL_NAME, "max_tokens": 200, "temperature": 0.7, "max_search_results": max_search_results,
+            "context": [CONTEXT_MAX_TOKENS, CONTEXT_MIN_SCORE_RATIO, CONTEXT_SCORE_GAP_RATIO, CONTEXT_DUPLICATE_THRESHOLD]}
+
 # Initialize conversation history - changing to a function to get a fresh history each time
 def get_initial_conversation_history():
     return [SystemMessage(content=SYSTEM_PROMPT)]
 
-def generate_rag_response(query, document_ids=None, max_search_results=3, language='en'):
+def is_follow_up(query):
+    """
+    Whether a short query may be a follow-up to the previous turn (e.g. "what about
+    the price?"). A guess: it widens retrieval but never replaces it.
+    """
+    words = normalize_query(query).split()
+    if not words or len(words) > FOLLOW_UP_MAX_WORDS:
+        return False
+    text = " ".join(words)
+    return text.startswith(FOLLOW_UP_PREFIXES) or any(word.strip(",.;:'\"") in FOLLOW_UP_REFERENCES for word in words)
+
+def chat_session_id(data):
+    """
+    Session of a chat request: the session_id the client sent back, a new one
+    when the client asks for a session with "start_session", otherwise None
+    (a one-shot question that is not stored).
+    """
+    if data.get('session_id'):
+        return data['session_id']
+    if data.get('start_session'):
+        return str(uuid.uuid4())
+    return None
+
+def load_session_context(session_id, query, document_ids, reuse_context=None):
+    """
+    Load a chat session for a new question.
+    
+    Args:
+        session_id (str): Session to continue, or None for a stateless request
+        query (str): The new question in English
+        document_ids (list): Document scope of the request; passages are only reused within the same scope
+        reuse_context (bool, optional): True to answer from the previous passages without
+            searching, False to ignore them. When None, a query that is_follow_up is
+            searched together with the previous question and the previous passages are
+            kept as extra candidates.
+    
+    Returns:
+        tuple: (history messages trimmed to CONVERSATION_HISTORY_TOKENS,
+                search results to reuse instead of searching or None,
+                query to search with when not reusing,
+                previous passages to merge with the new search results or None)
+    """
+    session = conversation_store.get(session_id) if session_id else None
+    if not session:
+        return [], None, query, None
+    
+    turns = conversation_store.get_history(session_id, HISTORY_MAX_TOKENS) if session["turns"] else []
+    history = [UserMessage(content=turn["content"]) if turn["role"] == "user" else AssistantMessage(content=turn["content"])
+               for turn in turns]
+    
+    passages = session.get("passages")
+    previous_results = None
+    if (passages and passages["results"]
+            and passages["scope"] == document_set_hash(document_ids)
+            and time.time() - passages["retrieved_at"] < PASSAGE_REUSE_SECONDS):
+        previous_results = passages["results"]
+    
+    if reuse_context and previous_results:
+        logger.info(f"Reusing {len(previous_results)} passages from session {session_id}")
+        reused = {"success": True, "query": query, "count": len(previous_results),
+                  "results": previous_results, "reused": True}
+        return history, reused, query, None
+    
+    if reuse_context is None and is_follow_up(query):
+        # Search with the previous question too, so "what about the price?" finds the right product
+        previous = [turn["content"] for turn in session["turns"] if turn["role"] == "user"]
+        search_query = f"{previous[-1]} {query}" if previous else query
+        return history, None, search_query, previous_results
+    return history, None, query, None
+
+def merge_session_passages(search_results, previous_results, limit):
+    """
+    Add a follow-up's previous passages after the new search results, up to limit
+    results in all. The previous passages keep their own score but lose their
+    fusion ranking, so new results come first.
+    """
+    if not previous_results or not search_results.get("success"):
+        return search_results
+    seen = {result.get("chunk_id") for result in search_results["results"]}
+    carried = [{key: value for key, value in result.items() if key not in ("fused_score", "relevance")}
+               for result in previous_results if result.get("chunk_id") not in seen]
+    results = (search_results["results"] + carried)[:max(limit, len(search_results["results"]))]
+    return dict(search_results, results=results, count=len(results))
+
+def retrieve_for_turn(search_query, document_ids, bot_id, max_search_results, reused_results, previous_results):
+    """Search results for a turn: the reused passages, or a search merged with a follow-up's previous passages."""
+    if reused_results is not None:
+        return reused_results
+    logger.debug(f"Searching for documents with query: '{search_query}', max results: {max_search_results}")
+    search_results = search_documents(search_query, top=max_search_results, document_ids=document_ids, bot_id=bot_id)
+    return merge_session_passages(search_results, previous_results, max_search_results)
+
+def save_session_turn(session_id, query, answer, search_results, document_ids):
+    """Record a turn of a session; newly retrieved passages replace the session's previous ones."""
+    if not session_id:
+        return
+    try:
+        passages = None if search_results.get("reused") else search_results.get("results", [])
+        conversation_store.append_turn(session_id, query, answer, passages=passages,
+                                       scope=document_set_hash(document_ids))
+    except Exception as e:
+        logger.error(f"Could not save turn of session {session_id}: {str(e)}")
+
+def build_rag_prompt(query, search_results):
+    """
+    Build the context-augmented user prompt and the source list for a query.
+    
+    Args:
+        query (str): User's query in English
+        search_results (dict): Result of search_documents
+    
+    Returns:
+        tuple: (prompt_with_context, sources)
+    """
+    passages, stats = pack_context(search_results.get("results", []))
+    context = "\n\n".join(passage["text"] for passage in passages)
+    
+    sources = [{
+        "file_name": passage.get("file_name", "Unknown document"),
+        "page_count": passage.get("page_count", 0),
+        "page_numbers": passage.get("page_numbers", []),
+        "score": passage.get("score", 0)
+    } for passage in passages]
+
+    logger.info(f"Context packed with {stats['tokens']} tokens from {stats['selected']} of {stats['candidates']} "
+                f"passages ({stats['duplicates']} duplicates, stopped by {stats['stopped_by'] or 'end of results'})")
+    
+    # Prepare user message with context
+    prompt_with_context = f"""
+I need information about the following question:
+
+Question: {query}
+
+Here is the relevant information from our support documentation:
+
+{context}
+
+Please provide a comprehensive answer based only on this information.
+"""
+    return prompt_with_context, sources
+
+def log_prompt_tokens(messages, label="Prompt"):
+    """Log the token count of the messages sent to the model and return it."""
+    tokens = sum(count_tokens(message.content) for message in messages)
+    logger.info(f"{label} tokens: {tokens} in {len(messages)} messages")
+    return tokens
+
+def translate_for_user(text, language, direction='from_en'):
+    """
+    Translate text between English and the user's language, returning the input on failure.
+    
+    Args:
+        text (str): Text to translate
+        language (str): The user's language code
+        direction (str): 'from_en' to translate a reply, 'to_en' to translate a query
+    """
+    if language == 'en' or not text:
+        return text
+    
+    from_language, to_language = ('en', language) if direction == 'from_en' else (language, 'en')
+    try:
+        translation_result = translator.translate_text(text, from_language=from_language, to_language=to_language)
+        if translation_result.get('success'):
+            return translation_result.get('translated_text', text)
+        logger.warning(f"Translation failed: {translation_result.get('error')}")
+    except Exception as e:
+        logger.error(f"Error translating text: {str(e)}")
+    return text
+
+def generate_rag_response(query, document_ids=None, max_search_results=None, language='en', bot_id=None,
+                          session_id=None, reuse_context=None):
     """
     Generate a response using RAG with the Azure AI Inference SDK while retaining conversation history.
     
     Args:
         query (str): User's query in any language
         document_ids (list, optional): Specific document IDs to search within
-        max_search_results (int, optional): Maximum number of search results to return
+        bot_id (str, optional): Bot whose documents to search, filtered in the index
+        max_search_results (int, optional): Passages to retrieve before packing the context
+            (CONTEXT_CANDIDATES by default)
         language (str, optional): Language code of the user's query. Default is 'en' (English)
+        session_id (str, optional): Chat session whose earlier turns are sent as history
+        reuse_context (bool, optional): True to answer from the session's previous passages
+            without searching; see load_session_context for the default
     """
     sources = []
     original_query = query
     original_language = language
+    max_search_results = max_search_results or CONTEXT_CANDIDATES
     
     # Get a fresh conversation history for each request to avoid accumulation issues
     conversation_history = get_initial_conversation_history()
@@ -104,9 +324,25 @@ def generate_rag_response(query, document_ids=None, max_search_results=3, langua
                 logger.error(f"Error translating query: {str(e)}")
                 # Continue with original query if translation fails
         
+        history, reused_results, search_query, previous_results = load_session_context(session_id, query, document_ids,
+                                                                                       reuse_context)
+        conversation_history.extend(history)
+        
+        # Serve repeated questions from the answer cache; answers that depend on
+        # earlier turns are not cacheable
+        cache_key = answer_cache.make_key(query, document_ids, language, get_model_settings(max_search_results))
+        cached_answer = answer_cache.get(cache_key) if not history else None
+        if cached_answer is not None:
+            logger.info("Answer served from cache")
+            # The session history is kept in English; the cached answer is in the user's language
+            english_answer = cached_answer.pop("answer_en", cached_answer["answer"])
+            save_session_turn(session_id, query, english_answer, {"reused": True}, document_ids)
+            cached_answer["cached"] = True
+            return cached_answer
+        
         # Document processing
-        logger.debug(f"Searching for documents with query: '{query}', max results: {max_search_results}")
-        search_results = search_documents(query, top=max_search_results, document_ids=document_ids)
+        search_results = retrieve_for_turn(search_query, document_ids, bot_id, max_search_results, reused_results,
+                                           previous_results)
         
         if not search_results.get("success"):
             logger.error(f"Search failed: {search_results.get('error')}")
@@ -143,11 +379,10 @@ Remember to be professional, friendly, and helpful at all times.
 """
             try:
                 # Call Azure OpenAI for a general response
+                support_messages = [SystemMessage(content=support_prompt)] + history + [UserMessage(content=query)]
+                log_prompt_tokens(support_messages)
                 chat_response = client.complete(
-                    messages=[
-                        SystemMessage(content=support_prompt),
-                        UserMessage(content=query)
-                    ],
+                    messages=support_messages,
                     model=AZURE_OPENAI_DEPLOYMENT,
                     temperature=0.7,
                     max_tokens=200
@@ -158,6 +393,7 @@ Remember to be professional, friendly, and helpful at all times.
                     response_message = chat_response.choices[0].message
                     conversation_history.append(UserMessage(content=original_query))
                     conversation_history.append(response_message)
+                    save_session_turn(session_id, query, response_message.content, search_results, document_ids)
                     
                     # Translate response back to original language if needed
                     final_response = response_message.content
@@ -169,9 +405,12 @@ Remember to be professional, friendly, and helpful at all times.
                         except Exception as e:
                             logger.error(f"Error translating response: {str(e)}")
                     
+                    if not history:
+                        answer_cache.set(cache_key, {"answer": final_response, "answer_en": response_message.content, "sources": []})
                     return {
                         "answer": final_response,
-                        "sources": []
+                        "sources": [],
+                        "cached": False
                     }
                 else:
                     # Fallback if the chat response is empty
@@ -219,35 +458,7 @@ Remember to be professional, friendly, and helpful at all times.
         logger.info(f"Found {result_count} relevant document sections")
         
         # Build context
-        all_highlights = []
-        for result in search_results.get("results", []):
-            highlights = result.get("highlights", [])
-            logger.debug(f"Result score: {result.get('score', 0)}, highlights: {len(highlights)}")
-            all_highlights.extend(highlights)
-        
-        context = "\n".join(all_highlights)
-        
-        sources = [{
-            "file_name": result.get("file_name", "Unknown document"),
-            "page_count": result.get("page_count", 0),
-            "score": result.get("score", 0)
-        } for result in search_results.get("results", [])]
-
-        # Log context length
-        logger.info(f"Context built with {len(context)} characters from {len(all_highlights)} highlights")
-        
-        # Prepare user message with context
-        prompt_with_context = f"""
-I need information about the following question:
-
-Question: {query}
-
-Here is the relevant information from our support documentation:
-
-{context}
-
-Please provide a comprehensive answer based only on this information.
-"""
+        prompt_with_context, sources = build_rag_prompt(query, search_results)
         
         logger.debug(f"Constructed prompt with context of {len(prompt_with_context)} characters")
         
@@ -257,6 +468,7 @@ Please provide a comprehensive answer based only on this information.
 
         # Log that we're calling the API
         logger.info(f"Calling Azure OpenAI API with model: {MODEL_NAME}")
+        log_prompt_tokens(conversation_history)
         
         # Call OpenAI using the SDK client
         response = client.complete(
@@ -271,10 +483,11 @@ Please provide a comprehensive answer based only on this information.
         answer = response.choices[0].message.content
         token_usage = getattr(response, 'usage', None)
         if token_usage:
-            logger.debug(f"Token usage - Prompt: {token_usage.prompt_tokens}, Completion: {token_usage.completion_tokens}, Total: {token_usage.total_tokens}")
+            logger.info(f"Token usage - Prompt: {token_usage.prompt_tokens}, Completion: {token_usage.completion_tokens}, Total: {token_usage.total_tokens}")
         
         assistant_message = AssistantMessage(content=answer)
         conversation_history.append(assistant_message)
+        save_session_turn(session_id, query, answer, search_results, document_ids)
         
         # Log success
         logger.info(f"Successfully generated response with {len(answer)} characters")
@@ -297,9 +510,13 @@ Please provide a comprehensive answer based only on this information.
             except Exception as e:
                 logger.error(f"Error translating response: {str(e)}")
         
+        if not history:
+            answer_cache.set(cache_key, {"answer": final_response, "answer_en": answer, "sources": sources})
         return {
             "answer": final_response,
-            "sources": sources
+            "sources": sources,
+            "cached": False,
+            "context_reused": reused_results is not None
         }
 
     except Exception as e:
@@ -326,6 +543,326 @@ Please provide a comprehensive answer based only on this information.
             "sources": sources
         }
 
+def build_chat_messages(query, search_results, history):
+    """
+    Build the messages for the model: the RAG prompt when passages were found,
+    otherwise a general support prompt.
+    
+    Returns:
+        tuple: (messages, sources)
+    """
+    if search_results.get("results"):
+        prompt_with_context, sources = build_rag_prompt(query, search_results)
+        return get_initial_conversation_history() + history + [UserMessage(content=prompt_with_context)], sources
+    
+    logger.warning("No relevant search results found")
+    messages = [
+        SystemMessage(content=f"""
+You are a helpful customer support assistant. The user has asked: "{query}" 
+No specific information was found in our knowledge base for this query.
+Please provide a helpful and friendly response anyway. If the query is a greeting or general question, 
+respond appropriately. If it's a specific question you don't have information about, 
+acknowledge that and offer to help in other ways a customer support agent would.
+Remember to be professional, friendly, and helpful at all times.
+"""),
+        *history,
+        UserMessage(content=query)
+    ]
+    return messages, []
+
+def _stream_completion_text(stream):
+    """Yield the content deltas of a streaming chat completion."""
+    for update in stream:
+        choices = getattr(update, 'choices', None)
+        if not choices:
+            continue
+        delta = getattr(choices[0], 'delta', None)
+        content = getattr(delta, 'content', None) if delta else None
+        if content:
+            yield content
+
+def generate_rag_response_stream(query, document_ids=None, max_search_results=None, language='en', completion_client=None,
+                                 bot_id=None, session_id=None, reuse_context=None):
+    """
+    Streaming variant of generate_rag_response.
+    
+    Yields event dicts in order: one 'sources' event as soon as retrieval is done,
+    'token' events as answer text arrives from the model, and a final 'done' event
+    carrying the full answer. Errors are reported as an 'error' event.
+    
+    Tokens are only forwarded as they arrive for English; for other languages the
+    answer is buffered and translated as a whole, then emitted as a single token.
+    
+    Args:
+        query (str): User's query in any language
+        document_ids (list, optional): Specific document IDs to search within
+        bot_id (str, optional): Bot whose documents to search, filtered in the index
+        max_search_results (int, optional): Passages to retrieve before packing the context
+            (CONTEXT_CANDIDATES by default)
+        language (str, optional): Language code of the user's query. Default is 'en' (English)
+        completion_client (optional): Client exposing complete(..., stream=True); defaults to the module client
+        session_id (str, optional): Chat session whose earlier turns are sent as history
+        reuse_context (bool, optional): True to answer from the session's previous passages without searching
+    """
+    completion_client = completion_client or client
+    max_search_results = max_search_results or CONTEXT_CANDIDATES
+    
+    try:
+        logger.info(f"Received streaming query: '{query}' in language: {language}")
+        query = translate_for_user(query, language, direction='to_en')
+        history, reused_results, search_query, previous_results = load_session_context(session_id, query, document_ids,
+                                                                                       reuse_context)
+        
+        cache_key = answer_cache.make_key(query, document_ids, language, get_model_settings(max_search_results))
+        cached_answer = answer_cache.get(cache_key) if not history else None
+        if cached_answer is not None:
+            logger.info("Streaming answer served from cache")
+            # The session history is kept in English; the cached answer is in the user's language
+            english_answer = cached_answer.pop("answer_en", cached_answer["answer"])
+            save_session_turn(session_id, query, english_answer, {"reused": True}, document_ids)
+            yield {"type": "sources", "sources": cached_answer["sources"]}
+            yield {"type": "token", "content": cached_answer["answer"]}
+            yield {"type": "done", "answer": cached_answer["answer"], "cached": True}
+            return
+        
+        search_results = retrieve_for_turn(search_query, document_ids, bot_id, max_search_results, reused_results,
+                                           previous_results)
+        if not search_results.get("success"):
+            logger.error(f"Search failed: {search_results.get('error')}")
+            yield {"type": "error", "error": translate_for_user(
+                "I encountered an error while searching for information. Please try again.", language)}
+            return
+        
+        messages, sources = build_chat_messages(query, search_results, history)
+        
+        yield {"type": "sources", "sources": sources}
+        
+        logger.info(f"Calling Azure OpenAI API with streaming, model: {MODEL_NAME}")
+        log_prompt_tokens(messages)
+        stream = completion_client.complete(
+            messages=messages,
+            max_tokens=200,
+            temperature=0.7,
+            top_p=1.0,
+            model=MODEL_NAME,
+            stream=True
+        )
+        
+        chunks = []
+        for content in _stream_completion_text(stream):
+            chunks.append(content)
+            if language == 'en':
+                yield {"type": "token", "content": content}
+        
+        answer = "".join(chunks)
+        generated = bool(answer)
+        if not generated:
+            answer = get_fallback_response(query)
+            if language == 'en':
+                yield {"type": "token", "content": answer}
+        elif session_id:
+            save_session_turn(session_id, query, answer, search_results, document_ids)
+        
+        english_answer = answer
+        if language != 'en':
+            answer = translate_for_user(answer, language)
+            yield {"type": "token", "content": answer}
+        
+        if generated and not history:
+            answer_cache.set(cache_key, {"answer": answer, "answer_en": english_answer, "sources": sources})
+        
+        logger.info(f"Successfully streamed response with {len(answer)} characters")
+        yield {"type": "done", "answer": answer, "cached": False, "context_reused": reused_results is not None}
+    
+    except Exception as e:
+        logger.error(f"Error in streaming RAG response generation: {str(e)}", exc_info=True)
+        yield {"type": "error", "error": translate_for_user(
+            f"An error occurred while generating the response: {str(e)}", language)}
+
+async def translate_for_user_async(text, language, direction='from_en'):
+    """Async translate_for_user, through the translator's aiohttp session."""
+    if language == 'en' or not text:
+        return text
+    
+    from_language, to_language = ('en', language) if direction == 'from_en' else (language, 'en')
+    try:
+        translation_result = await translator.translate_text_async(text, from_language=from_language, to_language=to_language)
+        if translation_result.get('success'):
+            return translation_result.get('translated_text', text)
+        logger.warning(f"Translation failed: {translation_result.get('error')}")
+    except Exception as e:
+        logger.error(f"Error translating text: {str(e)}")
+    return text
+
+async def _retrieve_async(search_query, document_ids, bot_id, max_search_results, reused_results, previous_results):
+    if reused_results is not None:
+        return reused_results
+    search_results = await search_documents_async(search_query, top=max_search_results, document_ids=document_ids,
+                                                  bot_id=bot_id)
+    return merge_session_passages(search_results, previous_results, max_search_results)
+
+async def generate_rag_response_async(query, document_ids=None, max_search_results=None, language='en', bot_id=None,
+                                      session_id=None, reuse_context=None, completion_client=None):
+    """
+    Async variant of generate_rag_response for the ASGI entry point (asgi.py).
+    
+    Translation, search and the model call use async clients, so a request
+    waiting on them holds no thread and one process can serve many concurrent
+    chats. Session reads and writes, which may wait on the SQLite store, run in
+    worker threads. Takes the same arguments and returns the same dict.
+    
+    Args:
+        completion_client (optional): Async client exposing complete(); defaults to the shared async client
+    """
+    completion_client = completion_client or clients.get("chat_completions_async")
+    max_search_results = max_search_results or CONTEXT_CANDIDATES
+    
+    try:
+        logger.info(f"Received async query: '{query}' in language: {language}")
+        query = await translate_for_user_async(query, language, direction='to_en')
+        history, reused_results, search_query, previous_results = await asyncio.to_thread(
+            load_session_context, session_id, query, document_ids, reuse_context)
+        
+        cache_key = answer_cache.make_key(query, document_ids, language, get_model_settings(max_search_results))
+        cached_answer = answer_cache.get(cache_key) if not history else None
+        if cached_answer is not None:
+            logger.info("Answer served from cache")
+            # The session history is kept in English; the cached answer is in the user's language
+            english_answer = cached_answer.pop("answer_en", cached_answer["answer"])
+            await asyncio.to_thread(save_session_turn, session_id, query, english_answer, {"reused": True},
+                                    document_ids)
+            cached_answer["cached"] = True
+            return cached_answer
+        
+        search_results = await _retrieve_async(search_query, document_ids, bot_id, max_search_results,
+                                               reused_results, previous_results)
+        if not search_results.get("success"):
+            logger.error(f"Search failed: {search_results.get('error')}")
+            return {"answer": await translate_for_user_async(
+                "I encountered an error while searching for information. Please try again.", language), "sources": []}
+        
+        messages, sources = build_chat_messages(query, search_results, history)
+        logger.info(f"Calling Azure OpenAI API asynchronously, model: {MODEL_NAME}")
+        log_prompt_tokens(messages)
+        response = await completion_client.complete(
+            messages=messages,
+            max_tokens=200,
+            temperature=0.7,
+            top_p=1.0,
+            model=MODEL_NAME
+        )
+        token_usage = getattr(response, 'usage', None)
+        if token_usage:
+            logger.info(f"Token usage - Prompt: {token_usage.prompt_tokens}, Completion: {token_usage.completion_tokens}, Total: {token_usage.total_tokens}")
+        
+        answer = response.choices[0].message.content if response and response.choices else None
+        if not answer:
+            return {"answer": await translate_for_user_async(get_fallback_response(query), language), "sources": []}
+        await asyncio.to_thread(save_session_turn, session_id, query, answer, search_results, document_ids)
+        
+        final_response = await translate_for_user_async(answer, language)
+        if not history:
+            answer_cache.set(cache_key, {"answer": final_response, "answer_en": answer, "sources": sources})
+        logger.info(f"Successfully generated response with {len(answer)} characters")
+        return {
+            "answer": final_response,
+            "sources": sources,
+            "cached": False,
+            "context_reused": reused_results is not None
+        }
+    
+    except Exception as e:
+        logger.error(f"Error in async RAG response generation: {str(e)}", exc_info=True)
+        return {"answer": await translate_for_user_async(
+            f"An error occurred while generating the response: {str(e)}", language), "sources": []}
+
+async def generate_rag_response_stream_async(query, document_ids=None, max_search_results=None, language='en',
+                                             bot_id=None, session_id=None, reuse_context=None, completion_client=None):
+    """
+    Async variant of generate_rag_response_stream; yields the same events.
+    
+    Args:
+        completion_client (optional): Async client exposing complete(..., stream=True); defaults to the shared async client
+    """
+    completion_client = completion_client or clients.get("chat_completions_async")
+    max_search_results = max_search_results or CONTEXT_CANDIDATES
+    
+    try:
+        logger.info(f"Received async streaming query: '{query}' in language: {language}")
+        query = await translate_for_user_async(query, language, direction='to_en')
+        history, reused_results, search_query, previous_results = await asyncio.to_thread(
+            load_session_context, session_id, query, document_ids, reuse_context)
+        
+        cache_key = answer_cache.make_key(query, document_ids, language, get_model_settings(max_search_results))
+        cached_answer = answer_cache.get(cache_key) if not history else None
+        if cached_answer is not None:
+            logger.info("Streaming answer served from cache")
+            # The session history is kept in English; the cached answer is in the user's language
+            english_answer = cached_answer.pop("answer_en", cached_answer["answer"])
+            await asyncio.to_thread(save_session_turn, session_id, query, english_answer, {"reused": True},
+                                    document_ids)
+            yield {"type": "sources", "sources": cached_answer["sources"]}
+            yield {"type": "token", "content": cached_answer["answer"]}
+            yield {"type": "done", "answer": cached_answer["answer"], "cached": True}
+            return
+        
+        search_results = await _retrieve_async(search_query, document_ids, bot_id, max_search_results,
+                                               reused_results, previous_results)
+        if not search_results.get("success"):
+            logger.error(f"Search failed: {search_results.get('error')}")
+            yield {"type": "error", "error": await translate_for_user_async(
+                "I encountered an error while searching for information. Please try again.", language)}
+            return
+        
+        messages, sources = build_chat_messages(query, search_results, history)
+        yield {"type": "sources", "sources": sources}
+        
+        logger.info(f"Calling Azure OpenAI API asynchronously with streaming, model: {MODEL_NAME}")
+        log_prompt_tokens(messages)
+        stream = await completion_client.complete(
+            messages=messages,
+            max_tokens=200,
+            temperature=0.7,
+            top_p=1.0,
+            model=MODEL_NAME,
+            stream=True
+        )
+        
+        chunks = []
+        async for update in stream:
+            choices = getattr(update, 'choices', None)
+            delta = getattr(choices[0], 'delta', None) if choices else None
+            content = getattr(delta, 'content', None) if delta else None
+            if content:
+                chunks.append(content)
+                if language == 'en':
+                    yield {"type": "token", "content": content}
+        
+        answer = "".join(chunks)
+        generated = bool(answer)
+        if not generated:
+            answer = get_fallback_response(query)
+            if language == 'en':
+                yield {"type": "token", "content": answer}
+        elif session_id:
+            await asyncio.to_thread(save_session_turn, session_id, query, answer, search_results, document_ids)
+        
+        english_answer = answer
+        if language != 'en':
+            answer = await translate_for_user_async(answer, language)
+            yield {"type": "token", "content": answer}
+        
+        if generated and not history:
+            answer_cache.set(cache_key, {"answer": answer, "answer_en": english_answer, "sources": sources})
+        
+        logger.info(f"Successfully streamed response with {len(answer)} characters")
+        yield {"type": "done", "answer": answer, "cached": False, "context_reused": reused_results is not None}
+    
+    except Exception as e:
+        logger.error(f"Error in async streaming RAG response generation: {str(e)}", exc_info=True)
+        yield {"type": "error", "error": await translate_for_user_async(
+            f"An error occurred while generating the response: {str(e)}", language)}
+
 def get_fallback_response(query):
     """Generate a fallback response based on the query type"""
     query_lower = query.lower()
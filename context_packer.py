@@ -0,0 +1,127 @@
+# context_packer.py
+import os
+import re
+import logging
+
+from conversation_store import count_tokens
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1500))
+CONTEXT_MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", 0.35))
+CONTEXT_SCORE_GAP_RATIO = float(os.getenv("CONTEXT_SCORE_GAP_RATIO", 0.5))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.8))
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text, size=3):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def passage_text(result):
+    """Text of a search result as it goes into the prompt."""
+    return "\n".join(highlight for highlight in result.get("highlights", []) if highlight)
+
+
+def _relevance_floor(relevances, min_score_ratio, gap_ratio):
+    """
+    Lowest relevance a passage may have: min_score_ratio, or higher where the
+    relevance distribution drops below gap_ratio of the next better passage.
+    """
+    previous = None
+    for relevance in sorted(relevances, reverse=True):
+        if relevance < min_score_ratio:
+            break
+        if previous and relevance < previous * gap_ratio:
+            return previous, "score_gap"
+        previous = relevance
+    return min_score_ratio, "min_score"
+
+
+def pack_context(results, max_tokens=None, min_score_ratio=None, gap_ratio=None, duplicate_threshold=None):
+    """
+    Select the passages that go into the prompt.
+
+    Passages are taken in rank order: fused_score when hybrid search set one,
+    otherwise score. Cutoffs use each passage's relevance, its score relative to
+    the best score of the retriever that found it ("relevance" when hybrid
+    search set one, otherwise score / best score). A passage is skipped when:
+      - its relevance is below min_score_ratio,
+      - its relevance is below a point where the relevance distribution drops
+        below gap_ratio of the next better passage (the rest is unlikely to be
+        relevant).
+    Passages are taken until the next one would exceed max_tokens. Passages
+    whose word trigrams overlap an already selected passage by
+    duplicate_threshold or more (Jaccard) are skipped. The best passage is always
+    kept, truncated to the budget if needed.
+
+    Args:
+        results (list): search_documents results with "score" and "highlights"
+        max_tokens (int): Token budget of the context (CONTEXT_MAX_TOKENS)
+        min_score_ratio (float): Lowest relevance (CONTEXT_MIN_SCORE_RATIO)
+        gap_ratio (float): Lowest relevance relative to the next better passage (CONTEXT_SCORE_GAP_RATIO)
+        duplicate_threshold (float): Trigram overlap at which a passage is a duplicate (CONTEXT_DUPLICATE_THRESHOLD)
+
+    Returns:
+        tuple: (selected results, each with its "text" and "tokens", stats dict)
+    """
+    max_tokens = max_tokens if max_tokens is not None else CONTEXT_MAX_TOKENS
+    min_score_ratio = min_score_ratio if min_score_ratio is not None else CONTEXT_MIN_SCORE_RATIO
+    gap_ratio = gap_ratio if gap_ratio is not None else CONTEXT_SCORE_GAP_RATIO
+    duplicate_threshold = duplicate_threshold if duplicate_threshold is not None else CONTEXT_DUPLICATE_THRESHOLD
+
+    fused = any("fused_score" in result for result in results)
+    rank_key = "fused_score" if fused else "score"
+    ranked = sorted(results, key=lambda result: result.get(rank_key) or 0.0, reverse=True)
+    best_score = max((result.get("score") or 0.0 for result in ranked), default=0.0)
+
+    def relevance(result):
+        if "relevance" in result:
+            return result["relevance"]
+        return (result.get("score") or 0.0) / best_score if best_score > 0 else 1.0
+
+    floor, floor_reason = _relevance_floor([relevance(result) for result in ranked], min_score_ratio, gap_ratio)
+    stats = {"candidates": len(ranked), "selected": 0, "duplicates": 0, "below_floor": 0, "tokens": 0,
+             "stopped_by": None}
+    selected = []
+    selected_shingles = []
+
+    for result in ranked:
+        text = passage_text(result)
+        if not text:
+            continue
+        if selected and relevance(result) < floor:
+            stats["below_floor"] += 1
+            stats["stopped_by"] = stats["stopped_by"] or floor_reason
+            continue
+
+        shingles = _shingles(text)
+        if any(_similarity(shingles, other) >= duplicate_threshold for other in selected_shingles):
+            stats["duplicates"] += 1
+            continue
+
+        tokens = count_tokens(text)
+        if stats["tokens"] + tokens > max_tokens:
+            if selected:
+                stats["stopped_by"] = "budget"
+                break
+            # Keep the best passage even when it alone is over budget
+            text = text[:max(1, len(text) * max_tokens // tokens)]
+            tokens = count_tokens(text)
+
+        selected.append(dict(result, text=text, tokens=tokens))
+        selected_shingles.append(shingles)
+        stats["tokens"] += tokens
+
+    stats["selected"] = len(selected)
+    return selected, stats
@@ -0,0 +1,239 @@
+# conversation_store.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text):
+    """
+    Count the tokens of a text with tiktoken when it is installed, otherwise
+    estimate them at four characters per token.
+    """
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(os.environ.get("TOKEN_ENCODING", "cl100k_base"))
+        except Exception:
+            logger.debug("tiktoken unavailable, estimating token counts from text length")
+            _encoding = None
+        _encoding_loaded = True
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def trim_turns(turns, max_tokens):
+    """
+    Return the most recent turns that fit in max_tokens, oldest first. Turns are
+    dropped in user/assistant pairs so the history never starts with an
+    orphaned answer.
+    """
+    history = []
+    used = 0
+    for end in range(len(turns), 0, -2):
+        pair = turns[max(end - 2, 0):end]
+        pair_tokens = sum(turn["tokens"] for turn in pair)
+        if used + pair_tokens > max_tokens:
+            break
+        history[:0] = pair
+        used += pair_tokens
+    return history
+
+
+class ConversationStore:
+    """
+    Server-side chat sessions keyed by session_id.
+
+    A session holds the conversation turns in English (the language the model
+    sees), each with its token count, and the passages retrieved for the latest
+    search, so a follow-up question can be answered from them without searching
+    again. Only the last max_turns turns are kept.
+
+    Sessions live in a bounded in-process LRU. When a path is configured
+    (CONVERSATION_STORE_PATH) they are also written to SQLite, which survives
+    restarts and is shared by worker processes; reads then check the row's
+    updated_at so a copy cached by one worker never hides turns written by
+    another. Sessions expire ttl_seconds after their last turn.
+    """
+    def __init__(self, path=None, max_sessions=None, max_turns=None, ttl_seconds=None):
+        self.path = path if path is not None else os.environ.get("CONVERSATION_STORE_PATH", "")
+        self.max_sessions = max_sessions or int(os.environ.get("CONVERSATION_MAX_SESSIONS", 10000))
+        self.max_turns = max_turns or int(os.environ.get("CONVERSATION_MAX_TURNS", 20))
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("CONVERSATION_TTL_SECONDS", 24 * 3600))
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._writes_since_trim = 0
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._conn = None
+        if self.path:
+            try:
+                self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS conversations ("
+                    "session_id TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated_at)")
+                logger.info(f"Conversation store opened at {self.path}")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open conversation store, using memory only: {str(e)}")
+                self._conn = None
+
+    def get(self, session_id):
+        """Return the session {"turns", "passages", "updated_at"} or None."""
+        with self._lock:
+            session = self._load(session_id, time.time())
+            return json.loads(json.dumps(session)) if session is not None else None
+
+    def get_history(self, session_id, max_tokens):
+        """Return the most recent turns of a session that fit in max_tokens."""
+        session = self.get(session_id)
+        return trim_turns(session["turns"], max_tokens) if session else []
+
+    def append_turn(self, session_id, user_text, assistant_text, passages=None, scope=None):
+        """
+        Record a question and its answer. passages replaces the session's
+        retrieved passages (with the scope they were searched in); None keeps
+        the previous ones, e.g. when they were reused for this answer.
+
+        With SQLite the read and the write run in one write transaction, so
+        turns recorded concurrently by another worker are not overwritten.
+        """
+        new_turns = [
+            {"role": "user", "content": user_text, "tokens": count_tokens(user_text)},
+            {"role": "assistant", "content": assistant_text, "tokens": count_tokens(assistant_text)}
+        ]
+        with self._lock:
+            in_transaction = False
+            if self._conn is not None:
+                try:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    in_transaction = True
+                except sqlite3.Error as e:
+                    logger.warning(f"Conversation store transaction failed to start: {str(e)}")
+            try:
+                now = time.time()
+                session = self._load(session_id, now, count_stats=False)
+                session = json.loads(json.dumps(session)) if session else {"turns": [], "passages": None}
+                session["turns"] = (session["turns"] + new_turns)[-self.max_turns:]
+                if passages is not None:
+                    session["passages"] = {"results": passages, "scope": scope, "retrieved_at": now}
+                session["updated_at"] = now
+                self._save(session_id, session)
+                if in_transaction:
+                    self._conn.execute("COMMIT")
+            except Exception:
+                if in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, session_id):
+        with self._lock:
+            self._memory.pop(session_id, None)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+                except sqlite3.Error as e:
+                    logger.warning(f"Conversation store delete failed: {str(e)}")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_sessions"] = len(self._memory)
+        return stats
+
+    def _load(self, session_id, now, count_stats=True):
+        """
+        Current session or None; the caller holds self._lock. With SQLite the
+        stored row is authoritative, since other workers write to it; the
+        in-memory copy is used only while its updated_at matches the row.
+        """
+        session = self._memory.get(session_id)
+        if session is not None and now - session["updated_at"] >= self.ttl_seconds:
+            del self._memory[session_id]
+            session = None
+
+        if self._conn is None:
+            if session is not None:
+                self._memory.move_to_end(session_id)
+                self._count(count_stats, "memory_hits")
+                return session
+            self._count(count_stats, "misses")
+            return None
+
+        try:
+            row = self._conn.execute(
+                "SELECT updated_at FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or now - row[0] >= self.ttl_seconds:
+                # Deleted or expired, possibly by another worker
+                self._memory.pop(session_id, None)
+                self._count(count_stats, "misses")
+                return None
+            if session is not None and session["updated_at"] == row[0]:
+                self._memory.move_to_end(session_id)
+                self._count(count_stats, "memory_hits")
+                return session
+            row = self._conn.execute(
+                "SELECT value FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None:
+                session = json.loads(row[0])
+                self._remember(session_id, session)
+                self._count(count_stats, "persistent_hits")
+                return session
+        except sqlite3.Error as e:
+            logger.warning(f"Conversation store read failed: {str(e)}")
+            if session is not None:
+                self._count(count_stats, "memory_hits")
+                return session
+        self._count(count_stats, "misses")
+        return None
+
+    def _count(self, enabled, name):
+        if enabled:
+            self.stats[name] += 1
+
+    def _save(self, session_id, session):
+        """Write a session; the caller holds self._lock."""
+        value = json.dumps(session, separators=(",", ":"))
+        self._remember(session_id, session)
+        self.stats["writes"] += 1
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (session_id, value, updated_at) VALUES (?, ?, ?)",
+                (session_id, value, session["updated_at"])
+            )
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 256:
+                self._trim(session["updated_at"])
+        except sqlite3.Error as e:
+            logger.warning(f"Conversation store write failed: {str(e)}")
+
+    def _remember(self, session_id, session):
+        self._memory[session_id] = session
+        self._memory.move_to_end(session_id)
+        while len(self._memory) > self.max_sessions:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim(self, now):
+        """Drop expired sessions from the store."""
+        self._writes_since_trim = 0
+        self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (now - self.ttl_seconds,))
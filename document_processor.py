@@ -3,19 +3,20 @@ import os
 import uuid
 import json
 import pytz
+import hashlib
+import time
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes.models import (
-    SearchIndex, SimpleField, SearchableField, 
-    SearchFieldDataType, CorsOptions, 
-    ScoringProfile, TextWeights
-)
+from azure_clients import clients
+from search_backend import get_search_backend
+from search_indexer import BufferedIndexer
+from index_alias import IndexAlias
+from shard_router import ShardRouter
+from extraction_store import get_extraction_store
 
 # Configure logging
 logging.basicConfig(
@@ -39,49 +40,168 @@ form_recognizer_key = os.getenv("FORM_RECOGNIZER_KEY")
 logger.debug(f"Form Recognizer endpoint configured: {form_recognizer_endpoint}")
 
 # Define Search Service details
-search_endpoint = os.getenv("SEARCH_ENDPOINT")
-search_key = os.getenv("SEARCH_API_KEY")
 search_index_name = os.getenv("SEARCH_INDEX_NAME", "documents")
 logger.debug(f"Search service configured with index: {search_index_name}")
 
-# Initialize BlobServiceClient
-blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-logger.debug(f"Blob service client initialized for account: {blob_service_client.account_name}")
+# Local vector index used alongside keyword search
+hybrid_search_enabled = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+logger.debug(f"Hybrid vector search enabled: {hybrid_search_enabled}")
 
-# Create a container if it doesn't exist
-try:
-    container_client = blob_service_client.get_container_client(container_name)
-    if not container_client.exists():
-        container_client = blob_service_client.create_container(container_name)
-        logger.info(f"Container '{container_name}' created successfully.")
-    else:
-        logger.info(f"Using existing container '{container_name}'.")
-except Exception as e:
-    logger.error(f"Error accessing container: {e}", exc_info=True)
+# Persist extraction results so reindexing never re-analyzes documents
+extraction_store_enabled = os.getenv("EXTRACTION_STORE_ENABLED", "true").lower() == "true"
 
-# Initialize Form Recognizer client
-document_analysis_client = DocumentAnalysisClient(
-    endpoint=form_recognizer_endpoint, credential=AzureKeyCredential(form_recognizer_key)
-)
-logger.debug("Document analysis client initialized")
+# Longest a caller waits for the buffered indexer to report on its passages
+index_result_timeout = float(os.getenv("SEARCH_INDEX_RESULT_TIMEOUT_SECONDS", 120))
 
-# Initialize Search clients
-search_credential = AzureKeyCredential(search_key)
-search_index_client = SearchIndexClient(endpoint=search_endpoint, credential=search_credential)
-search_client = SearchClient(endpoint=search_endpoint, index_name=search_index_name, credential=search_credential)
-logger.debug("Search clients initialized")
+# Chunked block upload settings
+blob_block_size = int(os.getenv("BLOB_UPLOAD_BLOCK_SIZE", 4 * 1024 * 1024))
+blob_max_concurrency = int(os.getenv("BLOB_UPLOAD_MAX_CONCURRENCY", 4))
 
-def upload_document(file_path, blob_name=None):
+# Service clients are created on first use (see azure_clients.py), so importing
+# this module never touches the network
+def _create_blob_service_client():
+    from azure.storage.blob import BlobServiceClient
+    
+    service_client = BlobServiceClient.from_connection_string(
+        connection_string,
+        max_block_size=blob_block_size,
+        max_single_put_size=blob_block_size
+    )
+    logger.debug(f"Blob service client initialized for account: {service_client.account_name}")
+    
+    # Create a container if it doesn't exist
     try:
-        logger.debug(f"Starting document upload: {file_path}")
-        if not blob_name:
-            blob_name = f"{str(uuid.uuid4())}-{os.path.basename(file_path)}"
-        
+        container_client = service_client.get_container_client(container_name)
+        if not container_client.exists():
+            service_client.create_container(container_name)
+            logger.info(f"Container '{container_name}' created successfully.")
+        else:
+            logger.info(f"Using existing container '{container_name}'.")
+    except Exception as e:
+        logger.error(f"Error accessing container: {e}", exc_info=True)
+    return service_client
+
+def _create_document_analysis_client():
+    from azure.ai.formrecognizer import DocumentAnalysisClient
+    from azure.core.credentials import AzureKeyCredential
+    
+    client = DocumentAnalysisClient(
+        endpoint=form_recognizer_endpoint, credential=AzureKeyCredential(form_recognizer_key)
+    )
+    logger.debug("Document analysis client initialized")
+    return client
+
+clients.register("blob_service", _create_blob_service_client)
+clients.register("document_analysis", _create_document_analysis_client)
+blob_service_client = clients.proxy("blob_service")
+document_analysis_client = clients.proxy("document_analysis")
+
+# Bots are routed to shards (logical indexes, SEARCH_INDEX_NAME being the shared
+# default); each shard's reads go to the index its alias points at, which rebuilds
+# switch (see rebuild_search_index.py and manage_shards.py)
+shard_router = ShardRouter(default_shard=search_index_name)
+_shard_aliases = {}
+_search_backends = {}
+_search_indexers = {}
+_verified_indexes = set()
+_search_backends_lock = threading.Lock()
+
+def get_shard_alias(shard):
+    """Return the index alias of a shard."""
+    with _search_backends_lock:
+        alias = _shard_aliases.get(shard)
+        if alias is None:
+            alias = IndexAlias(shard)
+            _shard_aliases[shard] = alias
+        return alias
+
+search_alias = get_shard_alias(search_index_name)
+
+def get_index_backend(index_name):
+    """Return the search backend (SEARCH_BACKEND=azure or local) for a physical index."""
+    with _search_backends_lock:
+        backend = _search_backends.get(index_name)
+        if backend is None:
+            backend = get_search_backend(index_name=index_name)
+            _search_backends[index_name] = backend
+            logger.debug(f"Search backend initialized: {backend.name} ({index_name})")
+        return backend
+
+def get_active_search_backend(shard=None):
+    """Return the backend of the index currently serving reads for a shard (default: shared shard)."""
+    return get_index_backend(get_shard_alias(shard or search_index_name).resolve())
+
+def _ensure_index(index_name, force=False):
+    if not force and index_name in _verified_indexes:
+        return {"success": True, "created": False}
+    result = get_index_backend(index_name).ensure_index()
+    if result.get("success"):
+        _verified_indexes.add(index_name)
+    return result
+
+def get_index_indexer(index_name):
+    """Return the shared buffered uploader for a physical index."""
+    backend = get_index_backend(index_name)
+    with _search_backends_lock:
+        indexer = _search_indexers.get(index_name)
+        if indexer is None:
+            indexer = BufferedIndexer(backend)
+            _search_indexers[index_name] = indexer
+        return indexer
+
+def get_indexing_stats():
+    """Upload throughput counters per physical index."""
+    with _search_backends_lock:
+        indexers = dict(_search_indexers)
+    return {index_name: indexer.get_stats() for index_name, indexer in indexers.items()}
+
+class HashingReader:
+    """File-like wrapper that hashes and counts bytes as they are read."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.read_error = None
+
+    def read(self, size=-1):
+        try:
+            data = self.stream.read(size)
+        except Exception as e:
+            self.read_error = e
+            raise
+        if data:
+            self.hasher.update(data)
+            self.size += len(data)
+        return data
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+def upload_stream(stream, blob_name):
+    """
+    Upload a readable stream to Blob Storage as a chunked block blob.
+    
+    The stream is read once, in BLOB_UPLOAD_BLOCK_SIZE blocks uploaded with up to
+    BLOB_UPLOAD_MAX_CONCURRENCY parallel requests, and hashed on the fly so the
+    content never has to be written to local disk.
+    
+    Returns:
+        dict: Upload result with blob names/URLs, content_hash (SHA-256) and size
+    
+    Raises:
+        Exception: Whatever reading the stream raised (e.g. a request body over
+            the size limit); only upload errors are returned in the result
+    """
+    from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+    
+    reader = None
+    try:
+        logger.debug(f"Starting streamed upload to blob: {blob_name}")
+        reader = HashingReader(stream)
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
         
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
-            logger.info(f"Document '{blob_name}' uploaded successfully.")
+        blob_client.upload_blob(reader, overwrite=True, max_concurrency=blob_max_concurrency)
+        logger.info(f"Document '{blob_name}' uploaded successfully ({reader.size} bytes).")
         
         sas_token = generate_blob_sas(
             account_name=blob_service_client.account_name,
@@ -99,12 +219,38 @@ def upload_document(file_path, blob_name=None):
             "success": True,
             "blob_name": blob_name,
             "blob_url": blob_client.url,
-            "blob_url_with_sas": blob_url_with_sas
+            "blob_url_with_sas": blob_url_with_sas,
+            "content_hash": reader.hexdigest(),
+            "size": reader.size
         }
     except Exception as e:
+        if reader is not None and reader.read_error is not None:
+            raise reader.read_error
         logger.error(f"An error occurred while uploading the document: {e}", exc_info=True)
         return {"success": False, "error": str(e)}
 
+def upload_document(file_path, blob_name=None):
+    try:
+        logger.debug(f"Starting document upload: {file_path}")
+        if not blob_name:
+            blob_name = f"{str(uuid.uuid4())}-{os.path.basename(file_path)}"
+        
+        with open(file_path, "rb") as data:
+            return upload_stream(data, blob_name)
+    except Exception as e:
+        logger.error(f"An error occurred while uploading the document: {e}", exc_info=True)
+        return {"success": False, "error": str(e)}
+
+def delete_blob(blob_name):
+    """Delete a blob, e.g. a duplicate upload whose content is already ingested."""
+    try:
+        blob_service_client.get_blob_client(container=container_name, blob=blob_name).delete_blob()
+        logger.info(f"Deleted blob '{blob_name}'")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not delete blob '{blob_name}': {e}")
+        return False
+
 def extract_text_from_document(blob_url_with_sas):
     try:
         logger.debug(f"Starting text extraction from document at: {blob_url_with_sas[:50]}...")
@@ -116,23 +262,29 @@ def extract_text_from_document(blob_url_with_sas):
         result = poller.result()
         logger.debug(f"Form Recognizer analysis complete. Pages detected: {len(result.pages)}")
         
-        paragraphs = []
-        for page_num, page in enumerate(result.pages, 1):
-            logger.debug(f"Processing page {page_num}/{len(result.pages)}")
-            for paragraph in page.paragraphs if hasattr(page, 'paragraphs') else []:
-                paragraphs.append(paragraph.content)
+        # Document-level paragraphs carry their layout role and page number
+        layout_paragraphs = []
+        for paragraph in getattr(result, 'paragraphs', None) or []:
+            regions = getattr(paragraph, 'bounding_regions', None) or []
+            layout_paragraphs.append({
+                "content": paragraph.content,
+                "role": getattr(paragraph, 'role', None),
+                "page_number": regions[0].page_number if regions else None
+            })
         
-        if not paragraphs:
+        if not layout_paragraphs:
             logger.debug("No paragraphs found, extracting lines instead")
             for page_num, page in enumerate(result.pages, 1):
                 current_paragraph = []
                 for line in page.lines:
                     current_paragraph.append(line.content)
                     if len(current_paragraph) > 0 and (len(current_paragraph) % 5 == 0):
-                        paragraphs.append(" ".join(current_paragraph))
+                        layout_paragraphs.append({"content": " ".join(current_paragraph), "role": None, "page_number": page_num})
                         current_paragraph = []
                 if current_paragraph:
-                    paragraphs.append(" ".join(current_paragraph))
+                    layout_paragraphs.append({"content": " ".join(current_paragraph), "role": None, "page_number": page_num})
+        
+        paragraphs = [paragraph["content"] for paragraph in layout_paragraphs]
         
         key_value_pairs = {}
         if hasattr(result, 'key_value_pairs'):
@@ -152,6 +304,7 @@ def extract_text_from_document(blob_url_with_sas):
             "success": True,
             "text": full_text,
             "paragraphs": paragraphs,
+            "layout_paragraphs": layout_paragraphs,
             "key_value_pairs": key_value_pairs,
             "page_count": len(result.pages)
         }
@@ -160,44 +313,230 @@ def extract_text_from_document(blob_url_with_sas):
         logger.error(f"Error extracting document text: {str(e)}", exc_info=True)
         return {"success": False, "error": str(e)}
 
-def ensure_search_index_exists():
+def extract_uploaded_document(upload_result):
+    """
+    Extract an uploaded document, reusing the stored result for the same content.
+    
+    New results are persisted in the extraction store under the content hash,
+    together with the document ID and blob details needed to reindex them.
+    """
+    content_hash = upload_result.get("content_hash")
+    if not (extraction_store_enabled and content_hash):
+        return extract_text_from_document(upload_result.get("blob_url_with_sas"))
+    
+    store = get_extraction_store()
     try:
-        logger.debug(f"Checking if search index '{search_index_name}' exists")
-        indexes = list(search_index_client.list_indexes())
-        index_exists = any(index.name == search_index_name for index in indexes)
-        
-        if index_exists:
-            logger.info(f"Search index '{search_index_name}' already exists")
-            return {"success": True, "created": False}
-        
-        logger.info(f"Creating new search index '{search_index_name}'")
-        
-        fields = [
-            SimpleField(name="id", type=SearchFieldDataType.String, key=True, filterable=True),
-            SimpleField(name="blob_name", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="blob_url", type=SearchFieldDataType.String),
-            SimpleField(name="file_name", type=SearchFieldDataType.String, filterable=True, sortable=True),
-            SimpleField(name="file_type", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="created_at", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
-            SimpleField(name="page_count", type=SearchFieldDataType.Int32, filterable=True),
-            SearchableField(name="content", type=SearchFieldDataType.String, analyzer_name="en.microsoft"),
-            SearchableField(name="paragraph_content", type=SearchFieldDataType.String, searchable=True)
-        ]
-        
-        index = SearchIndex(
-            name=search_index_name, 
-            fields=fields
-        )
+        record = store.get(content_hash)
+    except (ValueError, OSError) as e:
+        # An unreadable record (other version, truncated file) is replaced below
+        logger.warning(f"Ignoring stored extraction for content {content_hash[:12]}: {str(e)}")
+        record = None
+    if record is not None:
+        with record:
+            logger.info(f"Reusing stored extraction for content {content_hash[:12]}")
+            return record.to_extract_result()
+    
+    extract_result = extract_text_from_document(upload_result.get("blob_url_with_sas"))
+    if extract_result.get("success"):
+        try:
+            store.put(content_hash, extract_result, {
+                "document_id": upload_result.get("document_id"),
+                "blob_name": upload_result.get("blob_name"),
+                "blob_url": upload_result.get("blob_url")
+            })
+        except Exception as e:
+            # Indexing can go ahead; only a later reindex loses this result
+            logger.error(f"Error storing extraction result: {str(e)}", exc_info=True)
+    return extract_result
+
+def ensure_search_index_exists(force=False, shard=None):
+    """
+    Create a shard's search index (default: the shared shard) if it does not exist yet.
+    
+    The check runs once per index and process; later calls return at once
+    unless force is set.
+    """
+    return _ensure_index(get_shard_alias(shard or search_index_name).resolve(), force=force)
+
+# Layout roles that start a new passage, and roles that are page furniture
+HEADING_ROLES = {"title", "sectionHeading"}
+SKIPPED_ROLES = {"pageHeader", "pageFooter", "pageNumber"}
+max_chunk_chars = int(os.getenv("SEARCH_CHUNK_MAX_CHARS", 1500))
+
+# Lean search responses select only these fields and rely on highlights or the stored preview
+LEAN_SELECT_FIELDS = [
+    "id", "parent_id", "chunk_ordinal", "heading", "page_numbers",
+    "file_name", "file_type", "page_count", "blob_url", "preview"
+]
+PREVIEW_CHARS = 300
+search_response_mode = os.getenv("SEARCH_RESPONSE_MODE", "full").lower()
+
+def make_preview(content, max_chars=PREVIEW_CHARS):
+    """Short preview stored with each passage so lean searches never need the full text."""
+    return content[:max_chars] + "..." if len(content) > max_chars else content
+
+def build_passage_chunks(layout_paragraphs, max_chars=None):
+    """
+    Group layout paragraphs into passages.
+    
+    A passage starts at every title or section heading and is closed early once
+    it would exceed max_chars. Page headers, footers and numbers are dropped.
+    
+    Returns:
+        list: Dicts with heading, content and page_numbers, in document order
+    """
+    max_chars = max_chars or max_chunk_chars
+    chunks = []
+    heading = ""
+    parts = []
+    pages = []
+    size = 0
+    
+    def close():
+        if parts:
+            chunks.append({
+                "heading": heading,
+                "content": "\n\n".join(parts),
+                "page_numbers": sorted(set(page for page in pages if page is not None))
+            })
+    
+    for paragraph in layout_paragraphs:
+        content = (paragraph.get("content") or "").strip()
+        role = paragraph.get("role")
+        if not content or role in SKIPPED_ROLES:
+            continue
         
-        logger.debug("Sending index creation request to Azure Cognitive Search")
-        result = search_index_client.create_or_update_index(index)
-        logger.info(f"Search index '{search_index_name}' created with standard configuration")
+        if role in HEADING_ROLES:
+            close()
+            heading, parts, pages, size = content, [], [], 0
+            continue
         
-        return {"success": True, "created": True}
+        if parts and size + len(content) > max_chars:
+            close()
+            parts, pages, size = [], [], 0
         
-    except Exception as e:
-        logger.error(f"Error creating search index: {str(e)}", exc_info=True)
-        return {"success": False, "error": str(e)}
+        parts.append(content)
+        pages.append(paragraph.get("page_number"))
+        size += len(content) + 2
+    
+    close()
+    return chunks
+
+def build_search_passages(doc_id, blob_info, text_content):
+    """
+    Build the passage search documents for one extracted document.
+    
+    blob_info may carry "bot_ids", the bots the document is being attached to.
+    """
+    # Extract filename and file type
+    file_name = os.path.basename(blob_info.get("blob_name", ""))
+    file_type = os.path.splitext(file_name)[1][1:].lower() if "." in file_name else ""
+    
+    layout_paragraphs = text_content.get("layout_paragraphs")
+    if layout_paragraphs is None:
+        layout_paragraphs = [{"content": paragraph, "role": None, "page_number": None}
+                             for paragraph in text_content.get("paragraphs", [])]
+    
+    chunks = build_passage_chunks(layout_paragraphs)
+    created_at = datetime.now(pytz.UTC).isoformat()
+    
+    passages = []
+    for ordinal, chunk in enumerate(chunks):
+        passages.append({
+            "id": f"{doc_id}_{ordinal}",
+            "parent_id": doc_id,
+            "bot_ids": list(blob_info.get("bot_ids") or []),
+            "chunk_ordinal": ordinal,
+            "page_numbers": chunk["page_numbers"],
+            "blob_name": blob_info.get("blob_name", ""),
+            "blob_url": blob_info.get("blob_url", ""),
+            "file_name": file_name,
+            "file_type": file_type,
+            "created_at": created_at,
+            "page_count": text_content.get("page_count", 0),
+            "heading": chunk["heading"],
+            "content": chunk["content"],
+            "preview": make_preview(chunk["content"])
+        })
+    return passages
+
+def index_passage_batch(passages_by_document, backend=None):
+    """
+    Upload the passages of several documents through the buffered indexer, which
+    may combine them with passages from concurrent callers in one request.
+    
+    Without an explicit backend each passage goes to the shards of the bots in
+    its bot_ids (the default shard if none), and within a shard to the live index
+    and, while a rebuild is running, also to the index being built, so nothing
+    ingested during the rebuild is missing after the switch.
+    
+    Args:
+        passages_by_document (dict): Document ID -> list of passage documents
+        backend (SearchBackend, optional): Index to write to instead
+    
+    Returns:
+        dict: Document ID -> {"indexed": bool, "chunk_count": int, "failed_keys": list}
+    """
+    all_passages = [passage for passages in passages_by_document.values() for passage in passages]
+    failed_keys = set()
+    
+    if all_passages:
+        if backend is not None:
+            targets = {backend.index_name: (True, all_passages)}
+        else:
+            targets = {}
+            for passage in all_passages:
+                for index_name, live in _passage_targets(passage):
+                    entry = targets.setdefault(index_name, (live, []))
+                    entry[1].append(passage)
+        logger.debug(f"Uploading {len(all_passages)} passages from {len(passages_by_document)} documents "
+                     f"to search indexes {sorted(targets)}")
+        
+        pending = []
+        for index_name, (live, passages) in targets.items():
+            if backend is None:
+                _ensure_index(index_name)
+            pending.append((index_name, live, passages, get_index_indexer(index_name).submit(passages)))
+        
+        for index_name, live, passages, future in pending:
+            try:
+                index_failed = {item.key for item in future.result(timeout=index_result_timeout) if not item.succeeded}
+            except Exception as e:
+                # A send that raised or never finished leaves every passage of this target unconfirmed
+                logger.error(f"Indexing into {index_name} did not complete: {type(e).__name__}: {str(e)}")
+                index_failed = {passage["id"] for passage in passages}
+            if index_failed and live:
+                failed_keys |= index_failed
+                logger.warning(f"Indexing into {index_name} failed for passages: {sorted(index_failed)}")
+            elif index_failed:
+                logger.error(f"Indexing into rebuilding index {index_name} failed for passages: {sorted(index_failed)}")
+    
+    outcome = {}
+    for doc_id, passages in passages_by_document.items():
+        doc_failed = [passage["id"] for passage in passages if passage["id"] in failed_keys]
+        outcome[doc_id] = {
+            "indexed": bool(passages) and not doc_failed,
+            "chunk_count": len(passages),
+            "failed_keys": doc_failed
+        }
+    if hybrid_search_enabled:
+        # Documents that were not fully indexed lose their vectors, so a re-ingestion
+        # never leaves chunks behind that keyword search does not have
+        index_document_vectors({doc_id: passages if outcome[doc_id]["indexed"] else []
+                                for doc_id, passages in passages_by_document.items()})
+    return outcome
+
+def _passage_targets(passage):
+    """(index name, is live) pairs a passage must be written to."""
+    shards = set()
+    for bot_id in passage.get("bot_ids") or [None]:
+        shards.update(shard_router.write_shards(bot_id))
+    targets = []
+    for shard in shards:
+        index_names = get_shard_alias(shard).write_targets()
+        targets.append((index_names[0], True))
+        targets.extend((index_name, False) for index_name in index_names[1:])
+    return targets
 
 def index_document_content(doc_id, blob_info, text_content):
     try:
@@ -208,77 +547,371 @@ def index_document_content(doc_id, blob_info, text_content):
         if not index_result.get("success"):
             logger.error(f"Failed to ensure search index exists: {index_result.get('error')}")
             return index_result
-            
-        # Extract filename and file type
-        file_name = os.path.basename(blob_info.get("blob_name", ""))
-        file_type = os.path.splitext(file_name)[1][1:].lower() if "." in file_name else ""
-        
-        paragraphs = text_content.get("paragraphs", [])
-        
-        search_document = {
-            "id": doc_id,
-            "blob_name": blob_info.get("blob_name", ""),
-            "blob_url": blob_info.get("blob_url", ""),
-            "file_name": file_name,
-            "file_type": file_type,
-            "created_at": datetime.now(pytz.UTC).isoformat(),
-            "page_count": text_content.get("page_count", 0),
-            "content": text_content.get("text", ""),
-            "paragraph_content": "\n\n".join(paragraphs)
-        }
         
-        logger.debug(f"Uploading document to search index, document size: {len(str(search_document))} characters")
-        result = search_client.upload_documents(documents=[search_document])
+        passages = build_search_passages(doc_id, blob_info, text_content)
+        if not passages:
+            logger.warning(f"No text passages to index for document: {doc_id}")
+            if hybrid_search_enabled:
+                index_document_vectors({doc_id: []})
+            return {"success": True, "indexed": False, "document_id": doc_id, "chunk_count": 0, "failed_keys": []}
         
-        if result and result[0].succeeded:
-            logger.info(f"Document indexed successfully: {doc_id}")
-        else:
-            logger.warning(f"Document indexing may have failed: {result}")
+        outcome = index_passage_batch({doc_id: passages})[doc_id]
+        if outcome["indexed"]:
+            logger.info(f"Document indexed successfully: {doc_id} ({len(passages)} passages)")
         
         return {
             "success": True,
-            "indexed": result[0].succeeded if result else False,
-            "document_id": doc_id
+            "indexed": outcome["indexed"],
+            "document_id": doc_id,
+            "chunk_count": outcome["chunk_count"],
+            "failed_keys": outcome["failed_keys"]
         }
         
     except Exception as e:
         logger.error(f"Error indexing document content: {str(e)}", exc_info=True)
         return {"success": False, "error": str(e)}
 
-def process_document(file_path, blob_name=None):
+def index_document_vectors(passages_by_document):
+    """
+    Embed documents' passages into the local vector index, replacing their
+    earlier chunks; a document without passages is removed from it.
+    """
+    try:
+        from vector_index import get_vector_index
+        
+        documents = []
+        for doc_id, passages in passages_by_document.items():
+            metadata = {}
+            if passages:
+                metadata = {field: passages[0].get(field) for field in ("file_name", "file_type", "page_count", "blob_url")}
+            chunks = [{
+                "chunk_id": passage["id"],
+                "text": passage["content"],
+                "page_numbers": passage["page_numbers"]
+            } for passage in passages]
+            documents.append((doc_id, chunks, metadata))
+        count = get_vector_index().add_documents(documents)
+        logger.debug(f"Indexed {count} vector chunks for {len(documents)} documents")
+    except Exception as e:
+        # Keyword search still works without the vector index
+        logger.error(f"Error adding documents to vector index: {str(e)}", exc_info=True)
+
+def fuse_with_vector_results(query_text, keyword_results, top, document_ids=None):
+    """
+    Combine keyword passages with local vector hits using reciprocal rank fusion.
+    
+    Passages found only by the vector index are added with their text as the
+    highlight. Each result keeps its original score and gains a fused_score, plus
+    a relevance in [0, 1]: its score relative to the best score of the same
+    retriever (BM25 and cosine scores are not comparable with each other).
+    """
+    from vector_index import get_vector_index, reciprocal_rank_fusion
+    
+    vector_index = get_vector_index()
+    chunk_hits = vector_index.search([query_text], top_k=top, document_ids=document_ids)[0]
+    if not chunk_hits:
+        return keyword_results
+    
+    by_chunk = {result["chunk_id"]: result for result in keyword_results}
+    vector_by_chunk = {hit["chunk_id"]: hit for hit in chunk_hits}
+    fused = reciprocal_rank_fusion([list(by_chunk), list(vector_by_chunk)])
+    best_keyword = max((result.get("score") or 0.0 for result in keyword_results), default=0.0)
+    best_vector = max(hit["score"] for hit in chunk_hits)
+    
+    fused_results = []
+    for chunk_id, fused_score in fused[:top]:
+        result = by_chunk.get(chunk_id)
+        if result is None:
+            hit = vector_by_chunk[chunk_id]
+            metadata = vector_index.get_document_metadata(hit["document_id"])
+            result = {
+                "id": hit["document_id"],
+                "chunk_id": chunk_id,
+                "file_name": metadata.get("file_name", ""),
+                "file_type": metadata.get("file_type", ""),
+                "page_count": metadata.get("page_count", 0),
+                "page_numbers": hit.get("page_numbers", []),
+                "blob_url": metadata.get("blob_url", ""),
+                "highlights": [hit["text"]],
+                "score": hit["score"]
+            }
+        relevance = 0.0
+        if chunk_id in by_chunk and best_keyword > 0:
+            relevance = (result.get("score") or 0.0) / best_keyword
+        if chunk_id in vector_by_chunk and best_vector > 0:
+            relevance = max(relevance, vector_by_chunk[chunk_id]["score"] / best_vector)
+        result["fused_score"] = fused_score
+        result["relevance"] = relevance
+        fused_results.append(result)
+    
+    logger.debug(f"Hybrid fusion: {len(keyword_results)} keyword, {len(chunk_hits)} vector, {len(fused_results)} fused")
+    return fused_results
+
+def _stage_reporter(on_stage):
+    def report(stage, status):
+        if on_stage:
+            try:
+                on_stage(stage, status)
+            except Exception as e:
+                logger.warning(f"Stage callback failed for {stage}: {str(e)}")
+    return report
+
+def process_document(file_path, blob_name=None, on_stage=None):
+    """
+    Upload, extract and index a document.
+    
+    Args:
+        file_path (str): Path to the local file
+        blob_name (str, optional): Blob name to upload to
+        on_stage (callable, optional): Called as on_stage(stage, status) when a stage
+            ('upload', 'extract', 'index') becomes 'running', 'completed' or 'failed'
+    """
+    report = _stage_reporter(on_stage)
+    
+    report("upload", "running")
     upload_result = upload_document(file_path, blob_name)
     if not upload_result.get("success"):
+        report("upload", "failed")
         return {"success": False, "error": f"Document upload failed: {upload_result.get('error')}", "stage": "upload"}
+    report("upload", "completed")
     
-    extract_result = extract_text_from_document(upload_result.get("blob_url_with_sas"))
+    return process_uploaded_document(upload_result, on_stage=on_stage)
+
+def process_uploaded_document(upload_result, on_stage=None):
+    """
+    Extract and index a document that is already in Blob Storage.
+    
+    Args:
+        upload_result (dict): Result of upload_document or upload_stream; a
+            "document_id" key, if present, is used instead of a new ID (e.g. one
+            already claimed in the document registry)
+        on_stage (callable, optional): Stage callback, as for process_document
+    """
+    report = _stage_reporter(on_stage)
+    doc_id = upload_result.get("document_id") or str(uuid.uuid4())
+    
+    report("extract", "running")
+    extract_result = extract_uploaded_document(dict(upload_result, document_id=doc_id))
     if not extract_result.get("success"):
+        report("extract", "failed")
         return {"success": False, "error": f"Text extraction failed: {extract_result.get('error')}", "stage": "extract"}
+    report("extract", "completed")
     
-    doc_id = str(uuid.uuid4())
-    
+    report("index", "running")
     index_result = index_document_content(doc_id, upload_result, extract_result)
     if not index_result.get("success"):
+        report("index", "failed")
         return {"success": False, "error": f"Indexing failed: {index_result.get('error')}", "stage": "index"}
+    if index_result.get("failed_keys"):
+        # A partly indexed document must not count as ingested content
+        report("index", "failed")
+        return {
+            "success": False,
+            "error": f"Indexing failed for {len(index_result['failed_keys'])} passages",
+            "stage": "index",
+            "document_id": doc_id,
+            "indexed": False,
+            "failed_keys": index_result["failed_keys"]
+        }
+    report("index", "completed")
     
     return {
         "success": True,
         "document_id": doc_id,
         "blob_name": upload_result.get("blob_name"),
         "blob_url": upload_result.get("blob_url"),
+        "content_hash": upload_result.get("content_hash"),
+        "size": upload_result.get("size"),
         "page_count": extract_result.get("page_count", 0),
         "text_length": len(extract_result.get("text", "")),
         "paragraph_count": len(extract_result.get("paragraphs", [])),
-        "search_index": search_index_name
+        "chunk_count": index_result.get("chunk_count", 0),
+        "indexed": index_result.get("indexed", False),
+        "failed_keys": [],
+        "search_index": get_shard_alias(shard_router.read_shard((upload_result.get("bot_ids") or [None])[0])).resolve()
     }
 
-def search_documents(query_text, top=5, document_ids=None):
+def find_document_passages(doc_id, exclude_index=None):
+    """
+    Return all passages of a document from the first live shard index that has
+    them, without search metadata, or an empty list.
+    """
+    for shard in shard_router.list_shards():
+        index_name = get_shard_alias(shard).resolve()
+        if index_name == exclude_index:
+            continue
+        passages = get_index_backend(index_name).list_documents(doc_id)
+        if passages:
+            return [{key: value for key, value in passage.items() if not key.startswith("@")}
+                    for passage in passages]
+    return []
+
+def _merge_in_batches(backend, updates, batch_size=1000):
+    for start in range(0, len(updates), batch_size):
+        failed = [item.key for item in backend.merge_documents(updates[start:start + batch_size]) if not item.succeeded]
+        if failed:
+            logger.error(f"Could not update bot_ids of passages in {backend.index_name}: {failed}")
+
+def sync_bot_documents(bot_id, old_document_ids, new_document_ids):
+    """
+    BotModel document listener that keeps the bot_ids field of passages in sync
+    with the bot's document list, in the live and rebuilding indexes of the bot's
+    shards. A document added to a bot whose shard does not hold it yet is copied
+    there from another shard.
+    """
+    old_ids = set(old_document_ids or [])
+    new_ids = set(new_document_ids or [])
+    added = new_ids - old_ids
+    changed = added | (old_ids - new_ids)
+    if not changed:
+        return
+    
+    index_names = [index_name for shard in shard_router.write_shards(bot_id)
+                   for index_name in get_shard_alias(shard).write_targets()]
+    for index_name in index_names:
+        backend = get_index_backend(index_name)
+        if not backend.has_field("bot_ids"):
+            continue
+        updates = []
+        copies = []
+        for doc_id in changed:
+            passages = backend.list_documents(doc_id, select=["id", "bot_ids"])
+            if not passages and doc_id in added:
+                copies.extend(dict(passage, bot_ids=[bot_id])
+                              for passage in find_document_passages(doc_id, exclude_index=index_name))
+            for passage in passages:
+                current = set(passage.get("bot_ids") or [])
+                updated = current | {bot_id} if doc_id in added else current - {bot_id}
+                if updated != current:
+                    updates.append({"id": passage["id"], "bot_ids": sorted(updated)})
+        
+        _merge_in_batches(backend, updates)
+        if copies:
+            _ensure_index(index_name)
+            failed = [item.key for item in get_index_indexer(index_name).upload(copies) if not item.succeeded]
+            if failed:
+                logger.error(f"Could not copy passages into {index_name}: {failed}")
+        logger.debug(f"Updated bot_ids of {len(updates)} passages and copied {len(copies)} passages "
+                     f"in {index_name} for bot {bot_id}")
+
+def move_bot_to_shard(bot_id, target_shard, document_ids, verify_attempts=10, cleanup=True):
+    """
+    Move a bot's passages to another shard while it keeps serving.
+    
+    The route first names both shards so new writes go to both, then the bot's
+    passages are copied from the source shard, the copy is verified per document
+    and only then are reads switched. Every step waits SEARCH_ROUTE_TTL_SECONDS so
+    all processes see the route before the next one. Afterwards the bot is removed
+    from the source passages, and passages no other bot uses are deleted from a
+    non-default source shard.
+    
+    Args:
+        bot_id (str): Bot to move
+        target_shard (str): Registered shard to move to
+        document_ids (list): The bot's documents
+        verify_attempts (int): Count checks before giving up (counts lag behind writes)
+        cleanup (bool): Remove the bot from the source shard after the switch
+    
+    Returns:
+        dict: Move summary with success flag
+    """
+    source_shard = shard_router.read_shard(bot_id)
+    if source_shard == target_shard:
+        return {"success": True, "source": source_shard, "target": target_shard, "copied": 0}
+    
+    # Raises ValueError for an unknown target before anything changes
+    shard_router.set_route(bot_id, source_shard, moving_to=target_shard)
+    try:
+        time.sleep(shard_router.ttl_seconds)
+        source = get_active_search_backend(source_shard)
+        target_index = get_shard_alias(target_shard).resolve()
+        result = _ensure_index(target_index)
+        if not result.get("success"):
+            raise RuntimeError(f"Could not create index {target_index}: {result.get('error')}")
+        target = get_index_backend(target_index)
+        
+        expected = {}
+        copied = 0
+        for doc_id in document_ids:
+            passages = source.list_documents(doc_id)
+            expected[doc_id] = len(passages)
+            existing = {passage["id"]: passage for passage in target.list_documents(doc_id, select=["id", "bot_ids"])}
+            copies = []
+            updates = []
+            for passage in passages:
+                passage = {key: value for key, value in passage.items() if not key.startswith("@")}
+                if passage["id"] in existing:
+                    current = set(existing[passage["id"]].get("bot_ids") or [])
+                    if bot_id not in current:
+                        updates.append({"id": passage["id"], "bot_ids": sorted(current | {bot_id})})
+                else:
+                    copies.append(dict(passage, bot_ids=[bot_id]))
+            _merge_in_batches(target, updates)
+            failed = [item.key for item in get_index_indexer(target_index).upload(copies) if not item.succeeded]
+            if failed:
+                raise RuntimeError(f"Could not copy passages of document {doc_id}: {failed}")
+            copied += len(copies)
+        
+        for attempt in range(verify_attempts):
+            missing = [doc_id for doc_id, count in expected.items() if len(target.list_documents(doc_id, select=["id"])) < count]
+            if not missing:
+                break
+            time.sleep(2)
+        else:
+            raise RuntimeError(f"Passages of documents {missing} did not reach {target_index}")
+    except Exception as e:
+        shard_router.set_route(bot_id, source_shard)
+        logger.error(f"Moving bot {bot_id} to shard {target_shard} failed, it stays on {source_shard}: {str(e)}",
+                     exc_info=True)
+        return {"success": False, "source": source_shard, "target": target_shard, "error": str(e)}
+    
+    shard_router.set_route(bot_id, target_shard)
+    logger.info(f"Bot {bot_id} moved from shard {source_shard} to {target_shard} ({copied} passages copied)")
+    
+    removed = 0
+    if cleanup:
+        # Let every process read from the new shard before the source copy goes away
+        time.sleep(shard_router.ttl_seconds)
+        for index_name in get_shard_alias(source_shard).write_targets():
+            backend = get_index_backend(index_name)
+            updates = []
+            orphaned = []
+            for doc_id in document_ids:
+                for passage in backend.list_documents(doc_id, select=["id", "bot_ids"]):
+                    remaining = set(passage.get("bot_ids") or []) - {bot_id}
+                    if not remaining and source_shard != shard_router.default_shard:
+                        orphaned.append(passage["id"])
+                    elif bot_id in (passage.get("bot_ids") or []):
+                        updates.append({"id": passage["id"], "bot_ids": sorted(remaining)})
+            _merge_in_batches(backend, updates)
+            if orphaned:
+                backend.delete_documents(orphaned)
+            removed += len(orphaned)
+    
+    return {"success": True, "source": source_shard, "target": target_shard, "copied": copied, "removed": removed}
+
+def search_documents(query_text, top=5, document_ids=None, lean=None, bot_id=None, **search_kwargs):
     """
-    Search for documents matching the query text.
+    Search for passages matching the query text.
+    
+    Each result is one ranked passage; its "id" is the parent document ID and
+    "chunk_id" identifies the passage itself.
+    
+    In lean mode only metadata fields are selected, so passage text never crosses
+    the wire; highlights come from server-side hit highlighting, falling back to
+    the preview stored at ingestion.
     
     Args:
         query_text (str): The query to search for
-        top (int): Maximum number of results to return
+        top (int): Maximum number of passages to return
         document_ids (list): Optional list of document IDs to filter search results
+        lean (bool): Use a lean response; defaults to SEARCH_RESPONSE_MODE == 'lean'
+        bot_id (str): Optional bot whose documents to search; only the bot's shard is
+            queried, filtering on the passages' bot_ids field, so the filter has the
+            same cost for any number of documents. document_ids is still used for the
+            vector index and for index generations without that field. Without a
+            bot_id every shard is queried in parallel and the results merged by score.
+        **search_kwargs: Extra keyword arguments for the search backend (e.g. raw_response_hook on Azure)
     
     Returns:
         dict: Search results with success flag
@@ -288,86 +921,73 @@ def search_documents(query_text, top=5, document_ids=None):
         logger.info(f"Filtering search to document IDs: {document_ids}")
     
     try:
-        # Build search options
-        search_options = {
-            "search_text": query_text,
-            "top": top,
-            "highlight_fields": "content,paragraph_content",
-            "highlight_pre_tag": "<em>",
-            "highlight_post_tag": "</em>",
-            "include_total_count": True
+        if lean is None:
+            lean = search_response_mode == "lean"
+        
+        shard_searches = _plan_shard_searches(top, document_ids, lean, bot_id, search_kwargs)
+        
+        if len(shard_searches) == 1:
+            backend, kwargs = shard_searches[0]
+            responses = [backend.search(query_text, **kwargs)]
+        else:
+            # Scatter-gather over every shard
+            with ThreadPoolExecutor(max_workers=min(len(shard_searches), 8)) as executor:
+                responses = list(executor.map(lambda search: search[0].search(query_text, **search[1]), shard_searches))
+        response = _merge_shard_responses(responses, top)
+        formatted_results = _format_search_results(response["results"], lean)
+        
+        if hybrid_search_enabled:
+            try:
+                formatted_results = fuse_with_vector_results(query_text, formatted_results, top, document_ids)
+            except Exception as e:
+                logger.error(f"Vector search failed, using keyword results only: {str(e)}", exc_info=True)
+        
+        return {
+            "success": True,
+            "query": query_text,
+            "count": len(formatted_results),
+            "total": response["total"],
+            "results": formatted_results
         }
         
-        # Add filter if document_ids is provided - only try if IDs are present
-        if document_ids and len(document_ids) > 0:
+    except Exception as e:
+        logger.error(f"Search error: {str(e)}", exc_info=True)
+        return {"success": False, "error": str(e), "results": []}
+
+async def search_documents_async(query_text, top=5, document_ids=None, lean=None, bot_id=None, **search_kwargs):
+    """
+    Async variant of search_documents for the ASGI chat pipeline.
+    
+    Queries go through the async search clients, so waiting for the search
+    service does not hold a thread. Shard and alias lookups (cached, occasionally
+    read from Table Storage) and the local vector search run in a worker thread.
+    """
+    logger.info(f"Searching for: '{query_text}', max results: {top}")
+    
+    try:
+        if lean is None:
+            lean = search_response_mode == "lean"
+        
+        shard_searches = await asyncio.to_thread(
+            _plan_shard_searches, top, document_ids, lean, bot_id, search_kwargs
+        )
+        responses = await asyncio.gather(*(backend.search_async(query_text, **kwargs) for backend, kwargs in shard_searches))
+        response = _merge_shard_responses(responses, top)
+        formatted_results = _format_search_results(response["results"], lean)
+        
+        if hybrid_search_enabled:
             try:
-                # Try to use filter if supported
-                filter_expr = " or ".join([f"id eq '{doc_id}'" for doc_id in document_ids])
-                search_options["filter"] = filter_expr
-                logger.info(f"Using filter expression: {filter_expr}")
-                
-                # Execute search with filter
-                results = search_client.search(**search_options)
-                
-            except Exception as filter_error:
-                # If filtering fails, fall back to searching all documents
-                logger.warning(f"Filter failed, falling back to full search: {str(filter_error)}")
-                del search_options["filter"]  # Remove the filter option
-                
-                # Execute search without filter (we'll filter manually)
-                results = search_client.search(**search_options)
-                
-        else:
-            # No document_ids provided, search all documents
-            results = search_client.search(**search_options)
-        
-        formatted_results = []
-        for result in results:
-            # If we have document_ids but filtering failed, do manual filtering here
-            if document_ids and len(document_ids) > 0 and "filter" not in search_options:
-                if result["id"] not in document_ids:
-                    continue  # Skip documents that aren't in our document_ids list
-            
-            highlights = []
-            if hasattr(result, 'highlights'):
-                if 'paragraph_content' in result.highlights:
-                    highlights = result.highlights['paragraph_content']
-                elif 'content' in result.highlights:
-                    highlights = result.highlights['content']
-            
-            if not highlights and 'paragraph_content' in result:
-                paragraphs = result['paragraph_content'].split('\n\n')
-                
-                query_terms = query_text.lower().split()
-                for paragraph in paragraphs:
-                    paragraph_lower = paragraph.lower()
-                    if any(term in paragraph_lower for term in query_terms):
-                        if len(paragraph) > 30:
-                            highlights.append(paragraph)
-                            if len(highlights) >= 2:
-                                break
-            
-            if not highlights and 'content' in result:
-                content = result['content']
-                preview = content[:300] + "..." if len(content) > 300 else content
-                highlights.append(preview)
-            
-            formatted_result = {
-                "id": result["id"],
-                "file_name": result.get("file_name", ""),
-                "file_type": result.get("file_type", ""),
-                "page_count": result.get("page_count", 0),
-                "blob_url": result.get("blob_url", ""),
-                "highlights": highlights,
-                "score": result["@search.score"]
-            }
-            formatted_results.append(formatted_result)
+                formatted_results = await asyncio.to_thread(
+                    fuse_with_vector_results, query_text, formatted_results, top, document_ids
+                )
+            except Exception as e:
+                logger.error(f"Vector search failed, using keyword results only: {str(e)}", exc_info=True)
         
         return {
             "success": True,
             "query": query_text,
             "count": len(formatted_results),
-            "total": results.get_count(),
+            "total": response["total"],
             "results": formatted_results
         }
         
@@ -375,6 +995,72 @@ def search_documents(query_text, top=5, document_ids=None):
         logger.error(f"Search error: {str(e)}", exc_info=True)
         return {"success": False, "error": str(e), "results": []}
 
+async def close_search_backends_async():
+    """Close the async clients of every search backend (at ASGI shutdown)."""
+    with _search_backends_lock:
+        backends = list(_search_backends.values())
+    for backend in backends:
+        await backend.close_async()
+
+def _plan_shard_searches(top, document_ids, lean, bot_id, search_kwargs):
+    """(backend, search kwargs) per shard to query: the bot's shard, or every shard without a bot."""
+    if bot_id:
+        shards = [shard_router.read_shard(bot_id)]
+    else:
+        shards = shard_router.list_shards()
+    
+    shard_searches = []
+    for shard in shards:
+        backend = get_active_search_backend(shard)
+        kwargs = dict(search_kwargs, top=top)
+        if bot_id and backend.has_field("bot_ids"):
+            kwargs["bot_id"] = bot_id
+        else:
+            kwargs["parent_ids"] = document_ids
+        if lean:
+            kwargs.update(select=LEAN_SELECT_FIELDS, highlight_fields="content")
+        shard_searches.append((backend, kwargs))
+    return shard_searches
+
+def _merge_shard_responses(responses, top):
+    """
+    Merge per-shard responses by score. BM25 scores come from per-index
+    statistics, so the merged order across shards is approximate.
+    """
+    if len(responses) == 1:
+        return responses[0]
+    best = {}
+    for response in responses:
+        for result in response["results"]:
+            # A document shared by bots on different shards is stored in each of them
+            if result["id"] not in best or result["@search.score"] > best[result["id"]]["@search.score"]:
+                best[result["id"]] = result
+    results = sorted(best.values(), key=lambda result: result["@search.score"], reverse=True)[:top]
+    return {"results": results, "total": sum(response["total"] or 0 for response in responses)}
+
+def _format_search_results(results, lean):
+    formatted_results = []
+    for result in results:
+        if lean:
+            highlights = (result.get("@search.highlights") or {}).get("content") or [result.get("preview", "")]
+        else:
+            highlights = [result.get("content", "")]
+        
+        formatted_results.append({
+            "id": result.get("parent_id", result["id"]),
+            "chunk_id": result["id"],
+            "chunk_ordinal": result.get("chunk_ordinal", 0),
+            "heading": result.get("heading", ""),
+            "page_numbers": result.get("page_numbers") or [],
+            "file_name": result.get("file_name", ""),
+            "file_type": result.get("file_type", ""),
+            "page_count": result.get("page_count", 0),
+            "blob_url": result.get("blob_url", ""),
+            "highlights": highlights,
+            "score": result["@search.score"]
+        })
+    return formatted_results
+
 def main():
     print("\n=== Document Processing and Search Demo ===")
     
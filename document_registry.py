@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+from azure.data.tables import TableServiceClient
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """Return the SHA-256 of a local file, matching the content_hash of upload_stream."""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+class DocumentRegistry:
+    """
+    Registry of ingested documents keyed by content hash, plus upload idempotency keys,
+    stored in Azure Table Storage.
+    
+    A content hash is claimed before extraction; an upload whose hash is already
+    claimed reuses that document ID instead of being analyzed and indexed again.
+    """
+    CONTENT_PARTITION = "content"
+    IDEMPOTENCY_PARTITION = "idempotency"
+
+    def __init__(self):
+        """Initialize the registry with Azure Table Storage connection."""
+        self.connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+        self.table_name = os.environ.get("DOCUMENT_REGISTRY_TABLE", "documentregistry")
+        
+        if not self.connection_string:
+            logger.error("No storage connection string found in environment variables")
+            raise ValueError("Storage connection string not found")
+        
+        service_client = TableServiceClient.from_connection_string(self.connection_string)
+        service_client.create_table_if_not_exists(self.table_name)
+        self._table_client = service_client.get_table_client(self.table_name)
+        logger.info(f"Document registry initialized with table: {self.table_name}")
+
+    def claim(self, content_hash: str, document_id: str, metadata: Dict = None) -> Optional[Dict]:
+        """
+        Claim a content hash for a new document.
+        
+        Args:
+            content_hash: SHA-256 of the document bytes
+            document_id: The ID the new document will get if the claim succeeds
+            metadata: Optional details stored with the entry (file name, blob name, ...)
+            
+        Returns:
+            None if the claim succeeded, otherwise the existing entry for this content
+        """
+        entity = {
+            "PartitionKey": self.CONTENT_PARTITION,
+            "RowKey": content_hash,
+            "document_id": document_id,
+            "status": "processing",
+            "created_at": datetime.utcnow().isoformat(),
+            "metadata": json.dumps(metadata or {})
+        }
+        try:
+            self._table_client.create_entity(entity)
+            logger.info(f"Claimed content {content_hash[:12]} for document {document_id}")
+            return None
+        except ResourceExistsError:
+            existing = self.get_by_hash(content_hash)
+            if existing is None:
+                # Released between our insert and read; try once more
+                return self.claim(content_hash, document_id, metadata)
+            logger.info(f"Content {content_hash[:12]} already ingested as document {existing['document_id']}")
+            return existing
+
+    def wait_for_claim(self, content_hash: str, document_id: str, metadata: Dict = None,
+                       timeout_seconds: float = 600, poll_seconds: float = 2) -> Optional[Dict]:
+        """
+        Wait for a claim that is still processing to become ready or be released.
+        
+        A released claim (the other ingestion failed) is taken over with
+        document_id, so the caller then ingests the content itself.
+        
+        Returns:
+            None if the caller now owns the claim, otherwise the entry of ready content
+            
+        Raises:
+            TimeoutError: If the content is still processing after timeout_seconds
+        """
+        deadline = time.monotonic() + timeout_seconds
+        existing = self.get_by_hash(content_hash)
+        while True:
+            if existing is None:
+                existing = self.claim(content_hash, document_id, metadata)
+                if existing is None:
+                    logger.info(f"Took over released content {content_hash[:12]} as document {document_id}")
+                    return None
+            if existing["status"] != "processing":
+                return existing
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Content {content_hash[:12]} is still being ingested as document "
+                                   f"{existing['document_id']}")
+            time.sleep(poll_seconds)
+            existing = self.get_by_hash(content_hash)
+
+    def get_by_hash(self, content_hash: str) -> Optional[Dict]:
+        """Return the registry entry for a content hash, or None."""
+        try:
+            entity = self._table_client.get_entity(self.CONTENT_PARTITION, content_hash)
+        except ResourceNotFoundError:
+            return None
+        return {
+            "content_hash": entity["RowKey"],
+            "document_id": entity["document_id"],
+            "status": entity.get("status", "ready"),
+            "created_at": entity.get("created_at"),
+            "metadata": json.loads(entity.get("metadata", "{}"))
+        }
+
+    def mark_ready(self, content_hash: str, details: Dict = None):
+        """Record that the claimed document was extracted and indexed."""
+        entity = {
+            "PartitionKey": self.CONTENT_PARTITION,
+            "RowKey": content_hash,
+            "status": "ready"
+        }
+        if details:
+            entity["details"] = json.dumps(details)
+        self._table_client.update_entity(entity)
+
+    def release(self, content_hash: str):
+        """Drop a claim after a failed ingestion so the content can be retried."""
+        try:
+            self._table_client.delete_entity(self.CONTENT_PARTITION, content_hash)
+            logger.info(f"Released content claim {content_hash[:12]}")
+        except ResourceNotFoundError:
+            pass
+
+    @staticmethod
+    def _idempotency_row_key(key: str) -> str:
+        # Client keys may contain characters Table Storage forbids in a RowKey
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get_idempotent_response(self, key: str) -> Optional[Dict]:
+        """Return the stored response for an idempotency key, or None."""
+        try:
+            entity = self._table_client.get_entity(self.IDEMPOTENCY_PARTITION, self._idempotency_row_key(key))
+        except ResourceNotFoundError:
+            return None
+        return json.loads(entity["response"])
+
+    def save_idempotent_response(self, key: str, response: Dict) -> Optional[Dict]:
+        """
+        Store the response for an idempotency key.
+        
+        Returns:
+            None if stored, or the response saved earlier by a concurrent request
+        """
+        try:
+            self._table_client.create_entity({
+                "PartitionKey": self.IDEMPOTENCY_PARTITION,
+                "RowKey": self._idempotency_row_key(key),
+                "created_at": datetime.utcnow().isoformat(),
+                "response": json.dumps(response)
+            })
+            return None
+        except ResourceExistsError:
+            return self.get_idempotent_response(key)
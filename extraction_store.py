@@ -0,0 +1,241 @@
+# extraction_store.py
+import os
+import json
+import mmap
+import struct
+import logging
+import tempfile
+import threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EXTR"
+VERSION = 1
+
+# magic, version, reserved, page_count, paragraph_count, kv_count, meta_length
+HEADER = struct.Struct("<4sHHIIII")
+
+
+def _pad4(length):
+    return (4 - length % 4) % 4
+
+
+class ExtractionRecord:
+    """
+    Memory-mapped view of one stored extraction result.
+
+    Strings are decoded only when read, so streaming a record into the indexer
+    never holds more than the current paragraph in Python objects.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        try:
+            self._parse(view)
+        except Exception as e:
+            # The map can only be closed once no view into it is left
+            view.release()
+            self.close()
+            if isinstance(e, ValueError):
+                raise
+            raise ValueError(f"Corrupt extraction record: {file_path}: {str(e)}") from e
+        view.release()
+
+    def _parse(self, view):
+        magic, version, _, self.page_count, self.paragraph_count, self.kv_count, meta_length = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an extraction record (version {VERSION}): {self.file_path}")
+
+        string_count = self.paragraph_count + 2 * self.kv_count
+        position = HEADER.size
+        self._offsets = view[position:position + 4 * (string_count + 1)].cast("I")
+        position += 4 * (string_count + 1)
+        self._pages = view[position:position + 4 * self.paragraph_count].cast("i")
+        position += 4 * self.paragraph_count
+        self._roles = view[position:position + self.paragraph_count]
+        position += self.paragraph_count + _pad4(self.paragraph_count)
+        meta = json.loads(bytes(view[position:position + meta_length]).decode("utf-8"))
+        position += meta_length + _pad4(meta_length)
+        self._text = view[position:]
+
+        self._role_names = meta["roles"]
+        self.metadata = meta["metadata"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for name in ("_offsets", "_pages", "_roles", "_text"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+                setattr(self, name, None)
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _string(self, index):
+        return bytes(self._text[self._offsets[index]:self._offsets[index + 1]]).decode("utf-8")
+
+    def paragraph(self, index):
+        """Return one layout paragraph as {"content", "role", "page_number"}."""
+        page_number = self._pages[index]
+        return {
+            "content": self._string(index),
+            "role": self._role_names[self._roles[index]],
+            "page_number": page_number or None
+        }
+
+    def iter_layout_paragraphs(self):
+        for index in range(self.paragraph_count):
+            yield self.paragraph(index)
+
+    @property
+    def key_value_pairs(self):
+        start = self.paragraph_count
+        return {self._string(start + 2 * i): self._string(start + 2 * i + 1) for i in range(self.kv_count)}
+
+    def to_extract_result(self):
+        """Rebuild the dict returned by extract_text_from_document."""
+        layout_paragraphs = list(self.iter_layout_paragraphs())
+        paragraphs = [paragraph["content"] for paragraph in layout_paragraphs]
+        return {
+            "success": True,
+            "text": "\n\n".join(paragraphs),
+            "paragraphs": paragraphs,
+            "layout_paragraphs": layout_paragraphs,
+            "key_value_pairs": self.key_value_pairs,
+            "page_count": self.page_count,
+            "from_store": True
+        }
+
+
+class ExtractionStore:
+    """
+    Persistent store of Form Recognizer results keyed by content hash.
+
+    Each result is one binary file, laid out for memory-mapping:
+
+    - header: magic, version and page, paragraph and key-value counts
+    - uint32 offset table into the string blob (paragraphs, then key/value pairs)
+    - int32 page number per paragraph (0 = unknown)
+    - uint8 layout role per paragraph, indexing the role table
+    - JSON role table and document metadata (document ID, blob name and URL)
+    - UTF-8 string blob
+
+    Reindexing reads these instead of analyzing the documents again.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.getenv("EXTRACTION_STORE_PATH", "extraction_store")
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, content_hash):
+        return os.path.join(self.path, content_hash[:2], f"{content_hash}.bin")
+
+    def __contains__(self, content_hash):
+        return bool(content_hash) and os.path.exists(self._file(content_hash))
+
+    def put(self, content_hash, extract_result, metadata=None):
+        """
+        Persist an extraction result.
+
+        Args:
+            content_hash: SHA-256 of the analyzed document
+            extract_result: Result of extract_text_from_document
+            metadata: Optional dict stored alongside (document_id, blob_name, blob_url)
+
+        Returns:
+            int: Size of the stored record in bytes
+        """
+        layout_paragraphs = extract_result.get("layout_paragraphs")
+        if layout_paragraphs is None:
+            layout_paragraphs = [{"content": paragraph, "role": None, "page_number": None}
+                                 for paragraph in extract_result.get("paragraphs", [])]
+        key_value_pairs = extract_result.get("key_value_pairs") or {}
+
+        roles = [None]
+        role_ids = {None: 0}
+        offsets = array("I", [0])
+        pages = array("i")
+        role_bytes = bytearray()
+        text = bytearray()
+
+        def append_string(value):
+            text.extend((value or "").encode("utf-8"))
+            offsets.append(len(text))
+
+        for paragraph in layout_paragraphs:
+            append_string(paragraph.get("content"))
+            pages.append(paragraph.get("page_number") or 0)
+            role = paragraph.get("role")
+            if role not in role_ids:
+                role_ids[role] = len(roles)
+                roles.append(role)
+            role_bytes.append(role_ids[role])
+        for key, value in key_value_pairs.items():
+            append_string(key)
+            append_string(value)
+
+        meta = json.dumps({"roles": roles, "metadata": metadata or {}}).encode("utf-8")
+        header = HEADER.pack(MAGIC, VERSION, 0, extract_result.get("page_count", 0),
+                             len(layout_paragraphs), len(key_value_pairs), len(meta))
+
+        file_path = self._file(content_hash)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(offsets.tobytes())
+                f.write(pages.tobytes())
+                f.write(role_bytes + b"\0" * _pad4(len(role_bytes)))
+                f.write(meta + b"\0" * _pad4(len(meta)))
+                f.write(text)
+                size = f.tell()
+            os.replace(tmp_path, file_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        logger.debug(f"Stored extraction {content_hash[:12]}: {len(layout_paragraphs)} paragraphs, {size} bytes")
+        return size
+
+    def get(self, content_hash):
+        """
+        Open a stored result as an ExtractionRecord, or return None.
+
+        Raises ValueError when the stored file is not a readable record.
+        """
+        if content_hash not in self:
+            return None
+        return ExtractionRecord(self._file(content_hash))
+
+    def iter_hashes(self):
+        """Yield the content hashes of all stored results."""
+        for prefix in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".bin"):
+                    yield name[:-len(".bin")]
+
+
+_extraction_store = None
+_extraction_store_lock = threading.Lock()
+
+
+def get_extraction_store():
+    """Return the process-wide extraction store."""
+    global _extraction_store
+    if _extraction_store is None:
+        with _extraction_store_lock:
+            if _extraction_store is None:
+                _extraction_store = ExtractionStore()
+    return _extraction_store
@@ -0,0 +1,152 @@
+# index_alias.py
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+
+class IndexAlias:
+    """
+    Pointer from a logical index name (SEARCH_INDEX_NAME) to the physical index
+    serving reads, e.g. "documents" -> "documents-v3".
+
+    A rebuild fills a new index while the alias still points at the old one,
+    records it as the building index so live ingestion writes to both, then
+    switches the pointer in one write. Readers re-resolve the alias at most every
+    SEARCH_ALIAS_TTL_SECONDS, so every process follows the switch without a restart.
+
+    The pointer is an entity in Azure Table Storage when a storage connection
+    string is configured, otherwise a JSON file (SEARCH_ALIAS_PATH) for
+    single-machine setups.
+    """
+    PARTITION_KEY = "alias"
+
+    def __init__(self, name=None, ttl_seconds=None, connection_string=None, path=None):
+        self.name = name or os.getenv("SEARCH_INDEX_NAME", "documents")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SEARCH_ALIAS_TTL_SECONDS", 15))
+        self._lock = threading.Lock()
+        self._cached = None
+        self._cached_at = 0.0
+
+        connection_string = connection_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        self._connection_string = None
+        self._table_client = None
+        self.path = None
+        if connection_string and not path:
+            # The table is connected to on first read, not at construction
+            self._connection_string = connection_string
+        else:
+            self.path = path or os.getenv("SEARCH_ALIAS_PATH", "search_alias.json")
+
+    def _table(self):
+        if self._table_client is None:
+            from azure.data.tables import TableServiceClient
+
+            table_name = os.getenv("SEARCH_ALIAS_TABLE", "searchindexalias")
+            service_client = TableServiceClient.from_connection_string(self._connection_string)
+            service_client.create_table_if_not_exists(table_name)
+            self._table_client = service_client.get_table_client(table_name)
+        return self._table_client
+
+    def _default(self):
+        # Before the first rebuild the logical name is itself the physical index
+        return {"index_name": self.name, "generation": 0, "schema_version": None,
+                "building_index": None, "switched_at": None}
+
+    def _read(self):
+        if self._connection_string:
+            from azure.core.exceptions import ResourceNotFoundError
+            try:
+                entity = self._table().get_entity(self.PARTITION_KEY, self.name)
+            except ResourceNotFoundError:
+                return self._default()
+            state = self._default()
+            state.update({key: entity.get(key) for key in state})
+            return state
+
+        if not os.path.exists(self.path):
+            return self._default()
+        with open(self.path, "r", encoding="utf-8") as f:
+            aliases = json.load(f)
+        return dict(self._default(), **aliases.get(self.name, {}))
+
+    def _write(self, state):
+        if self._connection_string:
+            from azure.data.tables import UpdateMode
+            entity = {"PartitionKey": self.PARTITION_KEY, "RowKey": self.name}
+            entity.update({key: value for key, value in state.items() if value is not None})
+            # Replace so cleared fields (building_index) are dropped
+            self._table().upsert_entity(entity, mode=UpdateMode.REPLACE)
+        else:
+            aliases = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    aliases = json.load(f)
+            aliases[self.name] = state
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(aliases, f)
+            os.replace(tmp_path, self.path)
+
+        with self._lock:
+            self._cached = dict(state)
+            self._cached_at = time.monotonic()
+
+    def get(self, refresh=False):
+        """Return the alias state, re-reading it once the cached copy is older than the TTL."""
+        with self._lock:
+            if not refresh and self._cached is not None and time.monotonic() - self._cached_at < self.ttl_seconds:
+                return dict(self._cached)
+        try:
+            state = self._read()
+        except Exception as e:
+            if self._cached is None:
+                raise
+            # Keep serving the last known index if the pointer store is unreachable
+            logger.warning(f"Could not read index alias '{self.name}', using cached value: {str(e)}")
+            return dict(self._cached)
+        with self._lock:
+            self._cached = state
+            self._cached_at = time.monotonic()
+        return dict(state)
+
+    def resolve(self):
+        """Name of the physical index that serves reads."""
+        return self.get()["index_name"]
+
+    def write_targets(self):
+        """Indexes that new documents must be written to: the live one and any being built."""
+        state = self.get()
+        targets = [state["index_name"]]
+        if state["building_index"] and state["building_index"] not in targets:
+            targets.append(state["building_index"])
+        return targets
+
+    def set_building(self, index_name):
+        """Record (or with None, clear) the index a rebuild is filling."""
+        state = self.get(refresh=True)
+        state["building_index"] = index_name
+        self._write(state)
+        logger.info(f"Index alias '{self.name}': building index set to {index_name}")
+
+    def switch(self, index_name, generation, schema_version):
+        """Point reads at index_name and end the rebuild."""
+        state = self.get(refresh=True)
+        previous = state["index_name"]
+        self._write({
+            "index_name": index_name,
+            "generation": generation,
+            "schema_version": schema_version,
+            "building_index": None,
+            "switched_at": datetime.now(pytz.UTC).isoformat()
+        })
+        logger.info(f"Index alias '{self.name}' switched from {previous} to {index_name}")
+        return previous
@@ -0,0 +1,273 @@
+# ingestion_jobs.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytz
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+INGESTION_STAGES = ("upload", "extract", "index")
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue has no room for another job."""
+
+
+class JobStore:
+    """
+    Status snapshots of ingestion jobs and bulk batches, shared by worker processes.
+    
+    A job lives in the process that runs it, but its status is polled through
+    /jobs/<id> on any worker. Each change is written to SQLite (INGESTION_JOBS_PATH,
+    default ingestion_jobs.db), so a worker that does not run a job can still
+    report it. With an empty path nothing is written and each process only knows
+    its own jobs. Snapshots are dropped ttl_seconds after their last change.
+    """
+    def __init__(self, path=None, ttl_seconds=None):
+        self.path = path if path is not None else os.environ.get("INGESTION_JOBS_PATH", "ingestion_jobs.db")
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("INGESTION_JOB_TTL_SECONDS", 7 * 24 * 3600))
+        self._lock = threading.Lock()
+        self._conn = None
+        self._opened = False
+        self._writes_since_trim = 0
+
+    def _connection(self):
+        """Open the database on first use, so importing the app creates no file; the caller holds self._lock."""
+        if not self._opened:
+            self._opened = True
+            if self.path:
+                try:
+                    self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+                    self._conn.execute("PRAGMA journal_mode=WAL")
+                    self._conn.execute(
+                        "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                        "updated_at REAL NOT NULL)"
+                    )
+                    logger.info(f"Job store opened at {self.path}")
+                except sqlite3.Error as e:
+                    logger.error(f"Could not open job store, job status is per process: {str(e)}")
+                    self._conn = None
+        return self._conn
+
+    def save(self, job):
+        """Write a job or batch snapshot; failures are logged, never raised."""
+        if not job:
+            return
+        value = json.dumps(job, default=str, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            try:
+                conn.execute("INSERT OR REPLACE INTO jobs (job_id, value, updated_at) VALUES (?, ?, ?)",
+                             (job["id"], value, now))
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 256:
+                    self._writes_since_trim = 0
+                    conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.ttl_seconds,))
+            except sqlite3.Error as e:
+                logger.warning(f"Job store write failed: {str(e)}")
+
+    def get(self, job_id):
+        """Return the last snapshot of a job or batch, or None."""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                row = conn.execute("SELECT value FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Job store read failed: {str(e)}")
+                return None
+        return json.loads(row[0]) if row else None
+
+
+class IngestionJobQueue:
+    """
+    Runs document ingestion jobs on a bounded worker pool and tracks per-stage progress.
+    
+    A job runs the upload -> extract -> index stages of process_document in a worker
+    thread so the request that submitted it can return immediately. With a job
+    store, every status change is also written there for other workers to report.
+    """
+    def __init__(self, process_func, max_workers=None, max_pending=None, max_finished_jobs=1000, job_store=None):
+        """
+        Args:
+            process_func: Callable taking a job source and on_stage, such as
+                process_document(file_path, on_stage=...) or
+                process_uploaded_document(upload_result, on_stage=...)
+            max_workers: Number of worker threads (INGESTION_MAX_WORKERS, default 2)
+            max_pending: Maximum queued + running jobs (INGESTION_MAX_PENDING, default 50)
+            max_finished_jobs: How many finished jobs to keep for status lookups
+            job_store: Optional JobStore the job status is written to
+        """
+        self.process_func = process_func
+        self.job_store = job_store
+        self.max_workers = max_workers or int(os.environ.get("INGESTION_MAX_WORKERS", 2))
+        self.max_pending = max_pending or int(os.environ.get("INGESTION_MAX_PENDING", 50))
+        self.max_finished_jobs = max_finished_jobs
+        
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingestion")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._finished_order = []
+        logger.info(f"Ingestion job queue initialized with {self.max_workers} workers, {self.max_pending} pending slots")
+
+    def submit(self, source, on_success=None, cleanup=None, metadata=None, completed_stages=None, process_func=None):
+        """
+        Enqueue a document for ingestion.
+        
+        Args:
+            source: First argument for process_func (file path or upload result)
+            on_success: Optional callable(process_result) run after a successful ingestion;
+                its return value is merged into the job result
+            cleanup: Optional callable(process_result) always run when the job finishes
+            metadata: Optional dict stored on the job (e.g. file name, bot id)
+            completed_stages: Optional {stage: duration_seconds} for stages already
+                done before the job was queued (e.g. a streamed upload)
+            process_func: Optional callable used for this job instead of the queue's process_func
+            
+        Returns:
+            The job status dict
+            
+        Raises:
+            QueueFullError: If max_pending jobs are already queued or running
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Ingestion queue is full ({self.max_pending} pending jobs)")
+        
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": datetime.now(pytz.UTC).isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "metadata": metadata or {},
+            "stages": {stage: {"status": "pending", "duration": None} for stage in INGESTION_STAGES},
+            "result": None,
+            "error": None
+        }
+        for stage, duration in (completed_stages or {}).items():
+            job["stages"][stage] = {"status": "completed", "duration": round(duration, 3)}
+        with self._lock:
+            self._jobs[job_id] = job
+        
+        try:
+            self._executor.submit(self._run, job_id, source, on_success, cleanup, process_func or self.process_func)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        
+        logger.info(f"Ingestion job {job_id} queued")
+        return self._publish(job_id)
+
+    def is_full(self):
+        """True if a submit() right now would raise QueueFullError."""
+        if not self._slots.acquire(blocking=False):
+            return True
+        self._slots.release()
+        return False
+
+    def get_job(self, job_id):
+        """Return a snapshot of a job's status, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            snapshot["stages"] = {
+                name: {key: value for key, value in stage.items() if not key.startswith("_")}
+                for name, stage in job["stages"].items()
+            }
+            return snapshot
+
+    def stats(self):
+        """Return job counts by status."""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"workers": self.max_workers, "max_pending": self.max_pending, "jobs": counts}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _publish(self, job_id):
+        """Write the job's current status to the job store and return it."""
+        job = self.get_job(job_id)
+        if self.job_store is not None:
+            self.job_store.save(job)
+        return job
+
+    def _on_stage(self, job_id, stage, status):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._jobs[job_id]["stages"].setdefault(stage, {"status": "pending", "duration": None})
+            entry["status"] = status
+            if status == "running":
+                entry["_started"] = now
+                entry["started_at"] = datetime.now(pytz.UTC).isoformat()
+            elif "_started" in entry:
+                entry["duration"] = round(now - entry.pop("_started"), 3)
+        self._publish(job_id)
+        logger.debug(f"Ingestion job {job_id}: stage '{stage}' {status}")
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = datetime.now(pytz.UTC).isoformat()
+        self._publish(job_id)
+        with self._lock:
+            self._finished_order.append(job_id)
+            while len(self._finished_order) > self.max_finished_jobs:
+                self._jobs.pop(self._finished_order.pop(0), None)
+
+    def _run(self, job_id, source, on_success, cleanup, process_func):
+        with self._lock:
+            self._jobs[job_id]["status"] = "running"
+            self._jobs[job_id]["started_at"] = datetime.now(pytz.UTC).isoformat()
+        self._publish(job_id)
+        
+        result = None
+        try:
+            result = process_func(source, on_stage=lambda stage, status: self._on_stage(job_id, stage, status))
+            if result.get("success"):
+                if on_success:
+                    extra = on_success(result)
+                    if extra:
+                        result.update(extra)
+                self._finish(job_id, "completed", result=result)
+                logger.info(f"Ingestion job {job_id} completed: document {result.get('document_id')}")
+            else:
+                self._finish(job_id, "failed", result=result, error=result.get("error"))
+                logger.error(f"Ingestion job {job_id} failed at stage '{result.get('stage')}': {result.get('error')}")
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} crashed: {str(e)}", exc_info=True)
+            self._finish(job_id, "failed", result=result, error=str(e))
+        finally:
+            if cleanup:
+                try:
+                    cleanup(result)
+                except Exception as e:
+                    logger.warning(f"Cleanup for ingestion job {job_id} failed: {str(e)}")
+            self._slots.release()
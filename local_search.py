@@ -0,0 +1,575 @@
+# local_search.py
+import os
+import re
+import json
+import mmap
+import uuid
+import shutil
+import logging
+import threading
+import contextlib
+from array import array
+
+import numpy as np
+
+from search_backend import SearchBackend, IndexingResult
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Fields whose text is indexed for full-text search
+SEARCHABLE_FIELDS = ("heading", "content")
+
+# Filter masks kept between searches; all are dropped on any index change
+MASK_CACHE_SIZE = 256
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class FileLock:
+    """
+    Advisory lock on a file shared by every process using an index directory.
+    
+    Re-entrant within a process: nested acquisitions reuse the outer lock, so
+    the outermost acquisition decides between shared and exclusive. Callers
+    serialize threads with their own lock.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._depth = 0
+    
+    @contextlib.contextmanager
+    def hold(self, shared=False):
+        if self._depth == 0:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a+b")
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            else:
+                # msvcrt has no shared locks
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+                self._file.close()
+                self._file = None
+
+
+class LocalBM25Backend(SearchBackend):
+    """
+    In-process BM25 search engine with on-disk persistence.
+    
+    An index directory holds a merged segment and an append-only operation log:
+    
+    - postings.bin: int32 (doc number, term frequency) pairs grouped by term,
+      memory-mapped on load and scored with NumPy
+    - lexicon.json: term -> [offset, count] into postings.bin
+    - documents.json: stored documents and their token lengths
+    - oplog.jsonl: upserts and deletes since the last merge, replayed on load
+    - generation: token that changes whenever the directory is rewritten
+    
+    Adds and deletes are applied in memory and appended to the log; the log is
+    merged into a new segment once it holds merge_threshold operations.
+    
+    Several processes may share an index directory. Writes and merges hold an
+    exclusive lock on <index>.lock and first catch up with the log, so every
+    process numbers documents the same way. Before each search the generation
+    and log size are checked; a new generation is reloaded and new log entries
+    are replayed.
+    """
+    name = "local"
+    
+    def __init__(self, path=None, index_name=None, k1=1.2, b=0.75, merge_threshold=None):
+        base_path = path or os.getenv("LOCAL_SEARCH_PATH", "local_search_index")
+        self.index_name = index_name or os.getenv("SEARCH_INDEX_NAME", "documents")
+        self.path = os.path.join(base_path, self.index_name)
+        self.k1 = k1
+        self.b = b
+        self.merge_threshold = merge_threshold or int(os.getenv("LOCAL_SEARCH_MERGE_THRESHOLD", 2000))
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.path + ".lock")
+        self._reset_state()
+        with self._lock, self._file_lock.hold(shared=True):
+            self._load()
+    
+    # -- storage -----------------------------------------------------------
+    
+    def _file(self, name):
+        return os.path.join(self.path, name)
+    
+    def _reset_state(self):
+        self._close_segment()
+        self._documents = []        # doc number -> stored document, None once deleted
+        self._keys = {}             # document key -> doc number
+        self._lengths = np.zeros(1024, dtype=np.float32)  # doc number -> token count
+        self._alive = np.zeros(1024, dtype=bool)          # doc number -> not deleted
+        self._by_parent = {}        # parent_id -> live doc numbers
+        self._by_bot = {}           # bot id -> live doc numbers
+        self._mask_cache = {}
+        self._norm_cache = (None, None)
+        self._total_length = 0
+        self._lexicon = {}          # term -> (offset, count) in the merged segment
+        self._postings = None       # (n, 2) int32 array over the mapped segment
+        self._segment_size = 0      # doc numbers covered by the merged segment
+        self._delta = {}            # term -> ([doc numbers], [tfs]) added since the merge
+        self._delta_arrays = {}     # term -> NumPy copies of _delta entries
+        self._pending_ops = 0
+        self._generation = None
+        self._log_offset = 0        # bytes of oplog.jsonl applied
+    
+    def _close_segment(self):
+        self._postings = None
+        mapped = getattr(self, "_mmap", None)
+        if mapped is not None:
+            mapped.close()
+        self._mmap = None
+    
+    def _read_generation(self):
+        try:
+            with open(self._file("generation"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def _write_generation(self):
+        with open(self._file("generation.tmp"), "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(self._file("generation.tmp"), self._file("generation"))
+    
+    def _log_size(self):
+        try:
+            return os.path.getsize(self._file("oplog.jsonl"))
+        except FileNotFoundError:
+            return 0
+    
+    def _load(self):
+        """Load the index from disk; the caller holds the file lock."""
+        with self._lock:
+            self._reset_state()
+            if not os.path.isdir(self.path):
+                return
+            self._generation = self._read_generation()
+            
+            if os.path.exists(self._file("documents.json")):
+                with open(self._file("documents.json"), "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+                self._documents = stored["documents"]
+                with open(self._file("lexicon.json"), "r", encoding="utf-8") as f:
+                    self._lexicon = {term: tuple(entry) for term, entry in json.load(f).items()}
+                if os.path.getsize(self._file("postings.bin")) > 0:
+                    with open(self._file("postings.bin"), "rb") as f:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._postings = np.frombuffer(self._mmap, dtype=np.int32).reshape(-1, 2)
+                
+                self._reserve(len(self._documents))
+                self._lengths[:len(stored["lengths"])] = stored["lengths"]
+                for doc_number, document in enumerate(self._documents):
+                    if document is not None:
+                        self._add_live(doc_number, document)
+            
+            self._segment_size = len(self._documents)
+            self._replay_log()
+            
+            logger.info(f"Local search index '{self.index_name}' loaded: {len(self._keys)} documents, "
+                        f"{len(self._lexicon)} merged terms, {self._pending_ops} pending operations")
+    
+    def _replay_log(self):
+        """Apply log entries written since _log_offset, by any process."""
+        if not os.path.exists(self._file("oplog.jsonl")):
+            return
+        with open(self._file("oplog.jsonl"), "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # A line without its newline is still being written
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            op = json.loads(line)
+            if op["op"] == "upsert":
+                self._apply_upsert(op["doc"])
+            else:
+                self._apply_delete(op["id"])
+            self._pending_ops += 1
+        self._log_offset += end
+    
+    def _sync(self):
+        """Catch up with changes made by other processes; the caller holds the file lock."""
+        if self._read_generation() != self._generation or self._log_size() < self._log_offset:
+            self._load()
+        elif self._log_size() > self._log_offset:
+            self._replay_log()
+    
+    def _refresh(self):
+        """Cheap check before a search; locks only when another process changed the index."""
+        if self._read_generation() == self._generation and self._log_size() == self._log_offset:
+            return
+        with self._file_lock.hold(shared=True):
+            self._sync()
+    
+    @contextlib.contextmanager
+    def _writing(self):
+        """Exclusive access for a change, starting from the latest state on disk."""
+        with self._lock, self._file_lock.hold():
+            self._ensure_directory()
+            self._sync()
+            yield
+    
+    def _append_log(self, ops):
+        with open(self._file("oplog.jsonl"), "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_offset = self._log_size()
+        self._pending_ops += len(ops)
+        if self._pending_ops >= self.merge_threshold:
+            self.merge()
+    
+    def merge(self):
+        """Write live documents into a new compacted segment and clear the log."""
+        with self._writing():
+            live = [doc_number for doc_number, document in enumerate(self._documents) if document is not None]
+            renumber = np.full(len(self._documents), -1, dtype=np.int64)
+            renumber[live] = np.arange(len(live))
+            
+            postings = array("i")
+            lexicon = {}
+            terms = set(self._lexicon) | set(self._delta)
+            for term in sorted(terms):
+                doc_numbers, tfs = self._term_postings(term)
+                doc_numbers = renumber[doc_numbers]
+                kept = doc_numbers >= 0
+                if not kept.any():
+                    continue
+                entries = np.stack([doc_numbers[kept], tfs[kept]], axis=1).astype(np.int32)
+                entries = entries[np.argsort(entries[:, 0], kind="stable")]
+                lexicon[term] = (len(postings) // 2, len(entries))
+                postings.frombytes(entries.tobytes())
+            # Drop the last views of the mapped segment before it is closed
+            doc_numbers = tfs = None
+            
+            documents = [self._documents[doc_number] for doc_number in live]
+            lengths = [int(self._lengths[doc_number]) for doc_number in live]
+            
+            with open(self._file("postings.bin.tmp"), "wb") as f:
+                postings.tofile(f)
+            with open(self._file("lexicon.json.tmp"), "w", encoding="utf-8") as f:
+                json.dump(lexicon, f)
+            with open(self._file("documents.json.tmp"), "w", encoding="utf-8") as f:
+                json.dump({"documents": documents, "lengths": lengths}, f)
+            
+            self._close_segment()
+            for name in ("postings.bin", "lexicon.json", "documents.json"):
+                os.replace(self._file(name + ".tmp"), self._file(name))
+            open(self._file("oplog.jsonl"), "w").close()
+            self._write_generation()
+            
+            self._load()
+            logger.info(f"Merged local search index '{self.index_name}': {len(documents)} documents, {len(lexicon)} terms")
+    
+    # -- in-memory updates ---------------------------------------------------
+    
+    def _reserve(self, size):
+        if size <= len(self._lengths):
+            return
+        capacity = max(size, 2 * len(self._lengths))
+        lengths = np.zeros(capacity, dtype=np.float32)
+        lengths[:len(self._lengths)] = self._lengths
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._lengths, self._alive = lengths, alive
+    
+    def _add_live(self, doc_number, document):
+        self._keys[document["id"]] = doc_number
+        self._alive[doc_number] = True
+        self._total_length += int(self._lengths[doc_number])
+        self._by_parent.setdefault(document.get("parent_id"), set()).add(doc_number)
+        for bot_id in document.get("bot_ids") or ():
+            self._by_bot.setdefault(bot_id, set()).add(doc_number)
+        self._mask_cache.clear()
+    
+    def _apply_upsert(self, document):
+        self._apply_delete(document["id"])
+        
+        tokens = []
+        for field in SEARCHABLE_FIELDS:
+            tokens.extend(tokenize(document.get(field)))
+        frequencies = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+        
+        doc_number = len(self._documents)
+        self._documents.append(document)
+        self._reserve(doc_number + 1)
+        self._lengths[doc_number] = len(tokens)
+        self._add_live(doc_number, document)
+        for term, tf in frequencies.items():
+            doc_numbers, tfs = self._delta.setdefault(term, ([], []))
+            doc_numbers.append(doc_number)
+            tfs.append(tf)
+            self._delta_arrays.pop(term, None)
+    
+    def _apply_delete(self, key):
+        doc_number = self._keys.pop(key, None)
+        if doc_number is None:
+            return False
+        document = self._documents[doc_number]
+        self._documents[doc_number] = None
+        self._alive[doc_number] = False
+        self._total_length -= int(self._lengths[doc_number])
+        self._by_parent.get(document.get("parent_id"), set()).discard(doc_number)
+        for bot_id in document.get("bot_ids") or ():
+            self._by_bot.get(bot_id, set()).discard(doc_number)
+        self._mask_cache.clear()
+        return True
+    
+    def _term_postings(self, term):
+        """(doc numbers, term frequencies) of a term, merged segment first, as int32 arrays."""
+        parts = []
+        entry = self._lexicon.get(term)
+        if entry is not None and self._postings is not None:
+            offset, count = entry
+            pairs = self._postings[offset:offset + count]
+            parts.append((pairs[:, 0], pairs[:, 1]))
+        if term in self._delta:
+            arrays = self._delta_arrays.get(term)
+            if arrays is None:
+                doc_numbers, tfs = self._delta[term]
+                arrays = (np.array(doc_numbers, dtype=np.int32), np.array(tfs, dtype=np.int32))
+                self._delta_arrays[term] = arrays
+            parts.append(arrays)
+        if not parts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+    
+    def _norms(self, average_length):
+        """BM25 length normalization of every document for the current average length."""
+        key, norms = self._norm_cache
+        if key != (average_length, len(self._documents)):
+            lengths = self._lengths[:len(self._documents)]
+            norms = (self.k1 * (1 - self.b + self.b * lengths / average_length)).astype(np.float32)
+            self._norm_cache = ((average_length, len(self._documents)), norms)
+        return norms
+    
+    def _filter_mask(self, parent_ids, ids, bot_id):
+        """Boolean mask over doc numbers of the documents a search may return, or None for all."""
+        key = (tuple(sorted(parent_ids)) if parent_ids else None, tuple(sorted(ids)) if ids else None, bot_id)
+        if key == (None, None, None):
+            return None
+        mask = self._mask_cache.get(key)
+        if mask is not None and len(mask) == len(self._documents):
+            return mask
+        
+        mask = self._alive[:len(self._documents)].copy()
+        if parent_ids:
+            allowed = np.zeros(len(self._documents), dtype=bool)
+            for parent_id in set(parent_ids):
+                allowed[list(self._by_parent.get(parent_id, ()))] = True
+            mask &= allowed
+        if ids:
+            allowed = np.zeros(len(self._documents), dtype=bool)
+            allowed[[self._keys[key] for key in ids if key in self._keys]] = True
+            mask &= allowed
+        if bot_id is not None:
+            allowed = np.zeros(len(self._documents), dtype=bool)
+            allowed[list(self._by_bot.get(bot_id, ()))] = True
+            mask &= allowed
+        
+        if len(self._mask_cache) >= MASK_CACHE_SIZE:
+            self._mask_cache.clear()
+        self._mask_cache[key] = mask
+        return mask
+    
+    # -- SearchBackend -------------------------------------------------------
+    
+    def _ensure_directory(self):
+        if os.path.isdir(self.path):
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        # A new generation, so processes holding a deleted index reload
+        self._write_generation()
+        return True
+    
+    def ensure_index(self):
+        with self._lock, self._file_lock.hold():
+            if not self._ensure_directory():
+                return {"success": True, "created": False}
+            self._load()
+            logger.info(f"Created local search index '{self.index_name}' at {self.path}")
+            return {"success": True, "created": True}
+    
+    def delete_index(self):
+        with self._lock, self._file_lock.hold():
+            existed = os.path.isdir(self.path)
+            self._reset_state()
+            if existed:
+                shutil.rmtree(self.path)
+                logger.info(f"Deleted local search index '{self.index_name}'")
+            return existed
+    
+    def upload_documents(self, documents):
+        with self._writing():
+            results = []
+            ops = []
+            for document in documents:
+                if not document.get("id"):
+                    results.append(IndexingResult(document.get("id"), False, "Document key is required"))
+                    continue
+                self._apply_upsert(document)
+                ops.append({"op": "upsert", "doc": document})
+                results.append(IndexingResult(document["id"], True, None))
+            if ops:
+                self._append_log(ops)
+            return results
+    
+    def delete_documents(self, keys):
+        with self._writing():
+            results = []
+            ops = []
+            for key in keys:
+                self._apply_delete(key)
+                ops.append({"op": "delete", "id": key})
+                results.append(IndexingResult(key, True, None))
+            if ops:
+                self._append_log(ops)
+            return results
+    
+    def merge_documents(self, documents):
+        with self._writing():
+            results = []
+            ops = []
+            for changes in documents:
+                doc_number = self._keys.get(changes.get("id"))
+                if doc_number is None:
+                    results.append(IndexingResult(changes.get("id"), False, "Document not found"))
+                    continue
+                document = dict(self._documents[doc_number], **changes)
+                self._apply_upsert(document)
+                ops.append({"op": "upsert", "doc": document})
+                results.append(IndexingResult(document["id"], True, None))
+            if ops:
+                self._append_log(ops)
+            return results
+    
+    def list_documents(self, parent_id, select=None):
+        with self._lock:
+            self._refresh()
+            documents = [self._documents[doc_number] for doc_number in sorted(self._by_parent.get(parent_id, ()))]
+        if select:
+            return [{field: document.get(field) for field in select} for document in documents]
+        return [dict(document) for document in documents]
+    
+    def has_field(self, name):
+        # Documents are schemaless here
+        return True
+    
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._keys)
+    
+    def search(self, query_text, top=5, parent_ids=None, select=None, highlight_fields=None, ids=None,
+               bot_id=None, **kwargs):
+        terms = list(dict.fromkeys(tokenize(query_text)))
+        
+        with self._lock:
+            self._refresh()
+            live_count = len(self._keys)
+            if not terms or not live_count:
+                return {"results": [], "total": 0}
+            average_length = self._total_length / live_count or 1.0
+            mask = self._filter_mask(parent_ids, ids, bot_id)
+            
+            norms = self._norms(average_length)
+            
+            scores = None
+            touched = []
+            for term in terms:
+                doc_numbers, tfs = self._term_postings(term)
+                if not len(doc_numbers):
+                    continue
+                doc_numbers = doc_numbers.astype(np.intp)
+                # Document frequency counts live documents, filtered or not
+                live = self._alive.take(doc_numbers)
+                document_frequency = int(np.count_nonzero(live))
+                if not document_frequency:
+                    continue
+                keep = mask.take(doc_numbers) if mask is not None else live
+                if mask is not None or document_frequency < len(doc_numbers):
+                    doc_numbers, tfs = doc_numbers[keep], tfs[keep]
+                    if not len(doc_numbers):
+                        continue
+                
+                idf = np.log1p((live_count - document_frequency + 0.5) / (document_frequency + 0.5))
+                tfs = tfs.astype(np.float32)
+                weights = tfs * np.float32((self.k1 + 1) * idf) / (tfs + norms.take(doc_numbers))
+                if scores is None:
+                    scores = np.zeros(len(self._documents), dtype=np.float32)
+                    scores[doc_numbers] = weights
+                else:
+                    np.add.at(scores, doc_numbers, weights)
+                touched.append(doc_numbers)
+            
+            if scores is None:
+                return {"results": [], "total": 0}
+            # Every weight is positive, so the matched documents are the touched ones
+            if sum(len(doc_numbers) for doc_numbers in touched) < len(scores) // 8:
+                matched = np.unique(np.concatenate(touched))
+            else:
+                matched = np.flatnonzero(scores)
+            total = len(matched)
+            best = matched[np.argpartition(-scores[matched], top - 1)[:top]] if total > top else matched
+            best = best[np.argsort(-scores[best], kind="stable")]
+            documents = [(self._documents[doc_number], float(scores[doc_number])) for doc_number in best]
+        
+        results = []
+        for document, score in documents:
+            result = {field: document.get(field) for field in select} if select else dict(document)
+            result["@search.score"] = score
+            if highlight_fields:
+                highlights = {}
+                for field in highlight_fields.split(","):
+                    fragments = highlight_text(document.get(field.strip()), terms)
+                    if fragments:
+                        highlights[field.strip()] = fragments
+                result["@search.highlights"] = highlights
+            results.append(result)
+        
+        return {"results": results, "total": total}
+
+
+def highlight_text(text, terms, max_fragments=5, pre_tag="<em>", post_tag="</em>"):
+    """Return sentences containing any of the terms, with the matches wrapped in tags."""
+    if not text or not terms:
+        return []
+    pattern = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b", re.IGNORECASE)
+    fragments = []
+    for sentence in SENTENCE_PATTERN.split(text):
+        if pattern.search(sentence):
+            fragments.append(pattern.sub(lambda match: f"{pre_tag}{match.group(0)}{post_tag}", sentence.strip()))
+            if len(fragments) >= max_fragments:
+                break
+    return fragments
@@ -0,0 +1,92 @@
+"""
+Manage search index shards.
+
+Bots are served from the shared shard (SEARCH_INDEX_NAME) unless routed to
+another one; a tenant gets a dedicated shard by moving its bots there. Moves
+run online: writes go to both shards while passages are copied, and reads
+switch once the copy is verified.
+
+Usage:
+    python manage_shards.py list
+    python manage_shards.py add-shard <name> [--description text]
+    python manage_shards.py move <bot_id> <shard> [--keep-source]
+    python manage_shards.py search <query> [--top 10]
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage search index shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List shards and bot routes")
+    add_shard = commands.add_parser("add-shard", help="Register a shard and create its index")
+    add_shard.add_argument("shard")
+    add_shard.add_argument("--description", default="")
+    move = commands.add_parser("move", help="Move a bot to another shard while it keeps serving")
+    move.add_argument("bot_id")
+    move.add_argument("shard")
+    move.add_argument("--keep-source", action="store_true", help="Leave the bot's passages on the source shard")
+    search = commands.add_parser("search", help="Search all shards (admin)")
+    search.add_argument("query")
+    search.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from document_processor import (
+        shard_router, get_shard_alias, ensure_search_index_exists, move_bot_to_shard, search_documents
+    )
+
+    if args.command == "list":
+        for shard in shard_router.list_shards(refresh=True):
+            default = " (default)" if shard == shard_router.default_shard else ""
+            print(f"{shard}{default} -> {get_shard_alias(shard).resolve()}")
+        for bot_id, route in sorted(shard_router.list_routes().items()):
+            moving = f" (moving to {route['moving_to']})" if route.get("moving_to") else ""
+            print(f"  bot {bot_id}: {route['shard']}{moving}")
+
+    elif args.command == "add-shard":
+        shard_router.add_shard(args.shard, description=args.description)
+        result = ensure_search_index_exists(shard=args.shard)
+        if not result.get("success"):
+            logger.error(f"Failed to create search index: {result.get('error')}")
+            sys.exit(1)
+        logger.info(f"Shard {args.shard} ready")
+
+    elif args.command == "move":
+        from bot_model import BotModel
+        bot = BotModel().get_bot(args.bot_id)
+        if not bot:
+            logger.error(f"Bot not found: {args.bot_id}")
+            sys.exit(1)
+        if args.shard not in shard_router.list_shards(refresh=True):
+            logger.error(f"Unknown shard: {args.shard}")
+            sys.exit(1)
+        result = move_bot_to_shard(args.bot_id, args.shard, bot.get("document_ids") or [],
+                                   cleanup=not args.keep_source)
+        print(json.dumps(result, indent=2))
+        if not result["success"]:
+            sys.exit(1)
+
+    elif args.command == "search":
+        result = search_documents(args.query, top=args.top)
+        if not result["success"]:
+            logger.error(f"Search failed: {result.get('error')}")
+            sys.exit(1)
+        for item in result["results"]:
+            print(f"{item['score']:.3f}  {item['file_name']}  {item['chunk_id']}")
+        print(f"{result['count']} of {result['total']} passages")
+
+if __name__ == "__main__":
+    main()
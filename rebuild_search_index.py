@@ -1,69 +1,139 @@
 """
-Script to rebuild the Azure Cognitive Search index with the updated schema.
+Rebuild the search index of one shard without downtime (blue/green).
+
+Creates the next index generation (e.g. documents-v4) with the current schema,
+bulk-loads it from the extraction store with parallel senders, verifies the
+passage count and then switches the index alias. search_documents follows the
+alias within SEARCH_ALIAS_TTL_SECONDS, so chat keeps using the previous
+generation until the switch. Documents ingested during the rebuild are written
+to both generations. Only documents of bots routed to the shard are loaded (for
+the default shard also documents without a bot).
+
+Usage:
+    python rebuild_search_index.py [--shard documents] [--batch-documents 50] [--batch-passages 1000]
+                                   [--concurrency 8] [--verify-timeout 120] [--drop-old]
 """
 
 import os
-import logging
 import sys
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents import SearchClient
+import time
+import logging
+import argparse
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def wait_for_count(backend, expected, timeout):
+    """Poll the index document count until it reaches expected; counts lag behind writes."""
+    deadline = time.monotonic() + timeout
+    while True:
+        count = backend.count()
+        if count >= expected or time.monotonic() >= deadline:
+            return count
+        time.sleep(2)
+
 def main():
-    """Main function to delete and recreate the search index."""
+    """Build the next index generation and switch reads to it."""
+    parser = argparse.ArgumentParser(description="Blue/green rebuild of the search index")
+    parser.add_argument("--shard", default=None, help="Shard to rebuild (default: SEARCH_INDEX_NAME)")
+    parser.add_argument("--batch-documents", type=int, default=50, help="Documents per indexing request")
+    parser.add_argument("--batch-passages", type=int, default=1000, help="Passages per indexing request")
+    parser.add_argument("--concurrency", type=int, default=8, help="Indexing requests in flight")
+    parser.add_argument("--verify-timeout", type=float, default=120, help="Seconds to wait for the new index count")
+    parser.add_argument("--drop-old", action="store_true", help="Delete the previous generation after the switch")
+    args = parser.parse_args()
+
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    backend_name = os.environ.get("SEARCH_BACKEND", "azure")
+    if backend_name == "azure" and not all([os.environ.get("SEARCH_ENDPOINT"), os.environ.get("SEARCH_API_KEY")]):
+        logger.error("Missing Azure Search configuration. Please check your .env file.")
+        sys.exit(1)
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from search_backend import SCHEMA_VERSION, versioned_index_name
+    from document_processor import (
+        shard_router, get_shard_alias, get_index_backend, get_indexing_stats, build_search_passages, index_passage_batch
+    )
+    from reindex_from_store import reindex
+    from bot_model import BotModel
+
+    shard = args.shard or shard_router.default_shard
+    if shard not in shard_router.list_shards(refresh=True):
+        logger.error(f"Unknown shard: {shard}")
+        sys.exit(1)
+    search_alias = get_shard_alias(shard)
+    state = search_alias.get(refresh=True)
+    if state["building_index"]:
+        logger.warning(f"A previous rebuild into {state['building_index']} did not finish, replacing it")
+    generation = (state["generation"] or 0) + 1
+    new_index = versioned_index_name(search_alias.name, generation)
+    logger.info(f"Live index: {state['index_name']} (schema {state['schema_version']}); "
+                f"building {new_index} with schema {SCHEMA_VERSION}")
+
+    target = get_index_backend(new_index)
+    if target.delete_index():
+        logger.info(f"Deleted leftover index '{new_index}'")
+    result = target.ensure_index()
+    if not result.get("success"):
+        logger.error(f"Failed to create search index: {result.get('error')}")
+        sys.exit(1)
+
+    # From here on live ingestion and bot membership changes also go to the new index
+    search_alias.set_building(new_index)
     try:
-        # Load environment variables
-        from dotenv import load_dotenv
-        load_dotenv()
-        
-        # Get Azure Search configuration
-        search_endpoint = os.environ.get("SEARCH_ENDPOINT")
-        search_api_key = os.environ.get("SEARCH_API_KEY")
-        search_index_name = os.environ.get("SEARCH_INDEX_NAME", "document-search-index")
-        
-        if not all([search_endpoint, search_api_key]):
-            logger.error("Missing Azure Search configuration. Please check your .env file.")
-            sys.exit(1)
-        
-        # Initialize search clients
-        credential = AzureKeyCredential(search_api_key)
-        search_index_client = SearchIndexClient(endpoint=search_endpoint, credential=credential)
-        
-        # Import necessary components from document_processor
-        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from document_processor import ensure_search_index_exists
+        # Processes holding a cached alias still write only to the live index; let
+        # them all see the new one before the extraction store is read
+        wait_seconds = search_alias.ttl_seconds * 2
+        logger.info(f"Waiting {wait_seconds:.0f}s for every process to start writing to {new_index}")
+        time.sleep(wait_seconds)
         
-        # Check if the index exists
-        logger.info(f"Checking if search index '{search_index_name}' exists")
-        indexes = list(search_index_client.list_indexes())
-        index_exists = any(index.name == search_index_name for index in indexes)
+        bot_memberships = BotModel().get_document_memberships()
         
-        if index_exists:
-            # Delete the existing index
-            logger.info(f"Deleting existing search index '{search_index_name}'")
-            search_index_client.delete_index(search_index_name)
-            logger.info(f"Search index '{search_index_name}' deleted successfully")
+        def on_shard(doc_id, bot_ids):
+            if not bot_ids:
+                return shard == shard_router.default_shard
+            return any(shard in shard_router.write_shards(bot_id) for bot_id in bot_ids)
         
-        # Create the index with the updated schema
-        logger.info("Creating new search index with updated schema")
-        # Call ensure_search_index_exists directly
-        os.environ["SEARCH_INDEX_NAME"] = search_index_name  # Ensure correct index name
-        from document_processor import init_azure_services
-        init_azure_services()  # Initialize services
-        result = ensure_search_index_exists()
-        
-        if result.get("success"):
-            logger.info("Search index rebuilt successfully!")
-            logger.info("Note: You'll need to re-upload your documents to populate the index")
-        else:
-            logger.error(f"Failed to create search index: {result.get('error')}")
-    
+        stats = reindex(
+            build_passages_func=build_search_passages,
+            index_batch_func=lambda batch: index_passage_batch(batch, backend=target),
+            batch_documents=args.batch_documents,
+            batch_passages=args.batch_passages,
+            concurrency=args.concurrency,
+            bot_memberships=bot_memberships,
+            include_document=on_shard
+        )
+        rate = stats["passages"] / stats["seconds"] if stats["seconds"] else 0.0
+        logger.info(f"Loaded {stats['documents']} documents ({stats['passages']} passages) "
+                    f"into {new_index} in {stats['seconds']:.1f}s, {rate:.0f} passages/s")
+        logger.info(f"Indexer throughput: {get_indexing_stats().get(new_index)}")
+
+        if stats["failed_documents"]:
+            raise RuntimeError(f"{len(stats['failed_documents'])} documents failed to index: {stats['failed_documents']}")
+
+        count = wait_for_count(target, stats["passages"], args.verify_timeout)
+        if count < stats["passages"]:
+            raise RuntimeError(f"Index {new_index} holds {count} passages, expected at least {stats['passages']}")
+        logger.info(f"Verified {count} passages in {new_index}")
     except Exception as e:
-        logger.error(f"Error rebuilding search index: {str(e)}", exc_info=True)
+        search_alias.set_building(None)
+        logger.error(f"Rebuild aborted, reads stay on {state['index_name']}: {str(e)}", exc_info=True)
+        sys.exit(1)
+
+    previous = search_alias.switch(new_index, generation, SCHEMA_VERSION)
+    logger.info(f"Search index rebuilt successfully! Reads switch from {previous} to {new_index} "
+                f"within {search_alias.ttl_seconds:.0f}s")
+    logger.info("Documents uploaded before extraction results were stored must be re-uploaded")
+
+    if args.drop_old and previous != new_index:
+        # Let every process pick up the new alias before the old index disappears
+        time.sleep(search_alias.ttl_seconds * 2)
+        if get_index_backend(previous).delete_index():
+            logger.info(f"Deleted previous index '{previous}'")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,138 @@
+"""
+Reindex every stored extraction result into the search index, without
+re-running Form Recognizer.
+
+Passages are rebuilt from the memory-mapped extraction records with the current
+chunking and schema, and sent to the search backend in batches by several
+concurrent senders, so a rebuild is bounded by indexing throughput.
+
+Usage:
+    python reindex_from_store.py [--batch-documents 20] [--batch-passages 1000] [--concurrency 4]
+"""
+
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction_store import get_extraction_store
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def iter_passage_batches(store, build_passages_func, batch_documents, batch_passages, bot_memberships=None,
+                         include_document=None):
+    """Yield {document_id: passages} batches built from the stored extraction results."""
+    batch = {}
+    batch_size = 0
+    for content_hash in store.iter_hashes():
+        try:
+            record = store.get(content_hash)
+        except ValueError as e:
+            logger.warning(f"Skipping unreadable stored extraction {content_hash[:12]}: {str(e)}")
+            continue
+        if record is None:
+            continue
+        with record:
+            metadata = record.metadata
+            doc_id = metadata.get("document_id")
+            if not doc_id:
+                logger.warning(f"Skipping stored extraction {content_hash[:12]} without a document ID")
+                continue
+            bot_ids = (bot_memberships or {}).get(doc_id, [])
+            if include_document is not None and not include_document(doc_id, bot_ids):
+                continue
+            blob_info = dict(metadata, bot_ids=bot_ids)
+            passages = build_passages_func(doc_id, blob_info, record.to_extract_result())
+
+        batch[doc_id] = passages
+        batch_size += len(passages)
+        if len(batch) >= batch_documents or batch_size >= batch_passages:
+            yield batch
+            batch = {}
+            batch_size = 0
+    if batch:
+        yield batch
+
+def reindex(build_passages_func=None, index_batch_func=None, store=None,
+            batch_documents=20, batch_passages=1000, concurrency=4, bot_memberships=None,
+            include_document=None):
+    """
+    Stream stored extraction results into the search backend.
+
+    Args:
+        build_passages_func: build_search_passages(doc_id, blob_info, extract_result)
+        index_batch_func: index_passage_batch({doc_id: passages}) -> {doc_id: outcome}
+        store: Extraction store to read, defaults to the process-wide store
+        batch_documents: Most documents per indexing request
+        batch_passages: Most passages per indexing request
+        concurrency: Indexing requests in flight
+        bot_memberships: Document ID -> bot IDs, written to each passage's bot_ids
+        include_document: Optional predicate (doc_id, bot_ids) selecting the documents to index
+
+    Returns:
+        dict: Counts of documents and passages indexed and failed, and timings
+    """
+    if build_passages_func is None or index_batch_func is None:
+        from document_processor import build_search_passages, index_passage_batch
+        build_passages_func = build_passages_func or build_search_passages
+        index_batch_func = index_batch_func or index_passage_batch
+    store = store or get_extraction_store()
+
+    stats = {"documents": 0, "passages": 0, "failed_documents": [], "seconds": 0.0}
+    started = time.monotonic()
+
+    def send(batch):
+        return batch, index_batch_func(batch)
+
+    def collect(future):
+        batch, outcome = future.result()
+        for doc_id, passages in batch.items():
+            result = outcome.get(doc_id, {})
+            if result.get("failed_keys"):
+                stats["failed_documents"].append(doc_id)
+            else:
+                stats["documents"] += 1
+                stats["passages"] += len(passages)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="reindex") as executor:
+        in_flight = []
+        for batch in iter_passage_batches(store, build_passages_func, batch_documents, batch_passages,
+                                          bot_memberships, include_document):
+            in_flight.append(executor.submit(send, batch))
+            # Bound the batches held in memory while senders catch up
+            if len(in_flight) >= 2 * concurrency:
+                collect(in_flight.pop(0))
+        for future in in_flight:
+            collect(future)
+
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Reindex stored extraction results")
+    parser.add_argument("--batch-documents", type=int, default=20, help="Documents per indexing request")
+    parser.add_argument("--batch-passages", type=int, default=1000, help="Passages per indexing request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Indexing requests in flight")
+    args = parser.parse_args()
+
+    from document_processor import ensure_search_index_exists, get_indexing_stats
+    result = ensure_search_index_exists()
+    if not result.get("success"):
+        logger.error(f"Search index unavailable: {result.get('error')}")
+        return
+
+    from bot_model import BotModel
+    stats = reindex(batch_documents=args.batch_documents, batch_passages=args.batch_passages,
+                    concurrency=args.concurrency, bot_memberships=BotModel().get_document_memberships())
+    rate = stats["passages"] / stats["seconds"] if stats["seconds"] else 0.0
+    logger.info(f"Reindexed {stats['documents']} documents ({stats['passages']} passages) "
+                f"in {stats['seconds']:.1f}s, {rate:.0f} passages/s")
+    for index_name, indexer_stats in get_indexing_stats().items():
+        logger.info(f"Indexer {index_name}: {indexer_stats}")
+    if stats["failed_documents"]:
+        logger.error(f"{len(stats['failed_documents'])} documents failed: {stats['failed_documents']}")
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,8 @@
 import os
 import logging
 from dotenv import load_dotenv
-from azure.search.documents.indexes import SearchIndexClient
-from azure.search.documents import SearchClient
-from azure.search.documents.indexes.models import (
-    SearchIndex, SimpleField, SearchableField,
-    SearchFieldDataType
-)
-from azure.core.credentials import AzureKeyCredential
+from search_backend import get_search_backend
+from index_alias import IndexAlias
 
 # Configure logging
 logging.basicConfig(
@@ -21,61 +16,29 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 logger.debug("Environment variables loaded")
 
-# Define Search Service details
-search_endpoint = os.getenv("SEARCH_ENDPOINT")
-search_key = os.getenv("SEARCH_API_KEY")
-search_index_name = os.getenv("SEARCH_INDEX_NAME", "documents")
-logger.info(f"Using search endpoint: {search_endpoint}")
+# Define Search Service details; the live index is the one the alias points at
+search_index_name = IndexAlias(os.getenv("SEARCH_INDEX_NAME", "documents")).resolve()
+logger.info(f"Using search backend: {os.getenv('SEARCH_BACKEND', 'azure')}")
 logger.info(f"Using search index name: {search_index_name}")
 
-# Initialize Search clients
-search_credential = AzureKeyCredential(search_key)
-search_index_client = SearchIndexClient(endpoint=search_endpoint, credential=search_credential)
+# Initialize the search backend
+search_backend = get_search_backend(index_name=search_index_name)
 
 def delete_search_index():
     """Delete the search index if it exists."""
     try:
-        indexes = list(search_index_client.list_indexes())
-        index_exists = any(index.name == search_index_name for index in indexes)
-        
-        if index_exists:
-            logger.info(f"Deleting existing index '{search_index_name}'")
-            search_index_client.delete_index(search_index_name)
-            logger.info(f"Successfully deleted index '{search_index_name}'")
-            return True
-        else:
-            logger.info(f"Index '{search_index_name}' does not exist, no need to delete")
-            return False
+        return search_backend.delete_index()
     except Exception as e:
         logger.error(f"Error deleting search index: {str(e)}", exc_info=True)
         return False
 
 def create_search_index():
-    """Create a new search index with a compatible schema."""
-    try:
-        # Define a simplified schema compatible with the API version
-        fields = [
-            SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-            SimpleField(name="blob_name", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="blob_url", type=SearchFieldDataType.String),
-            SimpleField(name="file_name", type=SearchFieldDataType.String, filterable=True, sortable=True),
-            SimpleField(name="file_type", type=SearchFieldDataType.String, filterable=True),
-            SimpleField(name="created_at", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
-            SimpleField(name="page_count", type=SearchFieldDataType.Int32, filterable=True),
-            SearchableField(name="content", type=SearchFieldDataType.String, analyzer_name="en.microsoft"),
-            SearchableField(name="paragraph_content", type=SearchFieldDataType.String, searchable=True)
-        ]
-        
-        index = SearchIndex(name=search_index_name, fields=fields)
-        
-        logger.debug("Sending index creation request to Azure Cognitive Search")
-        result = search_index_client.create_or_update_index(index)
+    """Create a new search index with the current schema."""
+    result = search_backend.ensure_index()
+    if result.get("success"):
         logger.info(f"Search index '{search_index_name}' created successfully")
-        
         return True
-    except Exception as e:
-        logger.error(f"Error creating search index: {str(e)}", exc_info=True)
-        return False
+    return False
 
 if __name__ == "__main__":
     logger.info("Starting search index reset process")
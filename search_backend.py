@@ -0,0 +1,308 @@
+# search_backend.py
+import os
+import time
+import asyncio
+import logging
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Version of build_index_fields(); bump it with every schema change and run
+# rebuild_search_index.py to load a new index generation with the new schema
+SCHEMA_VERSION = 2
+
+# Outcome of indexing one document, mirroring azure.search.documents.IndexingResult
+IndexingResult = namedtuple("IndexingResult", ["key", "succeeded", "error_message"])
+
+
+class SearchBackend:
+    """
+    Interface between document_processor and a passage search engine.
+    
+    Documents are flat dicts keyed by "id"; "parent_id" holds the source document
+    ID and "bot_ids" the bots the document is attached to. search() returns a dict with "results" (documents
+    with "@search.score" and, when requested, "@search.highlights") and "total".
+    """
+    name = "base"
+    
+    def ensure_index(self):
+        """Create the index if it does not exist. Returns {"success": bool, "created": bool}."""
+        raise NotImplementedError
+    
+    def delete_index(self):
+        """Delete the index. Returns True if an index was deleted."""
+        raise NotImplementedError
+    
+    def upload_documents(self, documents):
+        """Add or replace documents. Returns a list of IndexingResult."""
+        raise NotImplementedError
+    
+    def delete_documents(self, keys):
+        """Delete documents by key. Returns a list of IndexingResult."""
+        raise NotImplementedError
+    
+    def merge_documents(self, documents):
+        """Update the given fields of existing documents. Returns a list of IndexingResult."""
+        raise NotImplementedError
+    
+    def list_documents(self, parent_id, select=None):
+        """Return every passage of one source document, with only the selected fields."""
+        raise NotImplementedError
+    
+    def has_field(self, name):
+        """Whether the index schema has field `name` (older index generations may not)."""
+        raise NotImplementedError
+    
+    def search(self, query_text, top=5, parent_ids=None, select=None, highlight_fields=None, bot_id=None, **kwargs):
+        """
+        Run a full-text query.
+        
+        Args:
+            query_text: Query string
+            top: Maximum number of results
+            parent_ids: Only return passages of these source documents
+            bot_id: Only return passages attached to this bot
+            select: Fields to return (all fields if None)
+            highlight_fields: Comma-separated fields to produce highlights for
+            
+        Returns:
+            dict: {"results": [...], "total": int}
+        """
+        raise NotImplementedError
+    
+    async def search_async(self, query_text, top=5, parent_ids=None, select=None, highlight_fields=None, bot_id=None,
+                           **kwargs):
+        """Async search(); backends without an async client run search() in a worker thread."""
+        return await asyncio.to_thread(self.search, query_text, top=top, parent_ids=parent_ids, select=select,
+                                       highlight_fields=highlight_fields, bot_id=bot_id, **kwargs)
+    
+    async def close_async(self):
+        """Release async clients."""
+    
+    def count(self):
+        """Number of documents in the index."""
+        raise NotImplementedError
+
+
+class AzureSearchBackend(SearchBackend):
+    """Azure Cognitive Search backend."""
+    name = "azure"
+    
+    def __init__(self, endpoint=None, key=None, index_name=None):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents import SearchClient
+        from azure.search.documents.indexes import SearchIndexClient
+        
+        self.endpoint = endpoint or os.getenv("SEARCH_ENDPOINT")
+        self.index_name = index_name or os.getenv("SEARCH_INDEX_NAME", "documents")
+        self.credential = AzureKeyCredential(key or os.getenv("SEARCH_API_KEY"))
+        self.index_client = SearchIndexClient(endpoint=self.endpoint, credential=self.credential)
+        self.search_client = SearchClient(endpoint=self.endpoint, index_name=self.index_name, credential=self.credential)
+        # Created on first async search, inside the event loop that uses it
+        self._async_search_client = None
+        self._field_names = None
+        logger.debug(f"Azure search backend initialized for index: {self.index_name}")
+    
+    def _index_exists(self):
+        from azure.core.exceptions import ResourceNotFoundError
+        
+        # A single GET instead of listing every index on the service
+        try:
+            self.index_client.get_index(self.index_name)
+            return True
+        except ResourceNotFoundError:
+            return False
+    
+    def ensure_index(self):
+        from azure.search.documents.indexes.models import SearchIndex
+        
+        try:
+            logger.debug(f"Checking if search index '{self.index_name}' exists")
+            if self._index_exists():
+                logger.info(f"Search index '{self.index_name}' already exists")
+                return {"success": True, "created": False}
+            
+            logger.info(f"Creating new search index '{self.index_name}'")
+            index = SearchIndex(name=self.index_name, fields=build_index_fields())
+            
+            logger.debug("Sending index creation request to Azure Cognitive Search")
+            self.index_client.create_or_update_index(index)
+            logger.info(f"Search index '{self.index_name}' created with standard configuration")
+            
+            return {"success": True, "created": True}
+        except Exception as e:
+            logger.error(f"Error creating search index: {str(e)}", exc_info=True)
+            return {"success": False, "error": str(e)}
+    
+    def delete_index(self):
+        if not self._index_exists():
+            logger.info(f"Index '{self.index_name}' does not exist, no need to delete")
+            return False
+        logger.info(f"Deleting existing index '{self.index_name}'")
+        self.index_client.delete_index(self.index_name)
+        logger.info(f"Successfully deleted index '{self.index_name}'")
+        return True
+    
+    def upload_documents(self, documents):
+        results = self.search_client.upload_documents(documents=documents)
+        return [IndexingResult(item.key, item.succeeded, getattr(item, "error_message", None)) for item in results]
+    
+    def delete_documents(self, keys):
+        results = self.search_client.delete_documents(documents=[{"id": key} for key in keys])
+        return [IndexingResult(item.key, item.succeeded, getattr(item, "error_message", None)) for item in results]
+    
+    def search(self, query_text, top=5, parent_ids=None, select=None, highlight_fields=None, bot_id=None, **kwargs):
+        search_options = self._search_options(query_text, top, parent_ids, select, highlight_fields, bot_id, kwargs)
+        paged = self.search_client.search(**search_options)
+        results = list(paged)
+        return {"results": results, "total": paged.get_count()}
+    
+    async def search_async(self, query_text, top=5, parent_ids=None, select=None, highlight_fields=None, bot_id=None,
+                           **kwargs):
+        if self._async_search_client is None:
+            from azure.search.documents.aio import SearchClient as AsyncSearchClient
+            self._async_search_client = AsyncSearchClient(endpoint=self.endpoint, index_name=self.index_name,
+                                                          credential=self.credential)
+        search_options = self._search_options(query_text, top, parent_ids, select, highlight_fields, bot_id, kwargs)
+        paged = await self._async_search_client.search(**search_options)
+        results = [result async for result in paged]
+        return {"results": results, "total": await paged.get_count()}
+    
+    async def close_async(self):
+        if self._async_search_client is not None:
+            await self._async_search_client.close()
+            self._async_search_client = None
+    
+    def _search_options(self, query_text, top, parent_ids, select, highlight_fields, bot_id, kwargs):
+        search_options = {
+            "search_text": query_text,
+            "top": top,
+            "include_total_count": True
+        }
+        if select:
+            search_options["select"] = select
+        if highlight_fields:
+            search_options.update({
+                "highlight_fields": highlight_fields,
+                "highlight_pre_tag": "<em>",
+                "highlight_post_tag": "</em>"
+            })
+        search_options.update(kwargs)
+        
+        # Single filter clauses whose cost does not grow with the number of documents
+        filters = []
+        if bot_id:
+            filters.append(f"bot_ids/any(b: b eq {_quote(bot_id)})")
+        if parent_ids:
+            filters.append(f"search.in(parent_id, {_quote(','.join(parent_ids))}, ',')")
+        if filters:
+            search_options["filter"] = " and ".join(filters)
+            logger.debug(f"Using filter expression: {search_options['filter']}")
+        return search_options
+    
+    def merge_documents(self, documents):
+        results = self.search_client.merge_documents(documents=documents)
+        return [IndexingResult(item.key, item.succeeded, getattr(item, "error_message", None)) for item in results]
+    
+    def list_documents(self, parent_id, select=None):
+        paged = self.search_client.search(
+            search_text="*",
+            filter=f"parent_id eq {_quote(parent_id)}",
+            select=select,
+            top=1000
+        )
+        return list(paged)
+    
+    def has_field(self, name):
+        if self._field_names is None:
+            self._field_names = {field.name for field in self.index_client.get_index(self.index_name).fields}
+        return name in self._field_names
+    
+    def count(self):
+        return self.search_client.get_document_count()
+
+
+def _quote(value):
+    """OData string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def versioned_index_name(base_name, generation):
+    """Physical name of one index generation, e.g. documents-v3."""
+    return f"{base_name}-v{generation}"
+
+
+def upload_documents_with_retry(backend, documents, max_attempts=3, backoff_seconds=1.0, on_retry=None):
+    """
+    Upload documents, retrying only the keys that failed.
+    
+    on_retry, if given, is called with the number of documents about to be retried.
+    
+    Returns:
+        list: IndexingResult for every document, after the final attempt
+    """
+    by_key = {document["id"]: document for document in documents}
+    results = {}
+    pending = list(documents)
+    for attempt in range(1, max_attempts + 1):
+        try:
+            batch_results = backend.upload_documents(pending)
+        except Exception as e:
+            # The whole request failed; every pending document is retried
+            batch_results = [IndexingResult(document["id"], False, str(e)) for document in pending]
+        for item in batch_results:
+            results[item.key] = item
+        failed = [item.key for item in batch_results if not item.succeeded]
+        if not failed or attempt == max_attempts:
+            break
+        logger.warning(f"Retrying {len(failed)} of {len(pending)} documents (attempt {attempt + 1}/{max_attempts})")
+        if on_retry:
+            on_retry(len(failed))
+        time.sleep(backoff_seconds * 2 ** (attempt - 1))
+        pending = [by_key[key] for key in failed]
+    return list(results.values())
+
+
+def build_index_fields():
+    """Field definitions for the passage search index, version SCHEMA_VERSION."""
+    from azure.search.documents.indexes.models import SimpleField, SearchableField, SearchFieldDataType
+    
+    return [
+        SimpleField(name="id", type=SearchFieldDataType.String, key=True, filterable=True),
+        SimpleField(name="parent_id", type=SearchFieldDataType.String, filterable=True),
+        SimpleField(name="bot_ids", type=SearchFieldDataType.Collection(SearchFieldDataType.String), filterable=True),
+        SimpleField(name="chunk_ordinal", type=SearchFieldDataType.Int32, filterable=True, sortable=True),
+        SimpleField(name="page_numbers", type=SearchFieldDataType.Collection(SearchFieldDataType.Int32), filterable=True),
+        SimpleField(name="blob_name", type=SearchFieldDataType.String, filterable=True),
+        SimpleField(name="blob_url", type=SearchFieldDataType.String),
+        SimpleField(name="file_name", type=SearchFieldDataType.String, filterable=True, sortable=True),
+        SimpleField(name="file_type", type=SearchFieldDataType.String, filterable=True),
+        SimpleField(name="created_at", type=SearchFieldDataType.DateTimeOffset, filterable=True, sortable=True),
+        SimpleField(name="page_count", type=SearchFieldDataType.Int32, filterable=True),
+        SearchableField(name="heading", type=SearchFieldDataType.String, analyzer_name="en.microsoft"),
+        SearchableField(name="content", type=SearchFieldDataType.String, analyzer_name="en.microsoft"),
+        SimpleField(name="preview", type=SearchFieldDataType.String)
+    ]
+
+
+def get_search_backend(name=None, **kwargs):
+    """
+    Build the search backend selected by SEARCH_BACKEND: 'azure' (default) or
+    'local' (in-process BM25 stored under LOCAL_SEARCH_PATH).
+    """
+    name = (name or os.getenv("SEARCH_BACKEND", "azure")).lower()
+    if name == "local":
+        from local_search import LocalBM25Backend
+        return LocalBM25Backend(**kwargs)
+    if name == "azure":
+        return AzureSearchBackend(**kwargs)
+    raise ValueError(f"Unknown search backend: {name}")
@@ -0,0 +1,218 @@
+# search_indexer.py
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from search_backend import IndexingResult, upload_documents_with_retry
+
+logger = logging.getLogger(__name__)
+
+
+class _Submission:
+    """Documents handed in by one caller, resolved once all of them were sent."""
+    def __init__(self, count):
+        self.future = Future()
+        self.remaining = count
+        self.results = []
+
+
+class BufferedIndexer:
+    """
+    Buffering sender for search document uploads.
+
+    Documents from concurrent callers are collected into shared upload requests
+    of at most max_documents documents and max_bytes of JSON payload. A buffer is
+    sent as soon as it reaches either limit, or once its oldest document has
+    waited flush_seconds. Up to `concurrency` requests are in flight; keys that
+    fail are retried on their own with exponential backoff.
+    """
+    def __init__(self, backend, max_documents=None, max_bytes=None, flush_seconds=None,
+                 max_attempts=None, backoff_seconds=None, concurrency=None):
+        """
+        Args:
+            backend: SearchBackend to upload to
+            max_documents: Documents per request (SEARCH_INDEX_BATCH_DOCUMENTS, default 1000)
+            max_bytes: Payload bytes per request (SEARCH_INDEX_BATCH_BYTES, default 8 MB)
+            flush_seconds: Longest a document waits in the buffer (SEARCH_INDEX_FLUSH_SECONDS, default 0.5)
+            max_attempts: Attempts per document (SEARCH_INDEX_MAX_ATTEMPTS, default 4)
+            backoff_seconds: First retry delay, doubled per attempt (SEARCH_INDEX_BACKOFF_SECONDS, default 1)
+            concurrency: Requests in flight (SEARCH_INDEX_CONCURRENCY, default 2)
+        """
+        self.backend = backend
+        self.max_documents = max_documents or int(os.getenv("SEARCH_INDEX_BATCH_DOCUMENTS", 1000))
+        self.max_bytes = max_bytes or int(os.getenv("SEARCH_INDEX_BATCH_BYTES", 8 * 1024 * 1024))
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(os.getenv("SEARCH_INDEX_FLUSH_SECONDS", 0.5))
+        self.max_attempts = max_attempts or int(os.getenv("SEARCH_INDEX_MAX_ATTEMPTS", 4))
+        self.backoff_seconds = backoff_seconds if backoff_seconds is not None else float(os.getenv("SEARCH_INDEX_BACKOFF_SECONDS", 1))
+        concurrency = concurrency or int(os.getenv("SEARCH_INDEX_CONCURRENCY", 2))
+
+        self._condition = threading.Condition()
+        self._buffer = deque()      # (document, payload bytes, submission)
+        self._buffer_bytes = 0
+        self._oldest = None
+        self._closed = False
+        self._flush_requested = False
+        self._senders = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="search-indexer")
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "documents": 0,
+            "bytes": 0,
+            "failed_documents": 0,
+            "retried_documents": 0,
+            "send_seconds": 0.0
+        }
+        self._flusher = threading.Thread(target=self._flush_loop, name="search-indexer-flush", daemon=True)
+        self._flusher.start()
+
+    def submit(self, documents):
+        """
+        Queue documents for upload.
+
+        Returns:
+            Future resolving to a list of IndexingResult, one per document
+        """
+        submission = _Submission(len(documents))
+        if not documents:
+            submission.future.set_result([])
+            return submission.future
+
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Indexer is closed")
+            for document in documents:
+                size = len(json.dumps(document, default=str))
+                if not self._buffer:
+                    self._oldest = time.monotonic()
+                self._buffer.append((document, size, submission))
+                self._buffer_bytes += size
+            self._condition.notify()
+        return submission.future
+
+    def upload(self, documents, timeout=None):
+        """Queue documents and wait for their IndexingResults."""
+        return self.submit(documents).result(timeout=timeout)
+
+    def flush(self):
+        """Send everything buffered now, without waiting for the flush interval."""
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify()
+
+    def close(self):
+        """Send what is buffered and stop the sender threads."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._flusher.join()
+        self._senders.shutdown(wait=True)
+
+    def get_stats(self):
+        """Throughput counters since the indexer started."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        with self._condition:
+            stats["buffered_documents"] = len(self._buffer)
+        send_seconds = stats["send_seconds"]
+        stats["send_seconds"] = round(send_seconds, 3)
+        stats["documents_per_second"] = round(stats["documents"] / send_seconds, 1) if send_seconds else 0.0
+        stats["bytes_per_second"] = round(stats["bytes"] / send_seconds) if send_seconds else 0
+        stats["average_batch_documents"] = round(stats["documents"] / stats["requests"], 1) if stats["requests"] else 0.0
+        return stats
+
+    # -- sending -------------------------------------------------------------
+
+    def _ready(self):
+        if not self._buffer:
+            return False
+        return (self._closed or self._flush_requested
+                or len(self._buffer) >= self.max_documents
+                or self._buffer_bytes >= self.max_bytes
+                or time.monotonic() - self._oldest >= self.flush_seconds)
+
+    def _take_batch(self):
+        batch = []
+        batch_bytes = 0
+        while self._buffer and len(batch) < self.max_documents:
+            size = self._buffer[0][1]
+            # A single oversize document is still sent, on its own
+            if batch and batch_bytes + size > self.max_bytes:
+                break
+            batch.append(self._buffer.popleft())
+            batch_bytes += size
+        self._buffer_bytes -= batch_bytes
+        if not self._buffer:
+            # What remains is no older than the previous oldest, so its age stands
+            self._oldest = None
+            self._flush_requested = False
+        return batch, batch_bytes
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                while not self._ready():
+                    if self._closed and not self._buffer:
+                        return
+                    timeout = None
+                    if self._buffer:
+                        timeout = max(0.0, self.flush_seconds - (time.monotonic() - self._oldest))
+                    self._condition.wait(timeout)
+                batch, batch_bytes = self._take_batch()
+            self._senders.submit(self._send, batch, batch_bytes)
+
+    def _count_retries(self, count):
+        with self._stats_lock:
+            self._stats["retried_documents"] += count
+
+    def _send(self, batch, batch_bytes):
+        try:
+            self._send_batch(batch, batch_bytes)
+        except Exception as e:
+            # Callers wait on these futures; an unexpected error must reach them too
+            logger.error(f"Indexing batch of {len(batch)} documents failed: {str(e)}", exc_info=True)
+            failed = []
+            with self._stats_lock:
+                for _, _, submission in batch:
+                    # remaining only changes under this lock, so each submission is resolved once
+                    if submission.remaining > 0:
+                        submission.remaining = 0
+                        failed.append(submission)
+            for submission in failed:
+                submission.future.set_exception(e)
+
+    def _send_batch(self, batch, batch_bytes):
+        documents = [document for document, _, _ in batch]
+        started = time.monotonic()
+        results = upload_documents_with_retry(
+            self.backend, documents, max_attempts=self.max_attempts,
+            backoff_seconds=self.backoff_seconds, on_retry=self._count_retries
+        )
+        elapsed = time.monotonic() - started
+        by_key = {item.key: item for item in results}
+        failed = sum(1 for item in results if not item.succeeded)
+        logger.debug(f"Indexed {len(documents)} documents ({batch_bytes} bytes) into "
+                     f"{getattr(self.backend, 'index_name', '?')} in {elapsed:.2f}s, {failed} failed")
+
+        finished = []
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["documents"] += len(documents)
+            self._stats["bytes"] += batch_bytes
+            self._stats["failed_documents"] += failed
+            self._stats["send_seconds"] += elapsed
+            # A caller's documents may be spread over batches sent by different threads
+            for document, _, submission in batch:
+                if submission.remaining <= 0:
+                    # Already failed by an error in another batch
+                    continue
+                key = document["id"]
+                submission.results.append(by_key.get(key) or IndexingResult(key, False, "No result returned"))
+                submission.remaining -= 1
+                if submission.remaining == 0:
+                    finished.append(submission)
+        for submission in finished:
+            submission.future.set_result(submission.results)
@@ -0,0 +1,196 @@
+# shard_router.py
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+
+class ShardRouter:
+    """
+    Maps bots to search index shards.
+
+    A shard is a logical index name with its own IndexAlias and generations, so
+    each can be rebuilt and scaled on its own. Bots without a route use the
+    default (shared) shard. A tenant gets a dedicated shard by routing all of
+    its bots to it.
+
+    While a bot is moving, its route names both shards: writes go to both,
+    reads stay on the source until the move switches the route.
+
+    Routes and the shard list are entities in Azure Table Storage when a
+    storage connection string is configured, otherwise a JSON file
+    (SEARCH_SHARDS_PATH). Lookups are cached for SEARCH_ROUTE_TTL_SECONDS.
+    """
+    ROUTE_PARTITION = "route"
+    SHARD_PARTITION = "shard"
+
+    def __init__(self, default_shard=None, ttl_seconds=None, connection_string=None, path=None):
+        self.default_shard = default_shard or os.getenv("SEARCH_INDEX_NAME", "documents")
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("SEARCH_ROUTE_TTL_SECONDS", 15))
+        self._lock = threading.Lock()
+        self._routes = {}           # bot_id -> (route or None, cached_at)
+        self._shards = None
+        self._shards_at = 0.0
+
+        connection_string = connection_string or os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        self._connection_string = None
+        self._table_client = None
+        self.path = None
+        if connection_string and not path:
+            # The table is connected to on first use, not at construction
+            self._connection_string = connection_string
+        else:
+            self.path = path or os.getenv("SEARCH_SHARDS_PATH", "search_shards.json")
+
+    # -- storage -------------------------------------------------------------
+
+    def _table(self):
+        if self._table_client is None:
+            from azure.data.tables import TableServiceClient
+
+            table_name = os.getenv("SEARCH_SHARDS_TABLE", "searchshards")
+            service_client = TableServiceClient.from_connection_string(self._connection_string)
+            service_client.create_table_if_not_exists(table_name)
+            self._table_client = service_client.get_table_client(table_name)
+        return self._table_client
+
+    def _load_file(self):
+        if not os.path.exists(self.path):
+            return {self.ROUTE_PARTITION: {}, self.SHARD_PARTITION: {}}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_file(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _get(self, partition, key):
+        if self._connection_string:
+            from azure.core.exceptions import ResourceNotFoundError
+            try:
+                entity = self._table().get_entity(partition, key)
+            except ResourceNotFoundError:
+                return None
+            return json.loads(entity["value"])
+        return self._load_file()[partition].get(key)
+
+    def _put(self, partition, key, value):
+        if self._connection_string:
+            from azure.data.tables import UpdateMode
+            self._table().upsert_entity(
+                {"PartitionKey": partition, "RowKey": key, "value": json.dumps(value)},
+                mode=UpdateMode.REPLACE
+            )
+        else:
+            data = self._load_file()
+            data[partition][key] = value
+            self._save_file(data)
+
+    def _delete(self, partition, key):
+        if self._connection_string:
+            from azure.core.exceptions import ResourceNotFoundError
+            try:
+                self._table().delete_entity(partition, key)
+            except ResourceNotFoundError:
+                pass
+        else:
+            data = self._load_file()
+            data[partition].pop(key, None)
+            self._save_file(data)
+
+    def _list(self, partition):
+        if self._connection_string:
+            entities = self._table().query_entities(f"PartitionKey eq '{partition}'")
+            return {entity["RowKey"]: json.loads(entity["value"]) for entity in entities}
+        return self._load_file()[partition]
+
+    # -- routing -------------------------------------------------------------
+
+    def get_route(self, bot_id, refresh=False):
+        """Return the bot's route {"shard", "moving_to"}, or None if it uses the default shard."""
+        with self._lock:
+            cached = self._routes.get(bot_id)
+            if not refresh and cached and time.monotonic() - cached[1] < self.ttl_seconds:
+                return cached[0]
+        try:
+            route = self._get(self.ROUTE_PARTITION, bot_id)
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning(f"Could not read shard route of bot {bot_id}, using cached value: {str(e)}")
+            return cached[0]
+        with self._lock:
+            self._routes[bot_id] = (route, time.monotonic())
+        return route
+
+    def read_shard(self, bot_id):
+        """Shard that serves searches for a bot."""
+        route = self.get_route(bot_id) if bot_id else None
+        return route["shard"] if route else self.default_shard
+
+    def write_shards(self, bot_id):
+        """Shards that must receive a bot's passages: its shard and, mid-move, the destination."""
+        route = self.get_route(bot_id) if bot_id else None
+        if not route:
+            return [self.default_shard]
+        shards = [route["shard"]]
+        if route.get("moving_to") and route["moving_to"] not in shards:
+            shards.append(route["moving_to"])
+        return shards
+
+    def set_route(self, bot_id, shard, moving_to=None):
+        """Route a bot to a shard; routing to the default shard without a move drops the route."""
+        if shard not in self.list_shards(refresh=True):
+            raise ValueError(f"Unknown shard: {shard}")
+        if shard == self.default_shard and not moving_to:
+            self._delete(self.ROUTE_PARTITION, bot_id)
+            route = None
+        else:
+            route = {"shard": shard, "moving_to": moving_to, "updated_at": datetime.now(pytz.UTC).isoformat()}
+            self._put(self.ROUTE_PARTITION, bot_id, route)
+        with self._lock:
+            self._routes[bot_id] = (route, time.monotonic())
+        logger.info(f"Bot {bot_id} routed to shard {shard}" + (f", moving to {moving_to}" if moving_to else ""))
+
+    def list_routes(self):
+        """All explicit routes, bot_id -> route."""
+        return self._list(self.ROUTE_PARTITION)
+
+    # -- shards --------------------------------------------------------------
+
+    def list_shards(self, refresh=False):
+        """Names of all shards, the default shard first."""
+        with self._lock:
+            if not refresh and self._shards is not None and time.monotonic() - self._shards_at < self.ttl_seconds:
+                return list(self._shards)
+        try:
+            shards = [self.default_shard] + sorted(name for name in self._list(self.SHARD_PARTITION)
+                                                   if name != self.default_shard)
+        except Exception as e:
+            if self._shards is None:
+                raise
+            logger.warning(f"Could not read shard list, using cached value: {str(e)}")
+            return list(self._shards)
+        with self._lock:
+            self._shards = shards
+            self._shards_at = time.monotonic()
+        return list(shards)
+
+    def add_shard(self, shard, description=""):
+        """Register a shard (a logical index name)."""
+        self._put(self.SHARD_PARTITION, shard, {
+            "description": description,
+            "created_at": datetime.now(pytz.UTC).isoformat()
+        })
+        self.list_shards(refresh=True)
+        logger.info(f"Added search shard {shard}")
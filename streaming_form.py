@@ -0,0 +1,120 @@
+# streaming_form.py
+import logging
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NEED_DATA
+
+logger = logging.getLogger(__name__)
+
+
+class MalformedFormError(ValueError):
+    """The request body is not valid multipart/form-data."""
+
+
+class StreamingMultipartForm:
+    """
+    Incremental multipart/form-data parser over a request body stream.
+
+    request.files makes werkzeug spool every file part to memory or a temporary
+    file before the view sees it. This parser reads the body only as fast as the
+    caller consumes it:
+
+    - open_file(name) collects the fields sent before the file part and stops
+      at its headers, so filename checks run before any content is read;
+    - read() returns the file content, so the form itself can be handed to an
+      uploader as a readable stream;
+    - finish() skips what is left of the file and collects the fields sent after
+      it (browsers send fields in the order they were appended).
+
+    Other file parts are skipped. Field values are decoded as UTF-8.
+    """
+    def __init__(self, stream, content_type, chunk_size=64 * 1024, max_form_memory_size=None):
+        mimetype, options = parse_options_header(content_type or "")
+        boundary = options.get("boundary")
+        if mimetype != "multipart/form-data" or not boundary:
+            raise MalformedFormError("Expected a multipart/form-data body")
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = MultipartDecoder(boundary.encode("latin-1"), max_form_memory_size)
+        self._part = None           # Field or File event of the part being read
+        self._value = bytearray()   # value of the current field
+        self._pending = bytearray() # file content decoded but not yet read
+        self._file_open = False
+        self._complete = False
+        self.fields = {}
+        self.filename = None
+
+    def _next_event(self):
+        try:
+            event = self._decoder.next_event()
+            while event is NEED_DATA:
+                # An empty read signals the end of the body; a truncated body then raises ValueError
+                self._decoder.receive_data(self._stream.read(self._chunk_size) or None)
+                event = self._decoder.next_event()
+        except ValueError as e:
+            raise MalformedFormError(str(e)) from e
+        return event
+
+    def _advance(self, file_name=None):
+        """
+        Consume one event outside the file part being read.
+
+        Returns the File event when it opens a part named file_name, otherwise None.
+        """
+        event = self._next_event()
+        if isinstance(event, Field):
+            self._part = event
+            self._value = bytearray()
+        elif isinstance(event, File):
+            self._part = event
+            if file_name is not None and event.name == file_name and self.filename is None:
+                return event
+        elif isinstance(event, Data):
+            if isinstance(self._part, Field):
+                self._value.extend(event.data)
+                if not event.more_data:
+                    self.fields[self._part.name] = self._value.decode("utf-8", "replace")
+            if not event.more_data:
+                self._part = None
+        elif isinstance(event, Epilogue):
+            self._complete = True
+        return None
+
+    def open_file(self, name="file"):
+        """
+        Read up to the headers of file part `name`.
+
+        Returns:
+            bool: Whether the part was found; False once the body ended without it
+        """
+        while not self._complete:
+            event = self._advance(file_name=name)
+            if event is not None:
+                self.filename = event.filename
+                self._file_open = True
+                return True
+        return False
+
+    def read(self, size=-1):
+        """Read content of the open file part; b"" at its end."""
+        while self._file_open and (size is None or size < 0 or len(self._pending) < size):
+            event = self._next_event()
+            self._pending.extend(event.data)
+            if not event.more_data:
+                self._file_open = False
+                self._part = None
+        if size is None or size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def finish(self):
+        """Skip the rest of the file part and collect the remaining fields."""
+        while self._file_open:
+            self._pending.clear()
+            self.read(self._chunk_size)
+        self._pending.clear()
+        while not self._complete:
+            self._advance()
+        return self.fields
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the app's job store in memory, so importing it in tests writes no database
+os.environ.setdefault("INGESTION_JOBS_PATH", "")
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from azure_clients import ClientRegistry
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Closable:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_client_is_built_once_on_first_use_across_threads():
+    registry = ClientRegistry()
+    built = []
+    registry.register("service", lambda: built.append(Closable()) or built[-1])
+
+    assert not registry.is_initialized("service") and built == []
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("service"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(built) == 1
+    assert all(client is built[0] for client in results)
+
+
+def test_failing_factory_is_retried_and_proxy_reports_unavailable():
+    registry = ClientRegistry()
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("service unreachable")
+        return Closable()
+
+    registry.register("service", factory)
+    proxy = registry.proxy("service")
+
+    assert not proxy
+    assert proxy.closed is False
+    assert len(attempts) == 2
+
+
+def test_override_and_reset():
+    registry = ClientRegistry()
+    registry.register("service", Closable)
+    fake = Closable()
+
+    registry.override("service", fake)
+    assert registry.get("service") is fake
+
+    registry.reset("service")
+    assert fake.closed
+    assert registry.get("service") is not fake
+    with pytest.raises(KeyError):
+        registry.get("unknown")
+
+
+def test_importing_app_creates_no_clients():
+    script = ("import app, azure_clients; "
+              "print(sorted(name for name in azure_clients.clients._factories "
+              "if azure_clients.clients.is_initialized(name)))")
+    env = {key: value for key, value in os.environ.items() if not key.startswith("AZURE_")}
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True,
+                            cwd=REPO_ROOT).stdout
+
+    assert output.strip().splitlines()[-1] == "[]"
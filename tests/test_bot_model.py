@@ -0,0 +1,90 @@
+import json
+import threading
+
+import pytest
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+
+import bot_model
+from bot_model import BotModel
+
+
+class FakeEntity(dict):
+    def __init__(self, values, etag):
+        super().__init__(values)
+        self.metadata = {"etag": etag}
+
+
+class FakeTableClient:
+    """One bot entity with an ETag; a concurrent writer can change it between a read and a write."""
+    def __init__(self, document_ids):
+        self.entity = {"PartitionKey": "bot", "RowKey": "bot-1", "name": "Bot", "created_at": "2024-01-01",
+                       "document_ids": json.dumps(document_ids)}
+        self.version = 1
+        self.concurrent_writes = []
+        self.updates = 0
+
+    def get_entity(self, partition_key, row_key):
+        if row_key != self.entity["RowKey"]:
+            raise ResourceNotFoundError("not found")
+        return FakeEntity(self.entity, f"v{self.version}")
+
+    def update_entity(self, entity, mode=None, etag=None, match_condition=None):
+        self.updates += 1
+        if self.concurrent_writes:
+            self.concurrent_writes.pop(0)(self)
+        if etag != f"v{self.version}":
+            raise ResourceModifiedError("412 Precondition Failed")
+        self.entity.update(entity)
+        self.version += 1
+
+
+def _add_document(document_id):
+    def write(table):
+        ids = json.loads(table.entity["document_ids"])
+        table.entity["document_ids"] = json.dumps(ids + [document_id])
+        table.version += 1
+    return write
+
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setattr(bot_model.random, "uniform", lambda low, high: 0)
+    model = BotModel.__new__(BotModel)
+    model.cache_ttl_seconds = 30
+    model._cache = {}
+    model._cache_lock = threading.Lock()
+    model.cache_stats = {"hits": 0, "revalidated": 0, "misses": 0}
+    model._document_listeners = []
+    return model
+
+
+def test_update_retries_after_a_conflicting_write(model):
+    table = FakeTableClient(["doc-1"])
+    table.concurrent_writes.append(_add_document("doc-other"))
+    model._table_client = table
+    changes = []
+    model.add_document_listener(lambda bot_id, old, new: changes.append((old, new)))
+
+    bot = model.add_documents_to_bot("bot-1", ["doc-new"])
+
+    # The retry re-read the list, so the concurrent addition is kept
+    assert bot["document_ids"] == ["doc-1", "doc-other", "doc-new"]
+    assert json.loads(table.entity["document_ids"]) == ["doc-1", "doc-other", "doc-new"]
+    assert table.updates == 2
+    assert changes == [(["doc-1", "doc-other"], ["doc-1", "doc-other", "doc-new"])]
+
+
+def test_update_gives_up_after_max_conflicts(model):
+    table = FakeTableClient(["doc-1"])
+    table.concurrent_writes.extend(_add_document(f"doc-{i}") for i in range(BotModel.MAX_CONFLICT_RETRIES))
+    model._table_client = table
+
+    with pytest.raises(ResourceModifiedError):
+        model.add_documents_to_bot("bot-1", ["doc-new"])
+    assert table.updates == BotModel.MAX_CONFLICT_RETRIES
+    assert "doc-new" not in json.loads(table.entity["document_ids"])
+
+
+def test_update_of_missing_bot_returns_none(model):
+    model._table_client = FakeTableClient([])
+    assert model.add_documents_to_bot("bot-2", ["doc-new"]) is None
@@ -0,0 +1,62 @@
+import pytest
+
+from bulk_ingestion import BulkIngestionPipeline
+from document_registry import DocumentRegistry
+
+
+class FakeRegistry(DocumentRegistry):
+    """Registry whose entry for a hash changes on each get_by_hash call."""
+    def __init__(self, claimed, later):
+        self.claimed = claimed
+        self.later = list(later)
+        self.claims = []
+
+    def claim(self, content_hash, document_id, metadata=None):
+        self.claims.append(document_id)
+        existing, self.claimed = self.claimed, None
+        return existing
+
+    def get_by_hash(self, content_hash):
+        return self.later.pop(0) if len(self.later) > 1 else self.later[0]
+
+    def mark_ready(self, content_hash, details=None):
+        pass
+
+    def release(self, content_hash):
+        pass
+
+
+def _pipeline(registry, **kwargs):
+    pipeline = BulkIngestionPipeline(None, None, None, None, registry=registry,
+                                     hash_func=lambda path: "a" * 64, claim_poll_seconds=0.01, **kwargs)
+    pipeline._batches["batch"] = {"files": {"doc.pdf": {"timings": {}}}}
+    return pipeline
+
+
+def _entry(status):
+    return {"document_id": "doc-1", "status": status}
+
+
+def test_claim_waits_for_processing_content():
+    registry = FakeRegistry(_entry("processing"), [_entry("processing"), _entry("ready")])
+    pipeline = _pipeline(registry)
+
+    assert pipeline._claim("batch", "doc.pdf") == ("doc-1", True)
+
+
+def test_claim_takes_over_released_content():
+    registry = FakeRegistry(_entry("processing"), [None])
+    pipeline = _pipeline(registry)
+
+    doc_id, duplicate = pipeline._claim("batch", "doc.pdf")
+
+    assert not duplicate
+    assert doc_id == registry.claims[-1] and len(registry.claims) == 2
+
+
+def test_claim_times_out_on_stuck_processing_content():
+    registry = FakeRegistry(_entry("processing"), [_entry("processing")])
+    pipeline = _pipeline(registry, claim_wait_seconds=0.05)
+
+    with pytest.raises(TimeoutError):
+        pipeline._claim("batch", "doc.pdf")
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import chatbot_core
+from answer_cache import AnswerCache
+from conversation_store import ConversationStore
+
+PREVIOUS = [{"chunk_id": "doc-1_0", "id": "doc-1", "highlights": ["Router warranty is two years."],
+             "score": 3.0, "fused_score": 0.03, "relevance": 1.0}]
+
+
+@pytest.fixture
+def session(monkeypatch):
+    store = ConversationStore(path="")
+    monkeypatch.setattr(chatbot_core, "conversation_store", store)
+    store.append_turn("s-1", "What is the router warranty?", "Two years.", passages=PREVIOUS,
+                      scope=chatbot_core.document_set_hash(None))
+    return "s-1"
+
+
+@pytest.mark.parametrize("query", ["Is there a refund policy?", "How do I reset it?",
+                                   "What is the warranty for this product?"])
+def test_inferred_follow_up_still_searches(session, monkeypatch, query):
+    searches = []
+
+    def search_documents(query_text, **kwargs):
+        searches.append(query_text)
+        return {"success": True, "results": [{"chunk_id": "doc-2_0", "id": "doc-2", "highlights": ["New"],
+                                              "score": 5.0}]}
+
+    monkeypatch.setattr(chatbot_core, "search_documents", search_documents)
+    history, reused, search_query, previous = chatbot_core.load_session_context(session, query, None)
+    results = chatbot_core.retrieve_for_turn(search_query, None, None, 8, reused, previous)
+
+    assert reused is None
+    assert len(history) == 2
+    assert searches == [search_query] and query in search_query
+    # New results come first; earlier passages are extra candidates without their fusion ranking
+    assert [result["chunk_id"] for result in results["results"]][0] == "doc-2_0"
+    carried = [result for result in results["results"] if result["chunk_id"] == "doc-1_0"]
+    assert all("fused_score" not in result for result in carried)
+
+
+def test_passages_are_only_reused_when_requested(session):
+    _, reused, _, previous = chatbot_core.load_session_context(session, "Tell me more", None, reuse_context=True)
+    assert reused["reused"] and reused["results"] == PREVIOUS and previous is None
+
+    _, reused, search_query, previous = chatbot_core.load_session_context(session, "Tell me more", None,
+                                                                          reuse_context=False)
+    assert reused is None and previous is None and search_query == "Tell me more"
+
+
+def test_unrelated_question_searches_alone(session):
+    _, reused, search_query, previous = chatbot_core.load_session_context(
+        session, "Which payment methods do you accept for annual subscriptions?", None)
+
+    assert reused is None and previous is None
+    assert search_query == "Which payment methods do you accept for annual subscriptions?"
+
+
+def test_merge_keeps_limit_and_drops_duplicates():
+    fresh = {"success": True, "results": [{"chunk_id": "doc-1_0", "score": 1.0}, {"chunk_id": "doc-3_0", "score": 0.5}]}
+
+    merged = chatbot_core.merge_session_passages(fresh, PREVIOUS + [{"chunk_id": "doc-4_0", "score": 2.0}], limit=3)
+
+    assert [result["chunk_id"] for result in merged["results"]] == ["doc-1_0", "doc-3_0", "doc-4_0"]
+    assert merged["count"] == 3
+
+
+class ThreadRecordingStore(ConversationStore):
+    """Store that records the threads its session reads and writes run on."""
+    def __init__(self):
+        super().__init__(path="")
+        self.threads = []
+
+    def get(self, session_id):
+        self.threads.append(threading.get_ident())
+        return super().get(session_id)
+
+    def append_turn(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+        return super().append_turn(*args, **kwargs)
+
+
+class FakeAsyncCompletionsClient:
+    async def complete(self, **kwargs):
+        message = SimpleNamespace(content="Two years.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def test_async_response_keeps_session_io_off_the_event_loop(monkeypatch):
+    store = ThreadRecordingStore()
+    monkeypatch.setattr(chatbot_core, "conversation_store", store)
+    monkeypatch.setattr(chatbot_core, "answer_cache", AnswerCache())
+
+    async def search_documents_async(query_text, **kwargs):
+        return {"success": True, "results": []}
+
+    monkeypatch.setattr(chatbot_core, "search_documents_async", search_documents_async)
+
+    async def chat():
+        loop_thread = threading.get_ident()
+        response = await chatbot_core.generate_rag_response_async(
+            "What is the warranty?", session_id="s-2", completion_client=FakeAsyncCompletionsClient())
+        return loop_thread, response
+
+    loop_thread, response = asyncio.run(chat())
+
+    assert response["answer"] == "Two years."
+    assert len(store.threads) == 2
+    assert loop_thread not in store.threads
+    assert len(store.get("s-2")["turns"]) == 2
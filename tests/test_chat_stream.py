@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import app as app_module
+import chatbot_core
+from answer_cache import AnswerCache
+from azure_clients import clients
+
+
+class FakeCompletionsClient:
+    """Streaming chat completions client that replays fixed content deltas."""
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.calls = []
+
+    def complete(self, **kwargs):
+        self.calls.append(kwargs)
+        # Like the SDK, the stream starts with an update without choices
+        yield SimpleNamespace(choices=[])
+        for content in self.deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    fake = FakeCompletionsClient(["Reset ", "the ", "router."])
+    clients.override("chat_completions", fake)
+    monkeypatch.setattr(chatbot_core, "answer_cache", AnswerCache())
+    monkeypatch.setattr(chatbot_core, "search_documents", lambda *args, **kwargs: {
+        "success": True,
+        "results": [{"highlights": ["Hold the reset button for ten seconds."], "file_name": "router.pdf",
+                     "page_numbers": [3], "score": 2.5}]
+    })
+    yield fake
+    clients.reset("chat_completions")
+
+
+def _events(response):
+    events = []
+    for frame in response.get_data(as_text=True).split("\n\n"):
+        if frame:
+            event_line, data_line = frame.split("\n")
+            data = json.loads(data_line[len("data: "):])
+            assert event_line == f"event: {data['type']}"
+            events.append(data)
+    return events
+
+
+def test_chat_stream_sends_sources_then_tokens_then_done(completions):
+    response = app_module.app.test_client().post('/chat/stream', json={'query': 'How do I reset the router?'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response)
+    assert [event["type"] for event in events] == ["sources", "token", "token", "token", "done"]
+    assert events[0]["sources"][0]["file_name"] == "router.pdf"
+    assert [event["content"] for event in events[1:4]] == ["Reset ", "the ", "router."]
+    assert events[-1]["answer"] == "Reset the router."
+    assert events[-1]["cached"] is False
+    assert completions.calls[0]["stream"] is True
+
+
+def test_chat_stream_replays_cached_answer_without_calling_the_model(completions):
+    client = app_module.app.test_client()
+    client.post('/chat/stream', json={'query': 'How do I reset the router?'}).get_data()
+
+    events = _events(client.post('/chat/stream', json={'query': 'How do I reset the router?'}))
+
+    assert [event["type"] for event in events] == ["sources", "token", "done"]
+    assert events[-1]["answer"] == "Reset the router."
+    assert events[-1]["cached"] is True
+    assert len(completions.calls) == 1
@@ -0,0 +1,82 @@
+from context_packer import pack_context
+from conversation_store import count_tokens
+
+
+def _result(text, score, **extra):
+    return dict({"highlights": [text], "score": score}, **extra)
+
+
+def test_min_score_cutoff_skips_weak_passages():
+    results = [
+        _result("alpha passage about invoices", 10.0),
+        _result("beta passage about payments", 8.0),
+        _result("gamma passage about holidays", 2.0),
+    ]
+
+    selected, stats = pack_context(results, max_tokens=1000, min_score_ratio=0.35, gap_ratio=0.1)
+
+    assert [result["score"] for result in selected] == [10.0, 8.0]
+    assert stats["below_floor"] == 1
+    assert stats["stopped_by"] == "min_score"
+
+
+def test_score_gap_cutoff_stops_at_a_relevance_drop():
+    results = [
+        _result("alpha passage about invoices", 10.0),
+        _result("beta passage about payments", 9.0),
+        _result("gamma passage about holidays", 4.0),
+    ]
+
+    selected, stats = pack_context(results, max_tokens=1000, min_score_ratio=0.1, gap_ratio=0.5)
+
+    assert len(selected) == 2
+    assert stats["stopped_by"] == "score_gap"
+
+
+def test_hybrid_results_rank_by_fused_score_and_cut_by_relevance():
+    results = [
+        _result("keyword match on invoices", 12.0, fused_score=0.02, relevance=1.0),
+        _result("vector match on payments", 0.8, fused_score=0.03, relevance=1.0),
+        _result("weak vector match on holidays", 0.1, fused_score=0.01, relevance=0.1),
+    ]
+
+    selected, stats = pack_context(results, max_tokens=1000, min_score_ratio=0.35, gap_ratio=0.1)
+
+    assert [result["text"] for result in selected] == ["vector match on payments", "keyword match on invoices"]
+    assert stats["below_floor"] == 1
+
+
+def test_budget_cutoff_keeps_whole_passages():
+    texts = ["first passage " * 10, "second passage " * 10, "third passage " * 10]
+    budget = count_tokens(texts[0]) + count_tokens(texts[1])
+
+    selected, stats = pack_context([_result(text, 10.0 - i) for i, text in enumerate(texts)],
+                                   max_tokens=budget, min_score_ratio=0.0)
+
+    assert [result["text"] for result in selected] == texts[:2]
+    assert stats["tokens"] == budget
+    assert stats["stopped_by"] == "budget"
+
+
+def test_best_passage_is_truncated_to_the_budget():
+    text = "a very long passage " * 100
+
+    selected, stats = pack_context([_result(text, 5.0)], max_tokens=20)
+
+    assert len(selected) == 1
+    assert selected[0]["tokens"] <= 20
+    assert text.startswith(selected[0]["text"])
+
+
+def test_near_duplicates_are_skipped():
+    base = "the refund policy allows returns within thirty days of purchase with a receipt"
+    results = [
+        _result(base, 10.0),
+        _result(base + " only", 9.5),
+        _result("shipping is free for orders above fifty euros", 9.0),
+    ]
+
+    selected, stats = pack_context(results, max_tokens=1000, min_score_ratio=0.0, duplicate_threshold=0.8)
+
+    assert [result["text"] for result in selected] == [base, results[2]["highlights"][0]]
+    assert stats["duplicates"] == 1
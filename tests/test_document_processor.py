@@ -0,0 +1,41 @@
+import pytest
+
+import document_processor
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    monkeypatch.setattr(document_processor, "extract_uploaded_document",
+                        lambda upload_result: {"success": True, "text": "text", "paragraphs": [], "page_count": 1})
+    monkeypatch.setattr(document_processor, "ensure_search_index_exists", lambda: {"success": True})
+    monkeypatch.setattr(document_processor, "build_search_passages",
+                        lambda doc_id, blob_info, text_content: [{"id": f"{doc_id}_0"}, {"id": f"{doc_id}_1"}])
+    return []
+
+
+def test_rejected_passages_fail_the_ingestion(stages, monkeypatch):
+    monkeypatch.setattr(document_processor, "index_passage_batch", lambda passages_by_document: {
+        "doc-1": {"indexed": False, "chunk_count": 2, "failed_keys": ["doc-1_1"]}
+    })
+
+    result = document_processor.process_uploaded_document(
+        {"document_id": "doc-1"}, on_stage=lambda stage, status: stages.append((stage, status)))
+
+    assert result["success"] is False
+    assert result["stage"] == "index"
+    assert result["failed_keys"] == ["doc-1_1"]
+    assert stages[-1] == ("index", "failed")
+
+
+def test_fully_indexed_document_reports_indexed(stages, monkeypatch):
+    monkeypatch.setattr(document_processor, "index_passage_batch", lambda passages_by_document: {
+        "doc-1": {"indexed": True, "chunk_count": 2, "failed_keys": []}
+    })
+    monkeypatch.setattr(document_processor, "get_shard_alias",
+                        lambda shard: type("Alias", (), {"resolve": lambda self: "documents"})())
+
+    result = document_processor.process_uploaded_document({"document_id": "doc-1"})
+
+    assert result["success"] is True
+    assert result["indexed"] is True and result["failed_keys"] == []
+    assert result["chunk_count"] == 2
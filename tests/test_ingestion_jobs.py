@@ -0,0 +1,50 @@
+import threading
+import time
+
+from ingestion_jobs import IngestionJobQueue, JobStore
+
+
+def _wait_for(get, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get(job_id)
+        if job and job["status"] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {status}: {get(job_id)}")
+
+
+def test_job_status_is_visible_to_another_worker(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    may_finish = threading.Event()
+
+    def process(source, on_stage=None):
+        on_stage("extract", "running")
+        may_finish.wait(5)
+        on_stage("extract", "completed")
+        return {"success": True, "document_id": source}
+
+    # Each queue stands for a worker process with its own store connection
+    accepting = IngestionJobQueue(process, max_workers=1, job_store=JobStore(path=path))
+    other_store = JobStore(path=path)
+    other = IngestionJobQueue(process, max_workers=1, job_store=other_store)
+
+    job = accepting.submit("doc-1", metadata={"file_name": "a.pdf"})
+    assert other.get_job(job["id"]) is None
+
+    running = _wait_for(other_store.get, job["id"], "running")
+    assert running["metadata"] == {"file_name": "a.pdf"}
+
+    may_finish.set()
+    finished = _wait_for(other_store.get, job["id"], "completed")
+    assert finished["result"]["document_id"] == "doc-1"
+    assert finished["stages"]["extract"]["status"] == "completed"
+    assert finished == accepting.get_job(job["id"])
+    accepting.shutdown()
+    other.shutdown()
+
+
+def test_job_store_without_path_keeps_nothing():
+    store = JobStore(path="")
+    store.save({"id": "job-1", "status": "queued"})
+    assert store.get("job-1") is None
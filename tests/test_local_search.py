@@ -0,0 +1,83 @@
+import pytest
+
+from local_search import LocalBM25Backend
+
+
+def _passage(key, content, parent_id="doc-1", bot_ids=None):
+    return {"id": key, "parent_id": parent_id, "heading": "", "content": content, "bot_ids": bot_ids or []}
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = LocalBM25Backend(path=str(tmp_path), index_name="documents")
+    backend.ensure_index()
+    return backend
+
+
+def test_bm25_ranks_rare_and_repeated_terms_higher(backend):
+    backend.upload_documents([
+        _passage("a", "invoice payment terms and invoice due dates"),
+        _passage("b", "payment terms for the contract"),
+        _passage("c", "holiday calendar for the office"),
+    ])
+
+    results = backend.search("invoice payment", top=5)
+
+    assert [result["id"] for result in results["results"]] == ["a", "b"]
+    assert results["total"] == 2
+    scores = [result["@search.score"] for result in results["results"]]
+    assert scores[0] > scores[1] > 0
+
+
+def test_bm25_prefers_shorter_documents_for_the_same_term_frequency(backend):
+    backend.upload_documents([
+        _passage("long", "refund " + " ".join(f"filler{i}" for i in range(40))),
+        _passage("short", "refund policy"),
+    ])
+
+    results = backend.search("refund", top=5)["results"]
+
+    assert [result["id"] for result in results] == ["short", "long"]
+
+
+def test_filters_by_parent_and_bot(backend):
+    backend.upload_documents([
+        _passage("a", "shared term", parent_id="doc-1", bot_ids=["bot-1"]),
+        _passage("b", "shared term", parent_id="doc-2", bot_ids=["bot-2"]),
+    ])
+
+    assert [r["id"] for r in backend.search("shared", parent_ids=["doc-2"])["results"]] == ["b"]
+    assert [r["id"] for r in backend.search("shared", bot_id="bot-1")["results"]] == ["a"]
+
+
+def test_instances_sharing_a_directory_see_each_others_writes(tmp_path):
+    writer = LocalBM25Backend(path=str(tmp_path), index_name="documents")
+    writer.ensure_index()
+    reader = LocalBM25Backend(path=str(tmp_path), index_name="documents")
+
+    writer.upload_documents([_passage("a", "quarterly report"), _passage("b", "annual report")])
+    assert sorted(r["id"] for r in reader.search("report")["results"]) == ["a", "b"]
+
+    # Both processes write; document numbers must stay consistent between them
+    reader.upload_documents([_passage("c", "monthly report")])
+    writer.delete_documents(["a"])
+
+    for backend in (writer, reader):
+        assert backend.count() == 2
+        assert sorted(r["id"] for r in backend.search("report")["results"]) == ["b", "c"]
+        assert backend.search("quarterly")["results"] == []
+
+
+def test_deletes_survive_a_merge_and_a_reload(tmp_path):
+    first = LocalBM25Backend(path=str(tmp_path), index_name="documents", merge_threshold=3)
+    first.ensure_index()
+    second = LocalBM25Backend(path=str(tmp_path), index_name="documents", merge_threshold=3)
+
+    first.upload_documents([_passage(f"p{i}", f"passage number {i} text") for i in range(5)])
+    second.delete_documents(["p1", "p3"])
+    first.upload_documents([_passage("p5", "passage number 5 text")])
+
+    reloaded = LocalBM25Backend(path=str(tmp_path), index_name="documents")
+    for backend in (first, second, reloaded):
+        ids = sorted(r["id"] for r in backend.search("passage", top=10)["results"])
+        assert ids == ["p0", "p2", "p4", "p5"]
@@ -0,0 +1,93 @@
+import io
+
+import pytest
+
+from streaming_form import StreamingMultipartForm, MalformedFormError
+
+
+class CountingStream(io.BytesIO):
+    """Body stream that records how many bytes were read from it."""
+    def __init__(self, data):
+        super().__init__(data)
+        self.consumed = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.consumed += len(data)
+        return data
+
+
+BOUNDARY = "test-boundary"
+
+
+def _encode(fields):
+    """Encode fields in the given order; (bytes, filename) tuples become file parts."""
+    body = b""
+    for name, value in fields.items():
+        if isinstance(value, tuple):
+            content, filename = value
+            disposition = f'form-data; name="{name}"; filename="{filename}"'
+            headers = f"Content-Disposition: {disposition}\r\nContent-Type: application/octet-stream\r\n"
+        else:
+            content = value.encode("utf-8")
+            headers = f'Content-Disposition: form-data; name="{name}"\r\n'
+        body += f"--{BOUNDARY}\r\n{headers}\r\n".encode("utf-8") + content + b"\r\n"
+    body += f"--{BOUNDARY}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def _form(fields, chunk_size=1024):
+    body, content_type = _encode(fields)
+    stream = CountingStream(body)
+    form = StreamingMultipartForm(stream, content_type, chunk_size=chunk_size)
+    return form, stream, body
+
+
+def test_reads_file_part_incrementally_with_fields_before_and_after():
+    content = bytes(range(256)) * 4000
+    form, stream, body = _form({
+        "idempotency_key": "key-1",
+        "file": (content, "report.pdf"),
+        "bot_id": "bot-7"
+    })
+
+    assert form.open_file("file")
+    assert form.filename == "report.pdf"
+    assert form.fields == {"idempotency_key": "key-1"}
+    assert stream.consumed < len(body) // 10
+
+    chunks = []
+    while True:
+        chunk = form.read(10000)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    assert b"".join(chunks) == content
+
+    assert form.finish() == {"idempotency_key": "key-1", "bot_id": "bot-7"}
+
+
+def test_finish_skips_unread_file_content():
+    form, _, _ = _form({"file": (b"x" * 50000, "a.txt"), "bot_id": "bot-1"})
+
+    assert form.open_file("file")
+    assert form.read(10) == b"x" * 10
+    assert form.finish() == {"bot_id": "bot-1"}
+
+
+def test_missing_file_part():
+    form, _, _ = _form({"bot_id": "bot-1"})
+
+    assert not form.open_file("file")
+    assert form.fields == {"bot_id": "bot-1"}
+
+
+def test_rejects_non_multipart_and_truncated_bodies():
+    with pytest.raises(MalformedFormError):
+        StreamingMultipartForm(io.BytesIO(b"{}"), "application/json")
+
+    body, content_type = _encode({"file": (b"x" * 5000, "a.txt")})
+    form = StreamingMultipartForm(io.BytesIO(body[:3000]), content_type)
+    assert form.open_file("file")
+    with pytest.raises(MalformedFormError):
+        form.read()
@@ -0,0 +1,32 @@
+from translation_core import SimpleTranslator
+
+
+class TrimmingTranslator(SimpleTranslator):
+    """Upper-cases each piece and trims it, as the translation service does."""
+    MAX_BATCH_CHARACTERS = 12
+
+    def __init__(self):
+        super().__init__(api_key="key")
+        self.sent = []
+
+    def _request_translations(self, texts, to_language, from_language=None):
+        self.sent.extend(texts)
+        return [text.strip().upper() for text in texts]
+
+
+def test_split_text_keeps_word_and_paragraph_breaks(monkeypatch):
+    monkeypatch.setenv("TRANSLATION_CACHE_ENABLED", "false")
+    translator = TrimmingTranslator()
+    text = "one two three four\n\nfive six. seven"
+
+    translated = translator.translate(text, "en")
+
+    assert len(translator.sent) > 1
+    assert translated == text.upper()
+
+
+def test_split_pieces_rejoin_to_the_original_text():
+    text = "alpha beta gamma. delta\nepsilon zeta eta theta"
+    pieces = SimpleTranslator._split_text(text, 10)
+    assert all(len(piece) <= 10 for piece in pieces)
+    assert "".join(pieces) == text
@@ -0,0 +1,201 @@
+import io
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from document_registry import DocumentRegistry
+from ingestion_jobs import IngestionJobQueue, JobStore
+
+
+@pytest.fixture
+def client(monkeypatch):
+    uploads = []
+    jobs = []
+
+    def upload_stream(stream, blob_name):
+        data = b""
+        while True:
+            chunk = stream.read(4096)
+            if not chunk:
+                break
+            data += chunk
+        uploads.append((type(stream), blob_name, data))
+        return {"success": True, "blob_name": blob_name, "content_hash": "0" * 64, "size": len(data)}
+
+    def submit(upload_result, **kwargs):
+        jobs.append((upload_result, kwargs))
+        return {"id": "job-1", "status": "queued"}
+
+    monkeypatch.setattr(app_module, "upload_stream", upload_stream)
+    monkeypatch.setattr(app_module.ingestion_queue, "submit", submit)
+    monkeypatch.setattr(app_module.ingestion_queue, "is_full", lambda: False)
+    client = app_module.app.test_client()
+    client.uploads = uploads
+    client.jobs = jobs
+    return client
+
+
+def test_upload_streams_file_part_and_reads_trailing_fields(client):
+    content = b"%PDF-1.4 " + b"a" * 200000
+    # The test client encodes form fields before files, so build the body by hand to send bot_id last
+    body = (b'--b\r\nContent-Disposition: form-data; name="file"; filename="report.pdf"\r\n'
+            b'Content-Type: application/pdf\r\n\r\n' + content + b'\r\n'
+            b'--b\r\nContent-Disposition: form-data; name="bot_id"\r\n\r\nbot-7\r\n--b--\r\n')
+    response = client.post('/upload', data=body, content_type='multipart/form-data; boundary=b')
+
+    assert response.status_code == 202
+    stream_type, blob_name, data = client.uploads[0]
+    assert stream_type is app_module.StreamingMultipartForm
+    assert blob_name.endswith('-report.pdf')
+    assert data == content
+    upload_result, kwargs = client.jobs[0]
+    assert upload_result['bot_ids'] == ['bot-7']
+    assert kwargs['metadata']['bot_id'] == 'bot-7'
+
+
+def test_upload_rejects_unsupported_type_before_reading_content(client):
+    response = client.post('/upload', data={'file': (io.BytesIO(b"x" * 1000), 'notes.exe')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert client.uploads == []
+
+
+def test_upload_keeps_global_limit(client):
+    size = app_module.app.config['MAX_CONTENT_LENGTH'] + 1024 * 1024
+    response = client.post('/upload', data={'file': (io.BytesIO(b"a" * size), 'large.txt')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert client.jobs == []
+
+
+@pytest.mark.parametrize('bot_documents', [['doc-1'], ['doc-2']])
+def test_declared_hash_only_skips_content_the_bot_already_has(client, monkeypatch, bot_documents):
+    class Registry:
+        def get_by_hash(self, content_hash):
+            return {'document_id': 'doc-1', 'status': 'ready'}
+
+        def claim(self, content_hash, document_id, metadata=None):
+            return None
+
+    class Bots:
+        def get_bot(self, bot_id):
+            return {'id': bot_id, 'document_ids': bot_documents}
+
+    monkeypatch.setattr(app_module, 'document_registry', Registry())
+    monkeypatch.setattr(app_module, 'bot_manager', Bots())
+    response = client.post('/upload', data={'bot_id': 'bot-7', 'file': (io.BytesIO(b"content"), 'a.txt')},
+                           content_type='multipart/form-data', headers={'X-Content-SHA256': 'f' * 64})
+
+    if bot_documents == ['doc-1']:
+        assert response.status_code == 200
+        assert response.get_json()['document_id'] == 'doc-1'
+        assert client.uploads == []
+    else:
+        # A hash the bot has no document for is not trusted: the content is uploaded and hashed
+        assert response.status_code == 202
+        assert client.uploads[0][2] == b"content"
+
+
+class FakeRegistry(DocumentRegistry):
+    """In-memory content claims, as DocumentRegistry keeps them in Table Storage."""
+    def __init__(self):
+        self.entries = {}
+
+    def claim(self, content_hash, document_id, metadata=None):
+        if content_hash in self.entries:
+            return dict(self.entries[content_hash])
+        self.entries[content_hash] = {'document_id': document_id, 'status': 'processing'}
+        return None
+
+    def get_by_hash(self, content_hash):
+        entry = self.entries.get(content_hash)
+        return dict(entry) if entry else None
+
+    def mark_ready(self, content_hash, details=None):
+        self.entries[content_hash]['status'] = 'ready'
+
+    def release(self, content_hash):
+        self.entries.pop(content_hash, None)
+
+
+@pytest.mark.parametrize('process_result, status', [
+    ({'success': True, 'indexed': True, 'failed_keys': []}, 'ready'),
+    ({'success': False, 'indexed': False, 'failed_keys': ['doc_1']}, None),
+])
+def test_claim_is_only_marked_ready_when_every_passage_was_indexed(client, monkeypatch, process_result, status):
+    registry = FakeRegistry()
+    monkeypatch.setattr(app_module, 'document_registry', registry)
+    client.post('/upload', data={'file': (io.BytesIO(b"content"), 'a.txt')}, content_type='multipart/form-data')
+
+    _, kwargs = client.jobs[0]
+    kwargs['cleanup'](process_result)
+
+    assert (registry.entries['0' * 64]['status'] if registry.entries else None) == status
+
+
+def _wait_for_job(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while queue.get_job(job_id)['status'] in ('queued', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return queue.get_job(job_id)
+
+
+def test_duplicate_of_processing_content_takes_over_when_first_ingestion_fails(client, monkeypatch):
+    first_may_finish = threading.Event()
+    processed = []
+
+    def process(upload_result, on_stage=None):
+        processed.append(upload_result['document_id'])
+        if len(processed) == 1:
+            first_may_finish.wait(5)
+            return {'success': False, 'error': 'extraction failed', 'stage': 'extract'}
+        return {'success': True, 'document_id': upload_result['document_id'], 'failed_keys': []}
+
+    associations = []
+    queue = IngestionJobQueue(process, max_workers=2)
+    registry = FakeRegistry()
+    monkeypatch.setattr(app_module, 'ingestion_queue', queue)
+    monkeypatch.setattr(app_module, 'process_uploaded_document', process)
+    monkeypatch.setattr(app_module, 'document_registry', registry)
+    monkeypatch.setattr(app_module, 'delete_blob', lambda blob_name: None)
+    monkeypatch.setattr(app_module, '_associate_with_bot',
+                        lambda bot_id, document_id: associations.append((bot_id, document_id)))
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_CLAIM_POLL_SECONDS', 0.01)
+
+    def post(bot_id):
+        return client.post('/upload', data={'bot_id': bot_id, 'file': (io.BytesIO(b"content"), 'a.txt')},
+                           content_type='multipart/form-data').get_json()
+
+    first = post('bot-1')
+    second = post('bot-2')
+
+    # The second bot is not attached while the first ingestion may still fail
+    assert second['deduplicated'] and second['document_id'] == first['document_id']
+    assert second['job_id'] != first['job_id']
+    assert associations == []
+
+    first_may_finish.set()
+    assert _wait_for_job(queue, first['job_id'])['status'] == 'failed'
+    assert _wait_for_job(queue, second['job_id'])['status'] == 'completed'
+
+    assert processed == [first['document_id'], first['document_id']]
+    assert associations == [('bot-2', first['document_id'])]
+    assert registry.entries['0' * 64] == {'document_id': first['document_id'], 'status': 'ready'}
+    queue.shutdown()
+
+
+def test_job_status_falls_back_to_the_shared_store(monkeypatch, tmp_path):
+    store = JobStore(path=str(tmp_path / "jobs.db"))
+    store.save({"id": "job-from-other-worker", "status": "running"})
+    monkeypatch.setattr(app_module, 'job_store', store)
+    client = app_module.app.test_client()
+
+    response = client.get('/jobs/job-from-other-worker')
+    assert response.status_code == 200
+    assert response.get_json()['job'] == {"id": "job-from-other-worker", "status": "running"}
+    assert client.get('/jobs/unknown').status_code == 404
@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    submitted = []
+
+    def submit(file_paths, bot_id=None, cleanup=None):
+        submitted.append(file_paths)
+        return {'id': 'batch-1', 'status': 'queued'}
+
+    monkeypatch.setattr(app_module.bulk_pipeline, 'submit', submit)
+    client = app_module.app.test_client()
+    client.submitted = submitted
+    return client
+
+
+def _body(size):
+    return io.BytesIO(b"a" * size)
+
+
+def test_bulk_upload_accepts_body_over_global_limit(client):
+    size = app_module.app.config['MAX_CONTENT_LENGTH'] + 1024 * 1024
+    response = client.post('/upload/bulk', data={'files': (_body(size), 'large.txt')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 202
+    assert len(client.submitted) == 1 and len(client.submitted[0]) == 1
+
+
+def test_bulk_upload_rejects_body_over_bulk_limit(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'BULK_MAX_CONTENT_LENGTH', 1024 * 1024)
+    response = client.post('/upload/bulk', data={'files': (_body(2 * 1024 * 1024), 'large.txt')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 413
+    assert client.submitted == []
+
@@ -0,0 +1,89 @@
+import io
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from vector_index import HashingEmbedder, VectorIndex, reciprocal_rank_fusion
+
+TEXTS = ["How do I reset the router?", "Billing questions and invoices", ""]
+
+
+def test_hashing_embedder_is_deterministic_across_processes():
+    vectors = HashingEmbedder(dim=64).embed(TEXTS)
+
+    # A different hash seed must not change the buckets
+    script = ("import sys, numpy as np; from vector_index import HashingEmbedder; "
+              f"np.save(sys.stdout.buffer, HashingEmbedder(dim=64).embed({TEXTS!r}))")
+    env = dict(os.environ, PYTHONHASHSEED="12345")
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    other = np.load(io.BytesIO(output))
+
+    assert vectors.dtype == np.float32 and vectors.shape == (3, 64)
+    assert np.array_equal(vectors, other)
+    assert np.allclose(np.linalg.norm(vectors[:2], axis=1), 1.0)
+    assert not vectors[2].any()
+
+
+def test_hashing_embedder_ranks_overlapping_text_higher():
+    query, close, far = HashingEmbedder().embed(["reset the router", "how to reset the router", "invoice totals"])
+
+    assert query @ close > query @ far
+
+
+def test_vector_index_search_filters_by_document(tmp_path):
+    index = VectorIndex(path=str(tmp_path), embedder=HashingEmbedder())
+    index.add_document("doc-1", ["Reset the router by holding the button.", "Router lights explained."])
+    index.add_document("doc-2", ["Reset your password from the login page."])
+
+    everything, = index.search(["reset the router"], top_k=3)
+    filtered, = index.search(["reset the router"], top_k=3, document_ids=["doc-2"])
+    reloaded, = VectorIndex(path=str(tmp_path), embedder=HashingEmbedder()).search(["reset the router"], top_k=3)
+
+    assert everything[0]["chunk_id"] == "doc-1_0"
+    assert [result["document_id"] for result in filtered] == ["doc-2"]
+    assert [result["chunk_id"] for result in reloaded] == [result["chunk_id"] for result in everything]
+
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]])
+
+    assert [item for item, _ in fused] == ["b", "a", "c"]
+
+
+def test_vector_index_instances_share_one_directory(tmp_path):
+    writer = VectorIndex(path=str(tmp_path), embedder=HashingEmbedder())
+    reader = VectorIndex(path=str(tmp_path), embedder=HashingEmbedder())
+    writer.add_document("doc-1", ["Reset the router by holding the button."])
+    reader.add_document("doc-2", ["Reset your password from the login page."])
+
+    # Neither writer overwrote the other's document, and both see both
+    for index in (writer, reader):
+        hits, = index.search(["reset"], top_k=5)
+        assert sorted(hit["document_id"] for hit in hits) == ["doc-1", "doc-2"]
+
+    assert reader.remove_document("doc-1")
+    hits, = writer.search(["reset the router"], top_k=5)
+    assert [hit["document_id"] for hit in hits] == ["doc-2"]
+
+
+def test_vector_index_replaces_and_merges_documents(tmp_path):
+    index = VectorIndex(path=str(tmp_path), embedder=HashingEmbedder(), merge_min_rows=4)
+    for version in range(5):
+        index.add_document("doc-1", [f"version {version} of the manual", "router lights"])
+    index.add_document("doc-2", [])
+
+    hits, = index.search(["version 4 manual"], top_k=10)
+    assert len(index) == 2
+    assert [hit["chunk_id"] for hit in hits] == ["doc-1_0", "doc-1_1"]
+    assert "version 4" in hits[0]["text"]
+
+    # Replacements were merged away instead of piling up in the added rows
+    assert index._base_rows + index._delta_rows < 10
+    reloaded = VectorIndex(path=str(tmp_path), embedder=HashingEmbedder())
+    assert [hit["chunk_id"] for hit in reloaded.search(["version 4 manual"], top_k=10)[0]] == ["doc-1_0", "doc-1_1"]
+
+    index.add_document("doc-1", [])
+    assert len(index) == 0 and index.search(["manual"])[0] == []
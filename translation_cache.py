@@ -0,0 +1,139 @@
+# translation_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(text, from_language, to_language):
+    """Build a cache key from whitespace-normalized text and the language pair."""
+    normalized = " ".join(text.split())
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"{from_language or 'auto'}:{to_language}:{digest}"
+
+
+class TranslationCache:
+    """
+    Two-tier translation cache: a bounded in-process LRU in front of a SQLite store.
+    
+    The SQLite file survives restarts and can be shared by several worker processes.
+    Entries expire after ttl_seconds; the store is trimmed to max_persistent_entries
+    by evicting the least recently used rows.
+    """
+    def __init__(self, path=None, max_memory_entries=None, max_persistent_entries=None, ttl_seconds=None):
+        self.path = path or os.environ.get("TRANSLATION_CACHE_PATH", "translation_cache.sqlite3")
+        self.max_memory_entries = max_memory_entries or int(os.environ.get("TRANSLATION_CACHE_MEMORY_ENTRIES", 2048))
+        self.max_persistent_entries = max_persistent_entries or int(os.environ.get("TRANSLATION_CACHE_MAX_ENTRIES", 100000))
+        self.ttl_seconds = ttl_seconds or int(os.environ.get("TRANSLATION_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+        
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._writes_since_trim = 0
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        
+        self._conn = None
+        if self.path:
+            try:
+                self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS translations ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS translations_accessed ON translations (accessed_at)")
+                logger.info(f"Translation cache store opened at {self.path}")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open translation cache store, using memory only: {str(e)}")
+                self._conn = None
+
+    def get(self, text, from_language, to_language):
+        """Return the cached translation or None."""
+        key = make_cache_key(text, from_language, to_language)
+        now = time.time()
+        
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at < self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+            
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, created_at FROM translations WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and now - row[1] < self.ttl_seconds:
+                        self._conn.execute("UPDATE translations SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, row[0], row[1])
+                        self.stats["persistent_hits"] += 1
+                        return row[0]
+                except sqlite3.Error as e:
+                    logger.warning(f"Translation cache read failed: {str(e)}")
+            
+            self.stats["misses"] += 1
+            return None
+
+    def set(self, text, from_language, to_language, value):
+        """Store a translation in both tiers."""
+        key = make_cache_key(text, from_language, to_language)
+        now = time.time()
+        
+        with self._lock:
+            self._remember(key, value, now)
+            self.stats["writes"] += 1
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 256:
+                    self._trim(now)
+            except sqlite3.Error as e:
+                logger.warning(f"Translation cache write failed: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM translations")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _trim(self, now):
+        """Drop expired rows and the least recently used rows above the size bound."""
+        self._writes_since_trim = 0
+        self._conn.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        excess = count - self.max_persistent_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM translations WHERE key IN "
+                "(SELECT key FROM translations ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+            self.stats["evictions"] += excess
@@ -1,15 +1,40 @@
 # simple_translator.py
 import os
 import json
+import time
+import random
+import asyncio
+import threading
 import requests
 import uuid
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from translation_cache import TranslationCache
 
 class SimpleTranslator:
     """Simple translator using Azure Translator API"""
     
-    def __init__(self, api_key=None, endpoint=None, location=None):
-        """Initialize with API key and endpoint"""
+    # Azure Translator v3 per-request limits
+    MAX_BATCH_ELEMENTS = 1000
+    MAX_BATCH_CHARACTERS = 50000
+    
+    # Status codes worth retrying
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, api_key=None, endpoint=None, location=None, cache=None,
+                 pool_size=None, connect_timeout=None, read_timeout=None, max_retries=None, backoff_factor=None):
+        """
+        Initialize with API key and endpoint.
+        
+        A TranslationCache is created unless one is passed in or
+        TRANSLATION_CACHE_ENABLED is set to 'false'.
+        
+        Requests go through one pooled keep-alive session. Pool size, timeouts and
+        retry behaviour default to the TRANSLATOR_POOL_SIZE, TRANSLATOR_CONNECT_TIMEOUT,
+        TRANSLATOR_READ_TIMEOUT, TRANSLATOR_MAX_RETRIES and TRANSLATOR_BACKOFF_FACTOR
+        environment variables.
+        """
         # Load environment variables
         load_dotenv()
         
@@ -26,6 +51,25 @@ class SimpleTranslator:
         # Check if API key is available
         if not self.api_key:
             print("Warning: Translator API key not provided. Set TRANSLATOR_API_KEY environment variable.")
+        
+        # Set up the pooled HTTP session
+        self.pool_size = pool_size or int(os.environ.get("TRANSLATOR_POOL_SIZE", 10))
+        self.timeout = (
+            connect_timeout or float(os.environ.get("TRANSLATOR_CONNECT_TIMEOUT", 3.05)),
+            read_timeout or float(os.environ.get("TRANSLATOR_READ_TIMEOUT", 10))
+        )
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("TRANSLATOR_MAX_RETRIES", 3))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.environ.get("TRANSLATOR_BACKOFF_FACTOR", 0.5))
+        self.session = self._build_session()
+        # aiohttp session for the async methods, created inside the event loop on first use
+        self._async_session = None
+        self._stats_lock = threading.Lock()
+        self.request_stats = {"requests": 0, "retries": 0, "failures": 0}
+        
+        # Set up the translation cache
+        if cache is None and os.environ.get("TRANSLATION_CACHE_ENABLED", "true").lower() != "false":
+            cache = TranslationCache()
+        self.cache = cache
     
     def translate(self, text, to_language, from_language=None):
         """
@@ -42,6 +86,159 @@ class SimpleTranslator:
         if not self.api_key or not text:
             return text
         
+        return self.translate_batch([text], to_language, from_language)[0]
+    
+    def translate_batch(self, texts, to_language, from_language=None):
+        """
+        Translate many texts with as few API requests as the service limits allow.
+        
+        Texts are packed into requests of at most MAX_BATCH_ELEMENTS elements and
+        MAX_BATCH_CHARACTERS characters. A text longer than the character limit is
+        split on whitespace, translated in pieces and joined back together.
+        
+        Args:
+            texts (list): Texts to translate
+            to_language (str): Target language code
+            from_language (str, optional): Source language code. If None, auto-detection is used.
+            
+        Returns:
+            list: Translations in the same order as texts; a text whose request
+            failed is returned unchanged
+        """
+        results, pending, segments = self._plan_batch(texts, to_language, from_language)
+        if not pending:
+            return results
+        
+        translated_pieces = {}
+        failed = set()
+        for batch in self._pack_batches(segments):
+            translations = self._request_translations([piece for _, piece in batch], to_language, from_language)
+            self._collect_translations(batch, translations, translated_pieces, failed)
+        
+        self._apply_batch(results, pending, translated_pieces, failed, to_language, from_language)
+        return results
+    
+    async def translate_batch_async(self, texts, to_language, from_language=None):
+        """Async translate_batch; the requests of all batches are sent concurrently."""
+        results, pending, segments = self._plan_batch(texts, to_language, from_language)
+        if not pending:
+            return results
+        
+        batches = list(self._pack_batches(segments))
+        responses = await asyncio.gather(*(
+            self._request_translations_async([piece for _, piece in batch], to_language, from_language)
+            for batch in batches
+        ))
+        translated_pieces = {}
+        failed = set()
+        for batch, translations in zip(batches, responses):
+            self._collect_translations(batch, translations, translated_pieces, failed)
+        
+        self._apply_batch(results, pending, translated_pieces, failed, to_language, from_language)
+        return results
+    
+    def _plan_batch(self, texts, to_language, from_language):
+        """
+        Resolve cache hits and split the remaining texts into request segments.
+        
+        Returns:
+            tuple: (results with cache hits filled in, text -> indexes still to
+                    translate, (text, piece) segments to send)
+        """
+        results = list(texts)
+        if not self.api_key:
+            return results, {}, []
+        
+        # Resolve cache hits and collapse duplicate texts to one lookup
+        pending = {}
+        for index, text in enumerate(texts):
+            if not text:
+                continue
+            if self.cache is not None:
+                cached = self.cache.get(text, from_language, to_language)
+                if cached is not None:
+                    results[index] = cached
+                    continue
+            pending.setdefault(text, []).append(index)
+        
+        # Split oversize texts into segments, remembering which text each belongs to
+        segments = []
+        for text in pending:
+            for piece in self._split_text(text, self.MAX_BATCH_CHARACTERS):
+                segments.append((text, piece))
+        return results, pending, segments
+    
+    @staticmethod
+    def _collect_translations(batch, translations, translated_pieces, failed):
+        for (text, piece), translation in zip(batch, translations or [None] * len(batch)):
+            if translation is None:
+                failed.add(text)
+            else:
+                # The service trims the whitespace a piece was cut after; put it back
+                # so the joined pieces keep their word and paragraph breaks
+                separator = piece[len(piece.rstrip()):]
+                translated_pieces.setdefault(text, []).append(translation.rstrip() + separator)
+    
+    def _apply_batch(self, results, pending, translated_pieces, failed, to_language, from_language):
+        """Fill in and cache the translations of every text whose requests succeeded."""
+        for text, indexes in pending.items():
+            if text in failed:
+                continue
+            translation = "".join(translated_pieces.get(text, []))
+            if self.cache is not None:
+                self.cache.set(text, from_language, to_language, translation)
+            for index in indexes:
+                results[index] = translation
+    
+    def _request_translations(self, texts, to_language, from_language=None):
+        """
+        Send one translate request for a list of texts.
+        
+        Returns:
+            list: Translations in order, or None if the request failed
+        """
+        url, params, headers, body = self._build_request(texts, to_language, from_language)
+        
+        try:
+            # Make API request
+            response = self._post_with_retry(url, params=params, headers=headers, json=body)
+            response.raise_for_status()
+            
+            # Parse response
+            result = response.json()
+            
+            if result and len(result) == len(texts):
+                return [item['translations'][0]['text'] for item in result]
+            else:
+                print(f"Translation error: expected {len(texts)} results, got {len(result) if result else 0}")
+                return None
+                
+        except Exception as e:
+            print(f"Translation error: {str(e)}")
+            return None
+    
+    async def _request_translations_async(self, texts, to_language, from_language=None):
+        """Async _request_translations through the shared aiohttp session."""
+        url, params, headers, body = self._build_request(texts, to_language, from_language)
+        
+        try:
+            status, result = await self._post_with_retry_async(url, params=params, headers=headers, json=body)
+            if status >= 400:
+                print(f"Translation error: request returned {status}")
+                return None
+            
+            if result and len(result) == len(texts):
+                return [item['translations'][0]['text'] for item in result]
+            else:
+                print(f"Translation error: expected {len(texts)} results, got {len(result) if result else 0}")
+                return None
+                
+        except Exception as e:
+            print(f"Translation error: {str(e)}")
+            return None
+    
+    def _build_request(self, texts, to_language, from_language=None):
+        """URL, query parameters, headers and body of a translate request."""
         # Construct request URL
         url = f"{self.endpoint}translate"
         
@@ -56,7 +253,7 @@ class SimpleTranslator:
             params['from'] = from_language
         
         # Prepare request body
-        body = [{'text': text}]
+        body = [{'text': text} for text in texts]
         
         # Set up headers with trace ID as in the reference script
         headers = {
@@ -65,24 +262,181 @@ class SimpleTranslator:
             'Content-type': 'application/json',
             'X-ClientTraceId': str(uuid.uuid4())
         }
-        
-        try:
-            # Make API request
-            response = requests.post(url, params=params, headers=headers, json=body)
-            response.raise_for_status()
+        return url, params, headers, body
+    
+    def _build_session(self):
+        """Create a keep-alive session whose connection pool is shared by all threads."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
+    def _post_with_retry(self, url, **kwargs):
+        """
+        POST through the pooled session, retrying connection errors and
+        429/5xx responses with exponential backoff. A Retry-After header on the
+        response takes precedence over the computed delay.
+        """
+        attempt = 0
+        while True:
+            with self._stats_lock:
+                self.request_stats["requests"] += 1
+            try:
+                response = self.session.post(url, timeout=self.timeout, **kwargs)
+                if response.status_code not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code >= 400:
+                        with self._stats_lock:
+                            self.request_stats["failures"] += 1
+                    return response
+                delay = self._retry_after_seconds(response)
+                if delay is None:
+                    delay = self._backoff_seconds(attempt)
+                print(f"Translation request returned {response.status_code}, retrying in {delay:.2f}s")
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    with self._stats_lock:
+                        self.request_stats["failures"] += 1
+                    raise
+                delay = self._backoff_seconds(attempt)
+                print(f"Translation request failed ({str(e)}), retrying in {delay:.2f}s")
             
-            # Parse response
-            result = response.json()
+            attempt += 1
+            with self._stats_lock:
+                self.request_stats["retries"] += 1
+            time.sleep(delay)
+    
+    async def _post_with_retry_async(self, url, **kwargs):
+        """
+        Async _post_with_retry through a pooled aiohttp session, with the same
+        retry and backoff rules.
+        
+        Returns:
+            tuple: (status code, parsed JSON body or None)
+        """
+        import aiohttp
+        
+        if self._async_session is None or self._async_session.closed:
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+            )
+        
+        attempt = 0
+        while True:
+            with self._stats_lock:
+                self.request_stats["requests"] += 1
+            try:
+                async with self._async_session.post(url, **kwargs) as response:
+                    if response.status not in self.RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        if response.status >= 400:
+                            with self._stats_lock:
+                                self.request_stats["failures"] += 1
+                            return response.status, None
+                        return response.status, await response.json()
+                    delay = self._retry_after_seconds(response)
+                    if delay is None:
+                        delay = self._backoff_seconds(attempt)
+                    print(f"Translation request returned {response.status}, retrying in {delay:.2f}s")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    with self._stats_lock:
+                        self.request_stats["failures"] += 1
+                    raise
+                delay = self._backoff_seconds(attempt)
+                print(f"Translation request failed ({str(e)}), retrying in {delay:.2f}s")
             
-            if result and len(result) > 0:
-                translation = result[0]['translations'][0]['text']
-                return translation
-            else:
-                return text
-                
-        except Exception as e:
-            print(f"Translation error: {str(e)}")
-            return text
+            attempt += 1
+            with self._stats_lock:
+                self.request_stats["retries"] += 1
+            await asyncio.sleep(delay)
+    
+    async def close_async(self):
+        """Close the aiohttp session of the async methods."""
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+    
+    def _backoff_seconds(self, attempt):
+        """Exponential backoff with jitter."""
+        return self.backoff_factor * (2 ** attempt) * (0.5 + random.random() / 2)
+    
+    @staticmethod
+    def _retry_after_seconds(response):
+        """Parse a Retry-After header given in seconds or as an HTTP date."""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    def get_connection_stats(self):
+        """
+        Return request/retry counters and connection reuse from the session's pools.
+        
+        connections_opened counts new TCP+TLS connections; every other request
+        reused a pooled keep-alive connection.
+        """
+        with self._stats_lock:
+            stats = dict(self.request_stats)
+        connections_opened = 0
+        pooled_requests = 0
+        adapter = self.session.get_adapter(self.endpoint or "https://")
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections_opened += pool.num_connections
+                pooled_requests += pool.num_requests
+        stats["pool_size"] = self.pool_size
+        stats["connections_opened"] = connections_opened
+        stats["connections_reused"] = max(0, pooled_requests - connections_opened)
+        return stats
+    
+    def _pack_batches(self, segments):
+        """Group (text, piece) segments into request-sized batches, preserving order."""
+        batch = []
+        batch_chars = 0
+        for segment in segments:
+            piece_chars = len(segment[1])
+            if batch and (len(batch) >= self.MAX_BATCH_ELEMENTS or batch_chars + piece_chars > self.MAX_BATCH_CHARACTERS):
+                yield batch
+                batch = []
+                batch_chars = 0
+            batch.append(segment)
+            batch_chars += piece_chars
+        if batch:
+            yield batch
+    
+    @staticmethod
+    def _split_text(text, max_chars):
+        """Split text into pieces of at most max_chars, preferring paragraph, sentence and word boundaries."""
+        pieces = []
+        while len(text) > max_chars:
+            window = text[:max_chars]
+            cut = -1
+            for separator in ("\n\n", "\n", ". ", " "):
+                position = window.rfind(separator)
+                if position > 0:
+                    cut = position + len(separator)
+                    break
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(text[:cut])
+            text = text[cut:]
+        pieces.append(text)
+        return pieces
+    
+    def get_cache_stats(self):
+        """Return translation cache hit/miss counters, or None if caching is disabled."""
+        return self.cache.get_stats() if self.cache is not None else None
             
     def translate_text(self, text, from_language=None, to_language=None):
         """
@@ -123,6 +477,34 @@ class SimpleTranslator:
                 'error': error_message,
                 'translated_text': text  # Return original text on error
             }
+    
+    async def translate_text_async(self, text, from_language=None, to_language=None):
+        """Async translate_text for the ASGI chat pipeline; same arguments and result."""
+        try:
+            if not text or not to_language:
+                return {
+                    'success': False,
+                    'error': 'Text and target language are required',
+                    'translated_text': text
+                }
+            
+            translated_text = (await self.translate_batch_async([text], to_language, from_language))[0]
+            
+            return {
+                'success': True,
+                'translated_text': translated_text,
+                'source_language': from_language or 'auto',
+                'target_language': to_language
+            }
+            
+        except Exception as e:
+            error_message = f"Translation error: {str(e)}"
+            print(error_message)
+            return {
+                'success': False,
+                'error': error_message,
+                'translated_text': text
+            }
 
 # Example phrases dictionary
 EXAMPLE_PHRASES = {
@@ -0,0 +1,496 @@
+# vector_index.py
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+import threading
+import contextlib
+
+import numpy as np
+
+from local_search import FileLock
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedding: hashed unigram and bigram counts, L2-normalized.
+    
+    It needs no service or model download, so ingestion and retrieval can run
+    offline and in tests. Paraphrase recall is far below a learned embedding.
+    """
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if (value >> 63) & 1 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = TOKEN_PATTERN.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                bucket, sign = self._bucket(feature)
+                vectors[row, bucket] += sign
+        return normalize_rows(vectors)
+
+
+class AzureEmbedder:
+    """Embeddings from an Azure AI Inference embeddings deployment."""
+    def __init__(self, endpoint, key, model=None, batch_size=16):
+        from azure.ai.inference import EmbeddingsClient
+        from azure.core.credentials import AzureKeyCredential
+        
+        self.client = EmbeddingsClient(endpoint=endpoint, credential=AzureKeyCredential(key))
+        self.model = model
+        self.batch_size = batch_size
+        self.dim = None
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embed(input=list(texts[start:start + self.batch_size]), model=self.model)
+            rows.extend(item.embedding for item in response.data)
+        vectors = np.asarray(rows, dtype=np.float32)
+        self.dim = vectors.shape[1] if len(rows) else self.dim
+        return normalize_rows(vectors)
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def get_embedder():
+    """
+    Build the embedder selected by EMBEDDING_PROVIDER: 'hashing' (default) or 'azure'
+    (AZURE_EMBEDDING_ENDPOINT, AZURE_EMBEDDING_KEY, AZURE_EMBEDDING_MODEL).
+    """
+    provider = os.environ.get("EMBEDDING_PROVIDER", "hashing").lower()
+    if provider == "azure":
+        return AzureEmbedder(
+            endpoint=os.environ.get("AZURE_EMBEDDING_ENDPOINT"),
+            key=os.environ.get("AZURE_EMBEDDING_KEY"),
+            model=os.environ.get("AZURE_EMBEDDING_MODEL")
+        )
+    return HashingEmbedder(dim=int(os.environ.get("EMBEDDING_DIM", 512)))
+
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+    Fuse several ranked lists of ids with reciprocal rank fusion.
+    
+    Returns:
+        list: (id, fused_score) pairs, best first
+    """
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, item_id in enumerate(ranked):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class VectorIndex:
+    """
+    In-process cosine-similarity index of paragraph chunks.
+    
+    An index directory holds a compacted base and the additions made since:
+    
+    - vectors.npy: float32 base vectors, memory-mapped on load
+    - metadata.json: chunk text and document metadata of the base rows
+    - delta.bin: float32 rows of chunks added since the last merge
+    - oplog.jsonl: document adds (chunks, metadata, row range in delta.bin) and
+      removals since the last merge, replayed on load
+    - generation: token that changes whenever the directory is rewritten
+    
+    Adding a document appends its rows and one log line, so ingestion cost does
+    not grow with the index. Rows of replaced or removed documents are masked
+    out, and dropped by a merge once the added rows outnumber the base rows or
+    dead rows outnumber live ones.
+    
+    Several processes may share an index directory, as with LocalBM25Backend:
+    writes and merges hold an exclusive lock on <path>.lock and first catch up
+    with the log, and each search checks the generation and log size, reloading
+    or replaying what other processes changed.
+    """
+    def __init__(self, path=None, embedder=None, merge_min_rows=None):
+        self.path = path or os.environ.get("VECTOR_INDEX_PATH", "vector_index")
+        self.embedder = embedder or get_embedder()
+        self.merge_min_rows = merge_min_rows or int(os.environ.get("VECTOR_INDEX_MERGE_MIN_ROWS", 10000))
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.path + ".lock")
+        self._reset_state()
+        with self._lock, self._file_lock.hold(shared=True):
+            self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @property
+    def vectors_path(self):
+        return self._file("vectors.npy")
+
+    @property
+    def metadata_path(self):
+        return self._file("metadata.json")
+
+    def __len__(self):
+        return self._live_rows
+
+    # -- storage -------------------------------------------------------------
+
+    def _reset_state(self):
+        self._dim = None
+        self._base = None               # memory-mapped base vectors
+        self._base_rows = 0
+        self._delta = np.zeros((0, 0), dtype=np.float32)  # delta.bin rows, with spare capacity
+        self._delta_rows = 0
+        self._chunks = []               # row -> chunk dict, None for unused rows
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_documents = np.zeros(0, dtype=np.int32)  # row -> document position
+        self._documents = {}            # document ID -> metadata
+        self._document_rows = {}        # document ID -> its rows
+        self._positions = {}            # document ID -> position, stable until reload
+        self._live_rows = 0
+        self._generation = None
+        self._log_offset = 0            # bytes of oplog.jsonl applied
+
+    def _read_generation(self):
+        try:
+            with open(self._file("generation"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _write_generation(self):
+        with open(self._file("generation.tmp"), "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(self._file("generation.tmp"), self._file("generation"))
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self._file("oplog.jsonl"))
+        except FileNotFoundError:
+            return 0
+
+    def _load(self):
+        """Load the index from disk; the caller holds the file lock."""
+        with self._lock:
+            self._reset_state()
+            if not os.path.isdir(self.path):
+                logger.info(f"Vector index at '{self.path}' is empty")
+                return
+            self._generation = self._read_generation()
+            
+            if os.path.exists(self.metadata_path):
+                with open(self.metadata_path, "r", encoding="utf-8") as f:
+                    metadata = json.load(f)
+                if metadata["chunks"]:
+                    self._base = np.load(self.vectors_path, mmap_mode="r")
+                    self._base_rows, self._dim = self._base.shape
+                self._dim = metadata.get("dim", self._dim)
+                self._reserve(self._base_rows)
+                for row, chunk in enumerate(metadata["chunks"]):
+                    self._add_row(row, chunk)
+                for document_id, document_metadata in metadata["documents"].items():
+                    self._documents[document_id] = document_metadata
+            
+            self._replay_log()
+            logger.info(f"Vector index loaded from '{self.path}': {self._live_rows} chunks, "
+                        f"{len(self._documents)} documents")
+
+    def _replay_log(self):
+        """Apply log entries written since _log_offset, by any process."""
+        if not os.path.exists(self._file("oplog.jsonl")):
+            return
+        with open(self._file("oplog.jsonl"), "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        # A line without its newline is still being written
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            op = json.loads(line)
+            if op["op"] == "add":
+                self._dim = self._dim or op["dim"]
+                vectors = np.fromfile(self._file("delta.bin"), dtype=np.float32, count=op["count"] * self._dim,
+                                      offset=op["start"] * self._dim * 4).reshape(op["count"], self._dim)
+                self._apply_add(op, vectors)
+            else:
+                self._apply_remove(op["document_id"])
+        self._log_offset += end
+
+    def _sync(self):
+        """Catch up with changes made by other processes; the caller holds the file lock."""
+        if self._read_generation() != self._generation or self._log_size() < self._log_offset:
+            self._load()
+        elif self._log_size() > self._log_offset:
+            self._replay_log()
+
+    def _refresh(self):
+        """Cheap check before a search; locks only when another process changed the index."""
+        if self._read_generation() == self._generation and self._log_size() == self._log_offset:
+            return
+        with self._file_lock.hold(shared=True):
+            self._sync()
+
+    @contextlib.contextmanager
+    def _writing(self):
+        """Exclusive access for a change, starting from the latest state on disk."""
+        with self._lock, self._file_lock.hold():
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path, exist_ok=True)
+                self._write_generation()
+            self._sync()
+            yield
+
+    def _append_log(self, ops):
+        with open(self._file("oplog.jsonl"), "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json.dumps(op) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_offset = self._log_size()
+
+    def _needs_merge(self):
+        dead_rows = self._base_rows + self._delta_rows - self._live_rows
+        return (self._delta_rows > max(self.merge_min_rows, self._base_rows)
+                or dead_rows > max(self.merge_min_rows, self._live_rows))
+
+    def merge(self):
+        """Write live rows into a new base and clear the added rows and the log."""
+        with self._writing():
+            rows = self._base_rows + self._delta_rows
+            live = np.flatnonzero(self._alive[:rows])
+            base_live = live[live < self._base_rows]
+            delta_live = live[live >= self._base_rows] - self._base_rows
+            parts = []
+            if len(base_live):
+                parts.append(np.asarray(self._base[base_live]))
+            if len(delta_live):
+                parts.append(self._delta[delta_live])
+            vectors = np.concatenate(parts) if parts else np.zeros((0, self._dim or 0), dtype=np.float32)
+            chunks = [self._chunks[row] for row in live]
+            
+            np.save(self._file("vectors.tmp.npy"), vectors.astype(np.float32, copy=False))
+            with open(self._file("metadata.json.tmp"), "w", encoding="utf-8") as f:
+                json.dump({"chunks": chunks, "documents": self._documents, "dim": self._dim}, f)
+            # Drop the old memory map before replacing the file under it
+            self._base = vectors = parts = None
+            os.replace(self._file("vectors.tmp.npy"), self.vectors_path)
+            os.replace(self._file("metadata.json.tmp"), self.metadata_path)
+            open(self._file("delta.bin"), "wb").close()
+            open(self._file("oplog.jsonl"), "w").close()
+            self._write_generation()
+            
+            self._load()
+            logger.info(f"Merged vector index '{self.path}': {len(chunks)} chunks, {len(self._documents)} documents")
+
+    # -- in-memory updates -----------------------------------------------------
+
+    def _reserve(self, rows):
+        if rows <= len(self._alive):
+            return
+        capacity = max(rows, 2 * len(self._alive), 1024)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        row_documents = np.zeros(capacity, dtype=np.int32)
+        row_documents[:len(self._row_documents)] = self._row_documents
+        self._alive, self._row_documents = alive, row_documents
+        self._chunks.extend([None] * (capacity - len(self._chunks)))
+
+    def _reserve_delta(self, rows):
+        if rows <= len(self._delta) and self._delta.shape[1] == self._dim:
+            return
+        delta = np.zeros((max(rows, 2 * len(self._delta), 1024), self._dim), dtype=np.float32)
+        if self._delta_rows:
+            delta[:self._delta_rows] = self._delta[:self._delta_rows]
+        self._delta = delta
+
+    def _position(self, document_id):
+        position = self._positions.get(document_id)
+        if position is None:
+            position = self._positions[document_id] = len(self._positions)
+        return position
+
+    def _add_row(self, row, chunk):
+        self._chunks[row] = chunk
+        self._alive[row] = True
+        self._row_documents[row] = self._position(chunk["document_id"])
+        self._document_rows.setdefault(chunk["document_id"], []).append(row)
+        self._live_rows += 1
+
+    def _apply_add(self, op, vectors):
+        self._apply_remove(op["document_id"])
+        end = op["start"] + op["count"]
+        self._reserve(self._base_rows + end)
+        self._reserve_delta(end)
+        self._delta[op["start"]:end] = vectors
+        self._delta_rows = max(self._delta_rows, end)
+        for offset, chunk in enumerate(op["chunks"]):
+            self._add_row(self._base_rows + op["start"] + offset, chunk)
+        self._documents[op["document_id"]] = op["metadata"]
+
+    def _apply_remove(self, document_id):
+        rows = self._document_rows.pop(document_id, [])
+        self._alive[rows] = False
+        self._live_rows -= len(rows)
+        return self._documents.pop(document_id, None) is not None
+
+    # -- documents -------------------------------------------------------------
+
+    def add_documents(self, documents):
+        """
+        Embed and add several documents, replacing any chunks they already had.
+        
+        Args:
+            documents: List of (document_id, chunks, metadata); chunks are texts, or
+                dicts with 'text' and optionally 'chunk_id' and 'page_numbers'.
+                A document without chunks is removed.
+            
+        Returns:
+            int: Chunks added
+        """
+        rows = []
+        for document_id, chunks, metadata in documents:
+            chunks = [chunk if isinstance(chunk, dict) else {"text": chunk} for chunk in chunks or []]
+            rows.append((document_id, [{
+                "chunk_id": chunk.get("chunk_id", f"{document_id}_{ordinal}"),
+                "document_id": document_id,
+                "ordinal": ordinal,
+                "page_numbers": chunk.get("page_numbers", []),
+                "text": chunk["text"]
+            } for ordinal, chunk in enumerate(chunks)], metadata or {}))
+        texts = [chunk["text"] for _, chunks, _ in rows for chunk in chunks]
+        vectors = self.embedder.embed(texts) if texts else None
+        
+        with self._writing():
+            if vectors is not None:
+                if self._dim is not None and vectors.shape[1] != self._dim:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self._dim})")
+                self._dim = vectors.shape[1]
+                with open(self._file("delta.bin"), "ab") as f:
+                    start = f.tell() // (4 * self._dim)
+                    f.write(vectors.astype(np.float32, copy=False).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            
+            ops = []
+            offset = 0
+            for document_id, chunks, metadata in rows:
+                if chunks:
+                    ops.append({"op": "add", "document_id": document_id, "metadata": metadata, "chunks": chunks,
+                                "start": start + offset, "count": len(chunks), "dim": self._dim})
+                    offset += len(chunks)
+                elif document_id in self._documents:
+                    ops.append({"op": "remove", "document_id": document_id})
+            if not ops:
+                return 0
+            self._append_log(ops)
+            offset = 0
+            for op in ops:
+                if op["op"] == "add":
+                    self._apply_add(op, vectors[offset:offset + op["count"]])
+                    offset += op["count"]
+                else:
+                    self._apply_remove(op["document_id"])
+            if self._needs_merge():
+                self.merge()
+        logger.info(f"Added {len(texts)} chunks of {len(rows)} documents to vector index")
+        return len(texts)
+
+    def add_document(self, document_id, chunks, metadata=None):
+        """Embed and add a document's chunks, replacing any chunks it already had."""
+        return self.add_documents([(document_id, chunks, metadata)])
+
+    def remove_document(self, document_id):
+        with self._writing():
+            if document_id not in self._documents:
+                return False
+            op = {"op": "remove", "document_id": document_id}
+            self._append_log([op])
+            self._apply_remove(document_id)
+            if self._needs_merge():
+                self.merge()
+        logger.info(f"Removed document {document_id} from vector index")
+        return True
+
+    def get_document_metadata(self, document_id):
+        return self._documents.get(document_id, {})
+
+    def search(self, queries, top_k=5, document_ids=None):
+        """
+        Batched top-k cosine search.
+        
+        Args:
+            queries: List of query strings
+            top_k: Results per query
+            document_ids: Optional list of document IDs to restrict results to
+            
+        Returns:
+            list: For each query, a list of dicts with chunk_id, document_id, text,
+            page_numbers and score, best first
+        """
+        if not queries:
+            return []
+        query_vectors = self.embedder.embed(list(queries))
+        
+        with self._lock:
+            self._refresh()
+            if not self._live_rows:
+                return [[] for _ in queries]
+            
+            rows = self._base_rows + self._delta_rows
+            mask = self._alive[:rows].copy()
+            if document_ids is not None:
+                allowed = [self._positions[doc_id] for doc_id in set(document_ids) if doc_id in self._positions]
+                mask &= np.isin(self._row_documents[:rows], allowed)
+            
+            parts = []
+            if self._base_rows:
+                parts.append(query_vectors @ np.asarray(self._base).T)
+            if self._delta_rows:
+                parts.append(query_vectors @ self._delta[:self._delta_rows].T)
+            scores = np.concatenate(parts, axis=1) if len(parts) > 1 else parts[0]
+            scores[:, ~mask] = -np.inf
+            
+            k = min(top_k, rows)
+            results = []
+            for row in scores:
+                top = np.argpartition(-row, k - 1)[:k]
+                top = top[np.argsort(-row[top])]
+                results.append([
+                    {
+                        "chunk_id": self._chunks[i]["chunk_id"],
+                        "document_id": self._chunks[i]["document_id"],
+                        "text": self._chunks[i]["text"],
+                        "page_numbers": self._chunks[i].get("page_numbers", []),
+                        "score": float(row[i])
+                    }
+                    for i in top if np.isfinite(row[i])
+                ])
+            return results
+
+
+_vector_index = None
+_vector_index_lock = threading.Lock()
+
+
+def get_vector_index():
+    """Return the process-wide vector index, loading it on first use."""
+    global _vector_index
+    if _vector_index is None:
+        with _vector_index_lock:
+            if _vector_index is None:
+                _vector_index = VectorIndex()
+    return _vector_index